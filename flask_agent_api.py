@@ -6,10 +6,11 @@ print("sys.path:", sys.path)  # For debugging
 
 import asyncio
 import logging
-import random
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
 from src.utils import utils
+from src.utils.key_scheduler import is_rate_limit_error
+from src.utils.llm_circuit_breaker import circuit_breakers
 from src.agent.custom_agent import CustomAgent
 from src.controller.custom_controller import CustomController
 from src.agent.custom_prompts import CustomSystemPrompt, CustomAgentMessagePrompt
@@ -24,27 +25,28 @@ load_dotenv()
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
-def get_api_key():
-    keys = os.getenv("GOOGLE_API_KEYS", "").split(",")
-    return random.choice(keys).strip() if keys and keys[0] else os.getenv("GOOGLE_API_KEY", "")
+@app.route('/api/llm/circuit-breakers', methods=['GET'])
+def handle_circuit_breakers():
+    return jsonify({'status': 'success', 'circuit_breakers': circuit_breakers.snapshot()})
 
 @app.route('/api/agent', methods=['POST'])
 def handle_agent():
     data = request.get_json()
-    if not data or 'task' not in data:
+    if not data or ('task' not in data and 'run_id' not in data):
         return jsonify({'error': 'Missing required field: task'}), 400
 
-    task = data['task']
+    task = data.get('task')
+    # continue a checkpointed run instead of starting a new one
+    run_id = data.get('run_id')
     max_steps = data.get('max_steps', 10)
     use_own_browser = data.get('use_own_browser', False)
 
     try:
-        # Initialize the LLM model (example using Google Gemini)
-        llm = utils.get_llm_model(
+        # Initialize the LLM model (example using Google Gemini); each call takes the least-loaded API key
+        llm = utils.get_scheduled_llm_model(
             provider="google",
             model_name="gemini-2.0-flash-exp",
             temperature=1.0,
-            api_key=get_api_key()
         )
 
         # Set up controller and agent state
@@ -80,16 +82,25 @@ def handle_agent():
             ))
 
         # Instantiate and run the CustomAgent
-        agent = CustomAgent(
-            task=task,
+        agent_kwargs = dict(
             llm=llm,
             browser=browser,
             browser_context=browser_context,
             controller=controller,
             system_prompt_class=CustomSystemPrompt,
             agent_prompt_class=CustomAgentMessagePrompt,
-            agent_state=agent_state
+            agent_state=agent_state,
+            small_llm=utils.get_small_llm_model(),
+            prompt_cache=os.getenv("AGENT_PROMPT_CACHE", "false").lower() == "true",
+            dom_diff=os.getenv("AGENT_DOM_DIFF", "false").lower() == "true",
+            vision_pipeline=os.getenv("AGENT_VISION_PIPELINE", "false").lower() == "true",
+            vision_mode=os.getenv("AGENT_VISION_MODE", "always"),
+            checkpoint=os.getenv("AGENT_CHECKPOINT", "false").lower() == "true",
         )
+        if run_id:
+            agent = CustomAgent.resume(run_id, **agent_kwargs)
+        else:
+            agent = CustomAgent(task=task, **agent_kwargs)
 
         result = asyncio.run(agent.run(max_steps=max_steps))
         final_report = result.final_result()
@@ -100,10 +111,12 @@ def handle_agent():
         if browser:
             asyncio.run(browser.close())
 
-        return jsonify({'status': 'success', 'report': final_report})
+        return jsonify({'status': 'success', 'run_id': agent.agent_id, 'report': final_report})
     
     except Exception as e:
         logging.error(f"Error processing agent: {str(e)}")
+        if is_rate_limit_error(e):
+            return jsonify({'status': 'error', 'message': 'API rate limit exceeded. Please wait and try again later.'}), 429
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 if __name__ == '__main__':
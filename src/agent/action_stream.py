@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from json_repair import repair_json
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamEvent:
+    """A fully-formed piece of the agent response, surfaced while the model is still writing."""
+    kind: str  # "current_state" or "action"
+    data: Dict[str, Any]
+    index: Optional[int] = None
+
+
+class IncrementalAgentOutputParser:
+    """
+    Incremental scanner for the `{"current_state": {...}, "action": [{...}, ...]}` agent response.
+
+    Text is fed chunk by chunk; every time the `current_state` object or one element of the
+    `action` array closes, the slice is decoded and returned as a StreamEvent. Anything before
+    the first top-level `{` (code fences, preambles) is ignored. The scanner only tracks string,
+    escape and bracket state, so each character is visited once.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expecting_key = False
+        self._current_key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._action_start: Optional[int] = None
+        self.action_count = 0
+        self.state_emitted = False
+        self.done = False
+
+    def feed(self, text: str) -> List[StreamEvent]:
+        self.buffer += text
+        events: List[StreamEvent] = []
+        buffer = self.buffer
+        while self._pos < len(buffer) and not self.done:
+            char = buffer[self._pos]
+            depth = len(self._stack)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if depth == 1 and self._expecting_key:
+                        self._current_key = buffer[self._string_start + 1:self._pos]
+            elif char == '"':
+                if depth > 0:
+                    self._in_string = True
+                    self._string_start = self._pos
+            elif char in "{[":
+                if depth == 0 and char != "{":
+                    pass  # stray bracket before the response object
+                else:
+                    self._stack.append(char)
+                    if depth == 0:
+                        self._expecting_key = True
+                    elif depth == 1:
+                        self._value_start = self._pos
+                    elif depth == 2 and self._current_key == "action" and self._stack[1] == "[":
+                        self._action_start = self._pos
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                    depth = len(self._stack)
+                    if depth == 0:
+                        self.done = True
+                    elif depth == 1 and self._value_start is not None:
+                        if self._current_key == "current_state" and not self.state_emitted:
+                            data = self._decode(buffer[self._value_start:self._pos + 1])
+                            if isinstance(data, dict):
+                                self.state_emitted = True
+                                events.append(StreamEvent(kind="current_state", data=data))
+                        self._value_start = None
+                    elif depth == 2 and self._action_start is not None:
+                        data = self._decode(buffer[self._action_start:self._pos + 1])
+                        if isinstance(data, dict):
+                            events.append(StreamEvent(kind="action", data=data, index=self.action_count))
+                            self.action_count += 1
+                        self._action_start = None
+            elif depth == 1:
+                if char == ",":
+                    self._expecting_key = True
+                elif char == ":":
+                    self._expecting_key = False
+            self._pos += 1
+        return events
+
+    @staticmethod
+    def _decode(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                return json.loads(repair_json(text))
+            except (json.JSONDecodeError, TypeError, ValueError):
+                logger.debug(f"Could not decode streamed fragment: {text[:200]}")
+                return None
+
+
+def chunk_text(chunk: Any) -> str:
+    """
+    Text of a streamed message chunk; list contents (e.g. Anthropic) are flattened and
+    tool-call responses stream their argument JSON.
+    """
+    tool_call_chunks = getattr(chunk, "tool_call_chunks", None)
+    if tool_call_chunks:
+        return "".join(tool_call_chunk.get("args") or "" for tool_call_chunk in tool_call_chunks)
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, str):
+                parts.append(part)
+            elif isinstance(part, dict) and part.get("type") == "text":
+                parts.append(part.get("text", ""))
+        return "".join(parts)
+    return ""
+
+
+class EarlyActionDispatcher:
+    """
+    Executes streamed actions in order while the rest of the response is still being generated.
+
+    Mirrors `Controller.multi_act`: highlights are removed once, indexed actions after the first stop
+    the pipeline when new elements appear, and execution stops after a done action or an error.
+    `finish` reconciles the executed prefix with the final validated actions and `run_remaining`
+    continues with the rest of them; `abort` lets the running action complete and drops everything
+    still queued. `closed` is set only once the pipeline has drained cleanly, so after a failure the
+    caller still aborts and collects the results of the actions that ran.
+    """
+
+    def __init__(
+            self,
+            controller: Any,
+            browser_context: Any,
+            max_actions: int,
+            check_for_new_elements: bool = True,
+    ):
+        self.controller = controller
+        self.browser_context = browser_context
+        self.max_actions = max_actions
+        self.check_for_new_elements = check_for_new_elements
+        self.dispatched: List[Any] = []
+        self.results: List[Any] = []
+        self.mismatch_index: Optional[int] = None
+        self.new_elements = False
+        self.closed = False
+        self._stopped = False
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._cached_path_hashes: set = set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, action: Any) -> None:
+        if self._stopped or self.closed or len(self.dispatched) >= self.max_actions:
+            return
+        self.dispatched.append(action)
+        self._queue.put_nowait(action)
+
+    async def _run(self) -> None:
+        session = await self.browser_context.get_session()
+        self._cached_path_hashes = set(e.hash.branch_path_hash for e in session.cached_state.selector_map.values())
+        await self.browser_context.remove_highlights()
+        while True:
+            action = await self._queue.get()
+            if action is None or self._stopped:
+                break
+            if not await self._execute(action):
+                break
+        self._stopped = True
+
+    async def _execute(self, action: Any) -> bool:
+        """Run one action; False when the pipeline has to stop after it (or instead of it)."""
+        executed = len(self.results)
+        if executed > 0:
+            await asyncio.sleep(self.browser_context.config.wait_between_actions)
+            if action.get_index() is not None:
+                new_state = await self.browser_context.get_state()
+                new_path_hashes = set(e.hash.branch_path_hash for e in new_state.selector_map.values())
+                if self.check_for_new_elements and not new_path_hashes.issubset(self._cached_path_hashes):
+                    logger.info(f"Something new appeared after action {executed} / {len(self.dispatched)}")
+                    self.new_elements = True
+                    return False
+        result = await self.controller.act(action, self.browser_context)
+        self.results.append(result)
+        logger.debug(f"Executed streamed action {executed + 1}")
+        return not (result.is_done or result.error)
+
+    @property
+    def halted(self) -> bool:
+        """Whether execution stopped on its own: new elements, a done action or an error."""
+        return self.new_elements or bool(self.results and (self.results[-1].is_done or self.results[-1].error))
+
+    async def run_remaining(self, actions: List[Any]) -> List[Any]:
+        """After `finish`, run final actions the stream got wrong, with the same checks as streamed ones."""
+        # `dispatched` lines up with `results` again: the streamed actions that did not run are replaced
+        del self.dispatched[len(self.results):]
+        for action in actions:
+            self.dispatched.append(action)
+            if not await self._execute(action):
+                break
+        del self.dispatched[len(self.results):]
+        return self.results
+
+    async def finish(self, final_actions: List[Any]) -> List[Any]:
+        """Queue any actions the stream did not surface, then wait for the pipeline to drain."""
+        for i, action in enumerate(final_actions[:self.max_actions]):
+            if i < len(self.dispatched):
+                if self.dispatched[i].model_dump(exclude_unset=True) != action.model_dump(exclude_unset=True):
+                    logger.warning(f"Streamed action {i + 1} differs from the final response, stopping early dispatch")
+                    self.mismatch_index = i
+                    self._stopped = True
+                    break
+            else:
+                self.submit(action)
+        self._queue.put_nowait(None)
+        await self._task
+        self.closed = True
+        return self.results
+
+    async def abort(self) -> List[Any]:
+        """Stop dispatching; the action already running is allowed to complete."""
+        self._stopped = True
+        self.closed = True
+        self._queue.put_nowait(None)
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception as e:
+                logger.debug(f"Early dispatch failed during abort: {e}")
+        return self.results
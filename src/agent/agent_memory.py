@@ -0,0 +1,202 @@
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage
+
+from src.utils.token_counter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+SUMMARIZERS = ("extractive", "llm")
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_URL = re.compile(r"https?://\S+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the word sets; 1.0 for the same words in any order."""
+    words_a, words_b = _words(a), _words(b)
+    if not words_a or not words_b:
+        return 1.0 if words_a == words_b else 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+def near_duplicate(text: str, kept: str, threshold: float) -> bool:
+    """Same wording and no number that `kept` lacks: "page 3" and "page 4" are different findings."""
+    if text in kept:
+        return True
+    numbers = set(_NUMBER.findall(text))
+    return numbers <= set(_NUMBER.findall(kept)) and similarity(text, kept) >= threshold
+
+
+def _fact_score(sentence: str) -> int:
+    """Rough value of a sentence for the digest: numbers, links and names are what later steps need."""
+    score = 0
+    if any(char.isdigit() for char in sentence):
+        score += 2
+    if _URL.search(sentence):
+        score += 2
+    if re.search(r"\s[A-Z][a-z]+", sentence):
+        score += 1
+    return score
+
+
+class MemoryStore:
+    """
+    The agent's step memory within a token budget: a window of the `recent` latest entries plus a
+    digest of the older ones. Entries too similar to one already kept are dropped. When the memory
+    exceeds `budget_tokens`, entries leaving the window are folded into the digest, which is then
+    cut down extractively (fact-bearing sentences first) or, with the "llm" summarizer, condensed by
+    the model on the next `summarize` call. `archive` keeps every accepted entry for the final result.
+    """
+
+    def __init__(
+            self,
+            token_counter: TokenCounter,
+            budget_tokens: Optional[int] = None,
+            recent: Optional[int] = None,
+            summarizer: Optional[str] = None,
+            dedup_threshold: float = 0.85,
+    ):
+        self.token_counter = token_counter
+        self.budget_tokens = budget_tokens if budget_tokens is not None else int(
+            os.getenv("AGENT_MEMORY_TOKENS", "1500"))
+        self.recent = recent if recent is not None else int(os.getenv("AGENT_MEMORY_RECENT", "8"))
+        self.summarizer = (summarizer or os.getenv("AGENT_MEMORY_SUMMARIZER", "extractive")).lower()
+        if self.summarizer not in SUMMARIZERS:
+            raise ValueError(f"Unsupported memory summarizer: {self.summarizer}")
+        self.dedup_threshold = dedup_threshold
+        self.entries: List[str] = []
+        self.digest: List[str] = []
+        self.archive: List[str] = []
+        self.duplicates = 0
+        self.compactions = 0
+        self.summaries = 0
+        self._needs_summary = False
+        # the last model summary and the entries folded into the digest since
+        self._summary = ""
+        self._folded: List[str] = []
+
+    def add(self, text: str) -> bool:
+        """Keep a new entry unless it repeats one already in memory; returns whether it was kept."""
+        text = text.strip()
+        if not text:
+            return False
+        for kept in self.entries + self.digest:
+            if near_duplicate(text, kept, self.dedup_threshold):
+                self.duplicates += 1
+                return False
+        self.entries.append(text)
+        self.archive.append(text)
+        self._compact()
+        return True
+
+    def tokens(self) -> int:
+        return self.token_counter.count_text(self.render())
+
+    def render(self) -> str:
+        if not self.digest:
+            return "".join(f"{entry}\n" for entry in self.entries)
+        digest = " ".join(self.digest)
+        recent = "".join(f"{entry}\n" for entry in self.entries)
+        return f"Digest of earlier steps: {digest}\n{recent}"
+
+    def full_text(self) -> str:
+        return "".join(f"{entry}\n" for entry in self.archive)
+
+    def _digest_budget(self) -> int:
+        recent_tokens = self.token_counter.count_text("".join(f"{entry}\n" for entry in self.entries))
+        return max(0, self.budget_tokens - recent_tokens)
+
+    def _compact(self) -> None:
+        if len(self.entries) <= self.recent and self.tokens() <= self.budget_tokens:
+            return
+        self.compactions += 1
+        # fold the entries beyond the window into the digest, keeping at least the newest one in the window
+        while len(self.entries) > 1 and (len(self.entries) > self.recent or self.tokens() > self.budget_tokens):
+            entry = self.entries.pop(0)
+            self._folded.append(entry)
+            for sentence in _SENTENCE_END.split(entry):
+                sentence = sentence.strip()
+                if sentence and not any(near_duplicate(sentence, kept, self.dedup_threshold) for kept in self.digest):
+                    self.digest.append(sentence)
+        if self.token_counter.count_text(" ".join(self.digest)) > self._digest_budget():
+            if self.summarizer == "llm":
+                # condensed by the model on the next summarize() call; keep it bounded meanwhile
+                self._needs_summary = True
+            self._trim_digest()
+
+    def _trim_digest(self) -> None:
+        """Drop the least fact-bearing, oldest digest sentences until the digest fits its budget."""
+        budget = self._digest_budget()
+        while self.digest and self.token_counter.count_text(" ".join(self.digest)) > budget:
+            lowest = min(range(len(self.digest)), key=lambda i: (_fact_score(self.digest[i]), i))
+            self.digest.pop(lowest)
+
+    @property
+    def needs_summary(self) -> bool:
+        return self._needs_summary
+
+    async def summarize(self, llm: BaseChatModel) -> None:
+        """Condense the digest with `llm` (the "llm" summarizer); the extractive digest stays on failure."""
+        self._needs_summary = False
+        if not self.digest:
+            return
+        budget = max(1, self._digest_budget())
+        prompt = (
+            f"Condense these notes from a browser agent's earlier steps into at most {budget} tokens. "
+            "Keep every concrete fact such as names, numbers and URLs, drop repetition, and answer with "
+            "the condensed notes only.\n\n" + "\n".join(([self._summary] if self._summary else []) + self._folded)
+        )
+        try:
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            logger.warning(f"Memory summarization failed, keeping the extractive digest: {e}")
+            return
+        summary = response.content if isinstance(response.content, str) else str(response.content)
+        summary = summary.strip()
+        if summary:
+            self._summary = summary
+            self._folded = []
+            self.digest = [summary]
+            self._trim_digest()
+            self.summaries += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "entries": self.entries,
+            "digest": self.digest,
+            "archive": self.archive,
+            "summary": self._summary,
+            "folded": self._folded,
+            "needs_summary": self._needs_summary,
+        }
+
+    def restore(self, data: Dict[str, Any]) -> None:
+        """Continue from a to_dict() checkpoint."""
+        self.entries = list(data["entries"])
+        self.digest = list(data["digest"])
+        self.archive = list(data["archive"])
+        self._summary = data["summary"]
+        self._folded = list(data["folded"])
+        self._needs_summary = data["needs_summary"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens(),
+            "recent_entries": len(self.entries),
+            "digest_sentences": len(self.digest),
+            "archived_entries": len(self.archive),
+            "duplicates": self.duplicates,
+            "compactions": self.compactions,
+            "summaries": self.summaries,
+        }
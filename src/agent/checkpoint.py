@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from browser_use.browser.context import BrowserContext
+
+from src.utils.content_accumulator import run_dir
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+# Puts checkpointed localStorage items back before the page's own scripts run; items the page set
+# since are left alone
+RESTORE_LOCAL_STORAGE_JS = """
+(origins => {
+    const items = origins[window.location.origin];
+    if (!items) return;
+    for (const [name, value] of Object.entries(items)) {
+        if (window.localStorage.getItem(name) === null) window.localStorage.setItem(name, value);
+    }
+})(%s)
+"""
+
+
+def checkpoint_path(run_id: str) -> str:
+    return os.path.join(run_dir(run_id), "checkpoint.json")
+
+
+def write_checkpoint(run_id: str, data: Dict[str, Any]) -> str:
+    """Write the checkpoint atomically: a crash while writing leaves the previous one in place."""
+    path = checkpoint_path(run_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": CHECKPOINT_VERSION, **data}, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_checkpoint(run_id: str) -> Dict[str, Any]:
+    path = checkpoint_path(run_id)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No checkpoint for run {run_id} at {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {data.get('version')} in {path}")
+    return data
+
+
+async def capture_browser(browser_context: Optional[BrowserContext]) -> Optional[Dict[str, Any]]:
+    """Playwright storage state (cookies, localStorage) and the open tabs of the context."""
+    if browser_context is None:
+        return None
+    try:
+        session = await browser_context.get_session()
+        pages = session.context.pages
+        return {
+            "storage_state": await session.context.storage_state(),
+            "urls": [page.url for page in pages],
+            "current_tab": pages.index(session.current_page) if session.current_page in pages else 0,
+        }
+    except Exception as e:
+        logger.warning(f"Could not capture the browser state for the checkpoint: {e}")
+        return None
+
+
+async def restore_browser(browser_context: BrowserContext, snapshot: Dict[str, Any]) -> None:
+    """Load the checkpointed cookies and localStorage into the context and reopen its tabs."""
+    session = await browser_context.get_session()
+    storage_state = snapshot.get("storage_state") or {}
+    if storage_state.get("cookies"):
+        await session.context.add_cookies(storage_state["cookies"])
+    origins = {
+        origin["origin"]: {item["name"]: item["value"] for item in origin.get("localStorage", [])}
+        for origin in storage_state.get("origins", [])
+    }
+    if origins:
+        await session.context.add_init_script(script=RESTORE_LOCAL_STORAGE_JS % json.dumps(origins))
+    for i, url in enumerate(snapshot.get("urls") or []):
+        try:
+            if i == 0:
+                await browser_context.navigate_to(url)
+            else:
+                await browser_context.create_new_tab(url)
+        except Exception as e:
+            logger.warning(f"Could not reopen {url}: {e}")
+    if snapshot.get("current_tab"):
+        try:
+            await browser_context.switch_to_tab(snapshot["current_tab"])
+        except Exception as e:
+            logger.warning(f"Could not switch back to tab {snapshot['current_tab']}: {e}")
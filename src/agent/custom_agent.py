@@ -1,13 +1,12 @@
+import asyncio
+import dataclasses
 import json
 import logging
+import time
 import traceback
 from typing import Optional, Type, List, Dict, Any, Callable
 
-from PIL import Image, ImageDraw, ImageFont
 import os
-import base64
-import io
-import platform
 
 from browser_use.agent.prompts import SystemPrompt, AgentMessagePrompt
 from browser_use.agent.service import Agent
@@ -16,7 +15,6 @@ from browser_use.agent.views import (
     ActionModel,
     AgentHistoryList,
     AgentOutput,
-    AgentHistory,
 )
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext
@@ -29,12 +27,39 @@ from browser_use.telemetry.views import (
 )
 from browser_use.utils import time_execution_async
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import BaseMessage
-from json_repair import repair_json
+from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+from src.controller.custom_controller import register_look_action
 from src.utils.agent_state import AgentState
+from src.utils.content_accumulator import ContentAccumulator, prune_run_dirs, run_dir
+from src.utils.history_renderer import FrameJob, RenderOptions, history_renderer
+from src.utils.llm import DeepSeekR1ChatOllama
+from src.utils.llm_circuit_breaker import CircuitOpenError, unwrap_llm
+from src.utils.llm_hedging import HedgedChatModel
+from src.utils.prompt_cache import PromptCacheManager
+from src.utils.screenshot_store import ScreenshotStore, StoredBrowserStateHistory
 
+from .agent_memory import MemoryStore
+from .checkpoint import capture_browser, read_checkpoint, restore_browser, write_checkpoint
+from .action_stream import EarlyActionDispatcher, IncrementalAgentOutputParser, StreamEvent, chunk_text
 from .custom_message_manager import CustomMessageManager
-from .custom_views import CustomAgentOutput, CustomAgentStepInfo
+from .custom_views import (
+    CustomAgentBrain,
+    CustomAgentHistory,
+    CustomAgentHistoryList,
+    CustomAgentOutput,
+    CustomAgentStepInfo,
+)
+from .model_router import ModelRouter, RoutingDecision
+from .step_spans import SpanRecorder, StepSpans
+from .structured_output import (
+    ParseStats,
+    drop_null_actions,
+    provider_label,
+    response_json,
+    structured_output_kwargs,
+    structured_output_method,
+)
+from .vision_policy import VISION_MODES, VisionPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -47,7 +72,7 @@ class CustomAgent(Agent):
         add_infos: str = "",
         browser: Optional[Browser] = None,
         browser_context: Optional[BrowserContext] = None,
-        controller: Controller = Controller(),
+        controller: Optional[Controller] = None,
         use_vision: bool = True,
         save_conversation_path: Optional[str] = None,
         max_failures: int = 5,
@@ -77,13 +102,23 @@ class CustomAgent(Agent):
         register_new_step_callback: Optional[Callable[[BrowserState, AgentOutput, int], None]] = None,
         register_done_callback: Optional[Callable[[AgentHistoryList], None]] = None,
         tool_calling_method: Optional[str] = 'auto',
+        stream_llm_output: bool = False,
+        register_action_stream_callback: Optional[Callable[[str, Any, int], None]] = None,
+        early_action_dispatch: bool = False,
+        small_llm: Optional[BaseChatModel] = None,
+        prompt_cache: bool = False,
+        dom_diff: bool = False,
+        vision_pipeline: bool = False,
+        vision_mode: str = "always",
+        checkpoint: bool = False,
     ):
         super().__init__(
             task=task,
             llm=llm,
             browser=browser,
             browser_context=browser_context,
-            controller=controller,
+            # a fresh controller per agent: a shared default would carry one agent's `look` into the next
+            controller=controller if controller is not None else Controller(),
             use_vision=use_vision,
             save_conversation_path=save_conversation_path,
             max_failures=max_failures,
@@ -107,10 +142,57 @@ class CustomAgent(Agent):
             self.use_deepseek_r1 = False
 
         self._last_actions = None
-        self.extracted_content = ""
+        self.history: CustomAgentHistoryList = CustomAgentHistoryList(history=[])
+        # Route steps to `small_llm` first and escalate to `llm` when needed
+        self.model_router = ModelRouter(small_llm, self.llm) if small_llm is not None and not self.use_deepseek_r1 else None
+        self._routing_decision: Optional[RoutingDecision] = None
+        if self.model_router and early_action_dispatch:
+            logger.warning("Early action dispatch is disabled with model routing: escalated steps are re-generated")
+            early_action_dispatch = False
+        # Streaming is skipped for deepseek-r1 over the DeepSeek API, whose reasoning_content only arrives
+        # with the full reply; the Ollama model splits <think> off while streaming
+        self.stream_llm_output = (stream_llm_output or early_action_dispatch) and (
+            not self.use_deepseek_r1 or isinstance(unwrap_llm(self.llm), DeepSeekR1ChatOllama)
+        )
+        # Start executing actions through the controller as soon as they are streamed
+        self.early_action_dispatch = early_action_dispatch and self.stream_llm_output
+        self._action_dispatcher: Optional[EarlyActionDispatcher] = None
+        self.register_action_stream_callback = register_action_stream_callback
+        # Byte-stable prompt prefix plus provider cache hints; cache usage is reported either way
+        self.prompt_cache = prompt_cache
+        self.prompt_cache_manager = PromptCacheManager()
+        self._step_token_usage: Optional[Dict[str, int]] = None
+        # Constrain responses to the AgentOutput schema with the provider's native mode where possible
+        self.structured_output = tool_calling_method
+        self._structured_output_kwargs: Dict[int, tuple[Optional[str], Dict[str, Any]]] = {}
+        self.parse_stats = ParseStats()
+        self._init_run_files()
+        self.history_renderer = history_renderer
+        self._step_spans = StepSpans(0)
+        # Save a checkpoint to the run directory every AGENT_CHECKPOINT_EVERY steps; resume() continues from it
+        self.checkpoint_every = int(os.getenv("AGENT_CHECKPOINT_EVERY", "1")) if checkpoint else 0
+        self._completed_steps = 0
+        self._resume_step_info: Optional[CustomAgentStepInfo] = None
+        self._resume_browser: Optional[Dict[str, Any]] = None
         self.add_infos = add_infos
         self.agent_state = agent_state
         self.agent_prompt_class = agent_prompt_class
+        # Send element-list diffs against a page snapshot; needs indices that survive re-captures, which
+        # screenshot labels do not show
+        use_stable_element_ids = getattr(self.browser_context, "use_stable_element_ids", None)
+        if dom_diff and (self.use_vision or use_stable_element_ids is None):
+            logger.warning("DOM diff needs a CustomBrowserContext and use_vision=False, sending full element lists")
+            dom_diff = False
+        if use_stable_element_ids:
+            use_stable_element_ids(dom_diff)
+        # "on_demand" captures the DOM only and adds a screenshot when the vision policy asks for one
+        if vision_mode not in VISION_MODES:
+            raise ValueError(f"Unsupported vision mode: {vision_mode}")
+        self.vision_policy = VisionPolicy() if self.use_vision and vision_mode == "on_demand" else None
+        if self.vision_policy:
+            # the `look` action lets the model ask for the next screenshot; any controller can take it
+            register_look_action(self.controller)
+            self._setup_action_models()
         self.message_manager = CustomMessageManager(
             llm=self.llm,
             task=self.task,
@@ -120,8 +202,75 @@ class CustomAgent(Agent):
             max_input_tokens=self.max_input_tokens,
             include_attributes=include_attributes,
             max_error_length=self.max_error_length,
-            max_actions_per_step=self.max_actions_per_step
+            max_actions_per_step=self.max_actions_per_step,
+            prompt_cache_layout=prompt_cache,
+            dom_diff=dom_diff,
+            vision_pipeline=vision_pipeline and self.use_vision,
         )
+        # Step memory within a token budget: recent entries plus a digest of older ones
+        self.memory = MemoryStore(self.message_manager.token_counter)
+
+    def _init_run_files(self) -> None:
+        """State kept in the run directory, which is named by the agent id."""
+        # Extracted page content of the run; older chunks spill to the run directory
+        self.extracted_content = ContentAccumulator(os.path.join(run_dir(self.agent_id), "extracted_content.txt"))
+        # History screenshots are kept once per distinct frame in the run directory, not in memory
+        self.screenshot_store = ScreenshotStore(os.path.join(run_dir(self.agent_id), "screenshots"))
+        # Per-phase step timings, kept on the history items and appended to spans.jsonl in the run directory
+        self.spans = SpanRecorder(os.path.join(run_dir(self.agent_id), "spans.jsonl"))
+
+    async def save_checkpoint(self, step_info: CustomAgentStepInfo, max_steps: int) -> None:
+        """Write what resume() needs to continue after the last completed step; failures are only logged."""
+        try:
+            path = write_checkpoint(self.agent_id, {
+                "task": self.task,
+                "add_infos": self.add_infos,
+                "max_steps": max_steps,
+                "completed_steps": self._completed_steps,
+                "n_steps": self.n_steps,
+                "consecutive_failures": self.consecutive_failures,
+                "step_info": dataclasses.asdict(step_info),
+                "messages": self.message_manager.to_dict(),
+                "history": self.history.model_dump(),
+                "last_actions": [a.model_dump(exclude_unset=True) for a in self._last_actions or []],
+                "last_result": [r.model_dump() for r in self._last_result or []],
+                "memory": self.memory.to_dict(),
+                "extracted_content": self.extracted_content.to_dict(),
+                "browser": await capture_browser(self.browser_context),
+            })
+            logger.debug(f"💾 Checkpoint after step {self._completed_steps} saved to {path}")
+        except Exception as e:
+            logger.warning(f"Could not save the checkpoint: {e}")
+
+    def restore_checkpoint(self, checkpoint: Dict[str, Any], run_id: str) -> None:
+        """Continue run `run_id` from its checkpoint; the browser tabs are reopened when run() starts."""
+        self.agent_id = run_id
+        self._init_run_files()
+        self.extracted_content.restore(checkpoint["extracted_content"])
+        self.memory.restore(checkpoint["memory"])
+        self.message_manager.restore(checkpoint["messages"])
+        self.history = CustomAgentHistoryList.load_from_dict(checkpoint["history"], self.AgentOutput)
+        self._last_actions = [self.ActionModel(**action) for action in checkpoint["last_actions"]] or None
+        self._last_result = [ActionResult(**result) for result in checkpoint["last_result"]] or None
+        self.n_steps = checkpoint["n_steps"]
+        self.consecutive_failures = checkpoint["consecutive_failures"]
+        self._completed_steps = checkpoint["completed_steps"]
+        self._resume_step_info = CustomAgentStepInfo(**checkpoint["step_info"])
+        self._resume_browser = checkpoint["browser"]
+        # they ran before the first step of the original run
+        self.initial_actions = None
+        logger.info(f"♻️ Resuming run {run_id} after step {self._completed_steps}")
+
+    @classmethod
+    def resume(cls, run_id: str, **kwargs) -> "CustomAgent":
+        """
+        Rebuild the agent of run `run_id` from its last checkpoint. `kwargs` are the constructor
+        arguments other than the task (llm, browser, controller, ...); continue with `run(max_steps)`.
+        """
+        checkpoint = read_checkpoint(run_id)
+        agent = cls(task=checkpoint["task"], add_infos=checkpoint["add_infos"], **kwargs)
+        agent.restore_checkpoint(checkpoint, run_id)
+        return agent
 
     def _setup_action_models(self) -> None:
         self.ActionModel = self.controller.registry.create_action_model()
@@ -143,6 +292,13 @@ class CustomAgent(Agent):
         for i, action in enumerate(response.action):
             logger.info(f"🛠️  Action {i + 1}/{len(response.action)}: {action.model_dump_json(exclude_unset=True)}")
 
+    async def _handle_step_error(self, error: Exception) -> List[ActionResult]:
+        if isinstance(error, CircuitOpenError):
+            # the model is known to be down: wait for the half-open probe instead of burning steps
+            logger.warning(f"❌ {error}, waiting before the next step")
+            await asyncio.sleep(min(error.retry_in, self.retry_delay))
+        return await super()._handle_step_error(error)
+
     def update_step_info(
         self, model_output: CustomAgentOutput, step_info: Optional[CustomAgentStepInfo] = None
     ):
@@ -150,8 +306,9 @@ class CustomAgent(Agent):
             return
         step_info.step_number += 1
         important_contents = model_output.current_state.important_contents
-        if important_contents and "None" not in important_contents and important_contents not in step_info.memory:
-            step_info.memory += important_contents + "\n"
+        if important_contents and "None" not in important_contents and self.memory.add(important_contents):
+            logger.info(f"🧠 New memory: {important_contents}")
+        step_info.memory = self.memory.render()
         task_progress = model_output.current_state.task_progress
         if task_progress and "None" not in task_progress:
             step_info.task_progress = task_progress
@@ -159,6 +316,106 @@ class CustomAgent(Agent):
         if future_plans and "None" not in future_plans:
             step_info.future_plans = future_plans
 
+    async def _stream_next_action(
+            self, llm: BaseChatModel, input_messages: List[BaseMessage], span: Optional[Dict[str, Any]] = None, **kwargs
+    ) -> AIMessage:
+        """Stream the completion, surfacing current_state and each action as soon as its JSON closes."""
+        parser = IncrementalAgentOutputParser()
+        ai_chunk = None
+        start = time.perf_counter()
+        async for chunk in llm.astream(input_messages, **kwargs):
+            if ai_chunk is None and span is not None:
+                span["ttft"] = round(time.perf_counter() - start, 4)
+            ai_chunk = chunk if ai_chunk is None else ai_chunk + chunk
+            for event in parser.feed(chunk_text(chunk)):
+                self._on_stream_event(event)
+        if ai_chunk is None:
+            raise ValueError("Could not parse response.")
+        return message_chunk_to_message(ai_chunk)
+
+    def _on_stream_event(self, event: StreamEvent) -> None:
+        try:
+            if event.kind == "current_state":
+                payload = CustomAgentBrain(**event.data)
+                logger.info(f"⚡ Streamed state: {payload.summary}")
+            else:
+                payload = self.ActionModel(**event.data)
+                if not payload.model_dump(exclude_unset=True):
+                    raise ValueError(f"Unknown action {list(event.data)}")
+                logger.info(f"⚡ Streamed action {event.index + 1}: {payload.model_dump_json(exclude_unset=True)}")
+        except Exception as e:
+            # The final, fully repaired response is still validated in get_next_action.
+            logger.debug(f"Skipping invalid streamed {event.kind}: {e}")
+            return
+        if event.kind == "action" and self._action_dispatcher:
+            self._action_dispatcher.submit(payload)
+        if self.register_action_stream_callback:
+            self.register_action_stream_callback(event.kind, payload, self.n_steps)
+
+    def _structured_output_for(self, llm: BaseChatModel) -> tuple[Optional[str], Dict[str, Any]]:
+        key = id(llm)
+        if key not in self._structured_output_kwargs:
+            method = None if self.use_deepseek_r1 else structured_output_method(llm, self.structured_output)
+            self._structured_output_kwargs[key] = (method, structured_output_kwargs(llm, method, self.AgentOutput))
+            logger.debug(f"Structured output for {provider_label(llm)}: {method or 'repair'}")
+        return self._structured_output_kwargs[key]
+
+    async def _invoke_llm(self, llm: BaseChatModel, input_messages: List[BaseMessage]) -> AIMessage:
+        invoke_kwargs = {}
+        if self.prompt_cache:
+            input_messages, invoke_kwargs = self.prompt_cache_manager.prepare(llm, input_messages)
+        invoke_kwargs.update(self._structured_output_for(llm)[1])
+        with self._step_spans.span("llm", model=provider_label(llm), streamed=self.stream_llm_output) as span:
+            if self.stream_llm_output:
+                ai_message = await self._stream_next_action(llm, input_messages, span=span, **invoke_kwargs)
+            else:
+                ai_message = await llm.ainvoke(input_messages, **invoke_kwargs)
+        usage = self.prompt_cache_manager.record(ai_message)
+        if usage:
+            if self._step_token_usage:
+                usage = {name: self._step_token_usage.get(name, 0) + value for name, value in usage.items()}
+            self._step_token_usage = usage
+            logger.info(
+                f"💾 Input tokens: {usage['cached_input_tokens']} cached / {usage['uncached_input_tokens']} uncached"
+            )
+        return ai_message
+
+    def _parse_agent_output(self, ai_message: AIMessage, llm: Optional[BaseChatModel] = None) -> AgentOutput:
+        llm = llm or self.llm
+        method = self._structured_output_for(llm)[0]
+        start = time.perf_counter()
+        try:
+            parsed_json, repaired = response_json(ai_message, method)
+            parsed: AgentOutput = self.AgentOutput(**drop_null_actions(parsed_json))
+        except Exception:
+            self.parse_stats.record(provider_label(llm), method, time.perf_counter() - start, ok=False)
+            self._step_spans.add("parse", time.perf_counter() - start, start=start, ok=False)
+            logger.debug(ai_message.content)
+            raise
+        self.parse_stats.record(provider_label(llm), method, time.perf_counter() - start, ok=True, repaired=repaired)
+        self._step_spans.add("parse", time.perf_counter() - start, start=start, ok=True, repaired=repaired)
+        return parsed
+
+    async def _get_routed_output(self, input_messages: List[BaseMessage]) -> tuple[AIMessage, AgentOutput]:
+        """Ask the small model first; escalate this step to the large model if its answer is unusable."""
+        decision = self.model_router.select(self.n_steps)
+        self._routing_decision = decision
+        if decision.tier == "small":
+            try:
+                ai_message = await self._invoke_llm(self.model_router.small_llm, input_messages)
+                parsed = self._parse_agent_output(ai_message, self.model_router.small_llm)
+                reason = self.model_router.escalation_reason(parsed)
+            except Exception as e:
+                reason = f"parse failure: {str(e).splitlines()[0][:200] if str(e) else type(e).__name__}"
+            if reason is None:
+                self.model_router.record(decision)
+                return ai_message, parsed
+            self.model_router.escalate(decision, reason)
+        ai_message = await self._invoke_llm(self.model_router.large_llm, input_messages)
+        parsed = self._parse_agent_output(ai_message, self.model_router.large_llm)
+        self.model_router.record(decision)
+        return ai_message, parsed
+
     @time_execution_async("--get_next_action")
     async def get_next_action(self, input_messages: List[BaseMessage]) -> AgentOutput:
         messages_to_process = (
@@ -166,22 +423,30 @@ class CustomAgent(Agent):
             if self.use_deepseek_r1
             else input_messages
         )
-        ai_message = self.llm.invoke(messages_to_process)
+        if self.model_router:
+            ai_message, parsed = await self._get_routed_output(messages_to_process)
+        else:
+            ai_message = await self._invoke_llm(self.llm, messages_to_process)
+            parsed = None
+        if ai_message.tool_calls:
+            # keep the agent response as content: a tool call without a tool result is rejected next step
+            ai_message = AIMessage(
+                content=json.dumps(ai_message.tool_calls[0]["args"], ensure_ascii=False),
+                usage_metadata=ai_message.usage_metadata,
+            )
         self.message_manager._add_message_with_tokens(ai_message)
         if self.use_deepseek_r1:
             logger.info("🤯 Start Deep Thinking: ")
-            logger.info(ai_message.reasoning_content)
+            # a hedged backup model may not return reasoning content; streamed replies keep it in additional_kwargs
+            logger.info(getattr(ai_message, "reasoning_content", None) or ai_message.additional_kwargs.get("reasoning_content"))
             logger.info("🤯 End Deep Thinking")
-        content = ai_message.content
-        if isinstance(content, list):
-            content = content[0]
-        content = content.replace("```json", "").replace("```", "")
-        content = repair_json(content)
-        parsed_json = json.loads(content)
-        parsed: AgentOutput = self.AgentOutput(**parsed_json)
+            if "reasoning_tokens" in ai_message.response_metadata:
+                logger.info(
+                    f"🤯 Reasoning tokens: {ai_message.response_metadata['reasoning_tokens']}, "
+                    f"answer tokens: {ai_message.response_metadata['answer_tokens']}"
+                )
         if parsed is None:
-            logger.debug(ai_message.content)
-            raise ValueError("Could not parse response.")
+            parsed = self._parse_agent_output(ai_message)
         parsed.action = parsed.action[: self.max_actions_per_step]
         self._log_response(parsed)
         self.n_steps += 1
@@ -190,27 +455,70 @@ class CustomAgent(Agent):
     @time_execution_async("--step")
     async def step(self, step_info: Optional[CustomAgentStepInfo] = None) -> None:
         logger.info(f"\n📍 Step {self.n_steps}")
+        step_number = self.n_steps
+        step_start = time.monotonic()
         state = None
         model_output = None
         result: List[ActionResult] = []
+        dispatcher = None
+        spans = self._step_spans = StepSpans(step_number)
+        action_timings = getattr(self.controller, "action_timings", None)
+        if action_timings:
+            action_timings.clear()
         try:
-            state = await self.browser_context.get_state(use_vision=self.use_vision)
-            self.message_manager.add_state_message(state, self._last_actions, self._last_result, step_info)
-            input_messages = self.message_manager.get_messages()
+            with spans.span("get_state") as span:
+                state = await self.browser_context.get_state(use_vision=self.use_vision and not self.vision_policy)
+            self._add_state_spans(span)
+            if self.vision_policy:
+                state = await self._on_demand_screenshot(state)
+            count_seconds = self.message_manager.count_seconds
+            with spans.span("prompt_build"):
+                self.message_manager.add_state_message(state, self._last_actions, self._last_result, step_info)
+                input_messages = self.message_manager.get_messages()
+            spans.add("prompt_build.token_count", self.message_manager.count_seconds - count_seconds)
+            if self.early_action_dispatch:
+                dispatcher = EarlyActionDispatcher(self.controller, self.browser_context, self.max_actions_per_step)
+                dispatcher.start()
+                self._action_dispatcher = dispatcher
             try:
                 model_output = await self.get_next_action(input_messages)
                 if self.register_new_step_callback:
                     self.register_new_step_callback(state, model_output, self.n_steps)
                 self.update_step_info(model_output, step_info)
-                logger.info(f"🧠 All Memory: \n{step_info.memory}")
+                if step_info and self.memory.needs_summary:
+                    with spans.span("memory_summary"):
+                        await self.memory.summarize(self.model_router.small_llm if self.model_router else self.llm)
+                    step_info.memory = self.memory.render()
+                logger.info(f"🧠 Memory: {self.memory.tokens()} tokens, {len(self.memory.entries)} recent entries"
+                            + (f" and a {len(self.memory.digest)}-sentence digest" if self.memory.digest else ""))
+                logger.debug(f"🧠 All Memory: \n{step_info.memory if step_info else ''}")
                 self._save_conversation(input_messages, model_output)
                 if self.model_name != "deepseek-reasoner":
                     self.message_manager._remove_state_message_by_index(-1)
             except Exception as e:
                 self.message_manager._remove_state_message_by_index(-1)
                 raise e
+            finally:
+                self._action_dispatcher = None
             actions: List[ActionModel] = model_output.action
-            result = await self.controller.multi_act(actions, self.browser_context)
+            if dispatcher:
+                result = await dispatcher.finish(actions)
+                if dispatcher.mismatch_index is not None:
+                    if not result:
+                        result = await self.controller.multi_act(actions, self.browser_context)
+                    elif len(result) <= dispatcher.mismatch_index:
+                        # what ran is a prefix of the final plan, so the plan can go on
+                        if not dispatcher.halted:
+                            result = await dispatcher.run_remaining(actions[len(result):])
+                    else:
+                        logger.warning(
+                            f"A streamed action that differs from the final response already ran; not executing "
+                            f"{len(actions) - dispatcher.mismatch_index} final action(s): "
+                            f"{[a.model_dump(exclude_unset=True) for a in actions[dispatcher.mismatch_index:]]}")
+                        actions = dispatcher.dispatched[:len(result)]
+                        model_output.action = actions
+            else:
+                result = await self.controller.multi_act(actions, self.browser_context)
             if len(result) != len(actions):
                 for ri in range(len(result), len(actions)):
                     result.append(
@@ -222,42 +530,132 @@ class CustomAgent(Agent):
                         )
                     )
             if len(actions) == 0:
-                result = [ActionResult(is_done=True, extracted_content=step_info.memory, include_in_memory=True)]
+                result = [ActionResult(is_done=True, extracted_content=self.memory.full_text(), include_in_memory=True)]
             for ret_ in result:
                 if ret_.extracted_content and "Extracted page" in ret_.extracted_content:
-                    self.extracted_content += ret_.extracted_content
+                    self.extracted_content.add(ret_.extracted_content)
             self._last_result = result
             self._last_actions = actions
             if result and result[-1].is_done:
-                if not self.extracted_content:
-                    self.extracted_content = step_info.memory
-                result[-1].extracted_content = self.extracted_content
+                result[-1].extracted_content = (
+                    self.extracted_content.text() if self.extracted_content else self.memory.full_text())
                 logger.info(f"📄 Result: {result[-1].extracted_content}")
             self.consecutive_failures = 0
         except Exception as e:
+            # stop the streamed actions before waiting out a retry delay or an open circuit; whatever
+            # already ran is reported, so it is not run a second time from the parsed output
+            aborted = dispatcher is not None and not dispatcher.closed
+            early_results = await dispatcher.abort() if aborted else list(dispatcher.results) if dispatcher else []
             result = await self._handle_step_error(e)
+            if aborted and len(dispatcher.dispatched) > len(early_results):
+                logger.warning(f"Dropped {len(dispatcher.dispatched) - len(early_results)} streamed action(s) "
+                               f"that had not run when the step failed")
+            if early_results:
+                # Actions already ran before the response turned out invalid; report them with the error.
+                logger.warning(f"Aborted early dispatch after {len(early_results)} executed action(s)")
+                last = early_results[-1]
+                error = f"{last.error}\n{result[0].error}" if last.error else result[0].error
+                result = early_results[:-1] + [last.model_copy(update={"error": error, "include_in_memory": True})]
+                self._last_actions = dispatcher.dispatched[:len(result)]
             self._last_result = result
         finally:
-            actions_dump = [a.model_dump(exclude_unset=True) for a in model_output.action] if model_output else []
-            self.telemetry.capture(
-                AgentStepTelemetryEvent(
-                    agent_id=self.agent_id,
-                    step=self.n_steps,
-                    actions=actions_dump,
-                    consecutive_failures=self.consecutive_failures,
-                    step_error=[r.error for r in result if r.error] if result else ["No result"],
+            for name, start, seconds, error in action_timings or []:
+                spans.add("action", seconds, start=start, action=name, ok=not error)
+            with spans.span("history"):
+                actions_dump = [a.model_dump(exclude_unset=True) for a in model_output.action] if model_output else []
+                self.telemetry.capture(
+                    AgentStepTelemetryEvent(
+                        agent_id=self.agent_id,
+                        step=self.n_steps,
+                        actions=actions_dump,
+                        consecutive_failures=self.consecutive_failures,
+                        step_error=[r.error for r in result if r.error] if result else ["No result"],
+                    )
                 )
-            )
+                if state:
+                    self._make_history_item(model_output, state, result)
+                invalidate_state = getattr(self.browser_context, "invalidate_state", None)
+                if invalidate_state:
+                    # actions may have changed the page in ways the DOM version does not see
+                    invalidate_state()
             if state:
-                self._make_history_item(model_output, state, result)
+                self.history.history[-1].spans = list(spans.spans)
+            self.spans.record(spans)
+            # LLM calls outside a step are not attributed to it
+            self._step_spans = StepSpans(0)
+            self._log_step_timing(step_number, time.monotonic() - step_start)
+            self._routing_decision = None
+            self._step_token_usage = None
+
+    async def _on_demand_screenshot(self, state: BrowserState) -> BrowserState:
+        """Attach a screenshot to a DOM-only state when the vision policy calls for one."""
+        reason = self.vision_policy.reason(state, self._last_actions, self._last_result, self.n_steps)
+        if reason is None:
+            self.vision_policy.record(None)
+            return state
+        start = time.monotonic()
+        try:
+            screenshot = await self.browser_context.take_screenshot()
+        except Exception as e:
+            logger.warning(f"Could not take the {reason} screenshot: {e}")
+            self.vision_policy.record(None)
+            return state
+        seconds = time.monotonic() - start
+        self._step_spans.add("get_state.screenshot", seconds, on_demand=reason)
+        tokens = self.message_manager.token_counter.count_image(
+            f"data:image/png;base64,{screenshot}", self.message_manager.IMG_TOKENS)
+        self.vision_policy.record(reason, seconds, tokens)
+        logger.info(f"📷 Screenshot attached ({reason}, {seconds:.2f}s, {tokens} image tokens)")
+        # a copy, so a cached DOM-only state stays without it
+        return dataclasses.replace(state, screenshot=screenshot)
+
+    def _add_state_spans(self, span: Dict[str, Any]) -> None:
+        """Split the get_state span into page load, DOM extraction and screenshot, when the context times them."""
+        timings = getattr(self.browser_context, "last_state_timings", None)
+        if not timings:
+            return
+        span["cache_hit"] = timings["cache_hit"]
+        for phase in ("page_load", "dom", "screenshot"):
+            if phase in timings:
+                self._step_spans.add(f"get_state.{phase}", timings[phase])
+
+    def _log_step_timing(self, step_number: int, seconds: float) -> None:
+        message = f"⏱️ Step {step_number} took {seconds:.2f}s"
+        state_cache_stats = getattr(self.browser_context, "state_cache_stats", None)
+        if state_cache_stats:
+            stats = state_cache_stats()
+            message += (f", state cache {stats['hits']} hits / {stats['misses']} misses "
+                        f"({stats['hit_ratio']:.0%})")
+        logger.info(message)
+
+    def _make_history_item(
+        self,
+        model_output: Optional[AgentOutput],
+        state: BrowserState,
+        result: List[ActionResult],
+    ) -> None:
+        super()._make_history_item(model_output, state, result)
+        item = self.history.history[-1]
+        self.history.history[-1] = CustomAgentHistory(
+            model_output=item.model_output,
+            result=item.result,
+            state=StoredBrowserStateHistory.from_state(item.state, self.screenshot_store),
+            routing=self._routing_decision.to_dict() if self._routing_decision else None,
+            token_usage=self._step_token_usage,
+        )
 
     async def run(self, max_steps: int = 100) -> AgentHistoryList:
         try:
             self._log_agent_run()
+            # only the AGENT_RUN_KEEP most recent runs keep their directories; this one, resumed or not, stays
+            prune_run_dirs(self.agent_id)
             if self.initial_actions:
                 result = await self.controller.multi_act(self.initial_actions, self.browser_context, check_for_new_elements=False)
                 self._last_result = result
-            step_info = CustomAgentStepInfo(
+            if self._resume_browser and self.browser_context:
+                await restore_browser(self.browser_context, self._resume_browser)
+                self._resume_browser = None
+            step_info = self._resume_step_info or CustomAgentStepInfo(
                 task=self.task,
                 add_infos=self.add_infos,
                 step_number=1,
@@ -266,17 +664,23 @@ class CustomAgent(Agent):
                 task_progress="",
                 future_plans=""
             )
-            for _ in range(max_steps):
+            step_info.max_steps = max_steps
+            self._resume_step_info = None
+            for _ in range(max_steps - self._completed_steps):
                 if self.agent_state and self.agent_state.is_stop_requested():
                     logger.info("🛑 Stop requested by user")
                     self._create_stop_history_item()
                     break
                 if self.browser_context and self.agent_state:
-                    state = await self.browser_context.get_state(use_vision=self.use_vision)
+                    state = await self.browser_context.get_state(
+                        use_vision=self.use_vision and not self.vision_policy)
                     self.agent_state.set_last_valid_state(state)
                 if self._too_many_failures():
                     break
                 await self.step(step_info)
+                self._completed_steps += 1
+                if self.checkpoint_every and self._completed_steps % self.checkpoint_every == 0:
+                    await self.save_checkpoint(step_info, max_steps)
                 if self.history.is_done():
                     if self.validate_output and self.n_steps < max_steps - 1:
                         if not await self._validate_output():
@@ -286,10 +690,8 @@ class CustomAgent(Agent):
             else:
                 logger.info("❌ Failed to complete task in maximum steps")
                 if self.history.history:
-                    if not self.extracted_content:
-                        self.history.history[-1].result[-1].extracted_content = step_info.memory
-                    else:
-                        self.history.history[-1].result[-1].extracted_content = self.extracted_content
+                    self.history.history[-1].result[-1].extracted_content = (
+                        self.extracted_content.text() if self.extracted_content else self.memory.full_text())
             return self.history
         finally:
             self.telemetry.capture(
@@ -301,13 +703,42 @@ class CustomAgent(Agent):
                     errors=self.history.errors(),
                 )
             )
+            if isinstance(self.llm, HedgedChatModel):
+                logger.info(f"LLM hedging stats: {self.llm.stats()}")
+            if self.model_router:
+                logger.info(f"🔀 Model routing: {self.model_router.stats()}")
+            if self.prompt_cache_manager.totals["steps"]:
+                logger.info(f"💾 Prompt cache: {self.prompt_cache_manager.stats()}")
+            logger.info(f"🧩 Response parsing: {self.parse_stats.stats()}")
+            self._log_span_summary()
+            if self.message_manager.dom_diff is not None:
+                logger.info(f"🧬 DOM diff: {self.message_manager.dom_diff.stats()}")
+            logger.info(f"🧠 Memory: {self.memory.stats()}")
+            if self.extracted_content:
+                logger.info(f"📚 Extracted content: {self.extracted_content.stats()}")
+            if self.vision_policy:
+                logger.info(f"📷 On-demand vision: {self.vision_policy.stats()}")
+            if self.message_manager.screenshots is not None:
+                logger.info(f"🖼️ Screenshots: {self.message_manager.screenshots.stats()}")
+            if self.screenshot_store.frames:
+                logger.info(f"🎞️ Screenshot store: {self.screenshot_store.stats()}")
+            if hasattr(self.browser_context, "state_cache_stats"):
+                logger.info(f"🗂️ Browser state cache: {self.browser_context.state_cache_stats()}")
             if not self.injected_browser_context and self.browser_context:
                 await self.browser_context.close()
             if not self.injected_browser and self.browser:
                 await self.browser.close()
             if self.generate_gif:
                 output_path: str = self.generate_gif if isinstance(self.generate_gif, str) else "agent_history.gif"
-                self.create_history_gif(output_path=output_path)
+                # frames render in a process pool; keep the event loop free meanwhile
+                await asyncio.to_thread(self.create_history_gif, output_path=output_path)
+
+    def _log_span_summary(self) -> None:
+        summary = self.spans.summary()
+        if not summary:
+            return
+        phases = ", ".join(f"{name} {stats['p50']:.2f}/{stats['p95']:.2f}s" for name, stats in summary.items())
+        logger.info(f"⏱️ Step phases p50/p95 over {summary.get('step', {}).get('count', 0)} steps: {phases}")
 
     def _create_stop_history_item(self):
         try:
@@ -315,18 +746,12 @@ class CustomAgent(Agent):
             if self.agent_state:
                 last_state = self.agent_state.get_last_valid_state()
                 if last_state:
-                    state = BrowserStateHistory(
-                        url=getattr(last_state, "url", ""),
-                        title=getattr(last_state, "title", ""),
-                        tabs=getattr(last_state, "tabs", []),
-                        interacted_element=[None],
-                        screenshot=getattr(last_state, "screenshot", None)
-                    )
+                    state = self._convert_to_browser_state_history(last_state)
                 else:
                     state = self._create_empty_state()
             else:
                 state = self._create_empty_state()
-            stop_history = AgentHistory(
+            stop_history = CustomAgentHistory(
                 model_output=None,
                 state=state,
                 result=[ActionResult(extracted_content=None, error=None, is_done=True)]
@@ -335,7 +760,7 @@ class CustomAgent(Agent):
         except Exception as e:
             logger.error(f"Error creating stop history item: {e}")
             state = self._create_empty_state()
-            stop_history = AgentHistory(
+            stop_history = CustomAgentHistory(
                 model_output=None,
                 state=state,
                 result=[ActionResult(extracted_content=None, error=None, is_done=True)]
@@ -343,12 +768,13 @@ class CustomAgent(Agent):
             self.history.history.append(stop_history)
 
     def _convert_to_browser_state_history(self, browser_state):
-        return BrowserStateHistory(
+        return StoredBrowserStateHistory(
             url=getattr(browser_state, "url", ""),
             title=getattr(browser_state, "title", ""),
             tabs=getattr(browser_state, "tabs", []),
             interacted_element=[None],
-            screenshot=getattr(browser_state, "screenshot", None)
+            screenshot=getattr(browser_state, "screenshot", None),
+            store=self.screenshot_store,
         )
 
     def _create_empty_state(self):
@@ -373,75 +799,34 @@ class CustomAgent(Agent):
         margin: int = 40,
         line_spacing: float = 1.5,
     ) -> None:
-        if not self.history.history or not self.history.history[0].state.screenshot:
+        """Render the history to a GIF, or an animated WebP/MP4 by the extension of `output_path`."""
+        if not self.history.history or not self._frame_source(self.history.history[0].state):
             logger.warning("No history or first screenshot to create GIF from")
             return
-        images = []
-        try:
-            from PIL import ImageFont
-            font_options = ["Helvetica", "Arial", "DejaVuSans", "Verdana"]
-            font_loaded = False
-            for font_name in font_options:
-                try:
-                    if platform.system() == "Windows":
-                        font_name = os.path.join(os.getenv("WIN_FONT_DIR", "C:\\Windows\\Fonts"), font_name + ".ttf")
-                    regular_font = ImageFont.truetype(font_name, font_size)
-                    title_font = ImageFont.truetype(font_name, title_font_size)
-                    goal_font = ImageFont.truetype(font_name, goal_font_size)
-                    font_loaded = True
-                    break
-                except OSError:
-                    continue
-            if not font_loaded:
-                raise OSError("No preferred fonts found")
-        except OSError:
-            from PIL import ImageFont
-            regular_font = ImageFont.load_default()
-            title_font = ImageFont.load_default()
-            goal_font = regular_font
-
-        logo = None
-        if show_logo:
-            try:
-                from PIL import Image
-                logo = Image.open("./static/browser-use.png")
-                logo_height = 150
-                aspect_ratio = logo.width / logo.height
-                logo_width = int(logo_height * aspect_ratio)
-                logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-            except Exception as e:
-                logger.warning(f"Could not load logo: {e}")
+        jobs = []
         if show_task and self.task:
-            task_frame = self._create_task_frame(
-                self.task, self.history.history[0].state.screenshot, title_font, regular_font, logo, line_spacing
-            )
-            images.append(task_frame)
+            jobs.append(FrameJob(step_number=0, text=self.task, **self._frame_source(self.history.history[0].state)))
         for i, item in enumerate(self.history.history, 1):
-            if not item.state.screenshot:
+            source = self._frame_source(item.state)
+            if not source:
                 continue
-            img_data = base64.b64decode(item.state.screenshot)
-            from PIL import Image
-            image = Image.open(io.BytesIO(img_data))
-            if show_goals and item.model_output:
-                image = self._add_overlay_to_image(
-                    image=image,
-                    step_number=i,
-                    goal_text=item.model_output.current_state.thought,
-                    regular_font=regular_font,
-                    title_font=title_font,
-                    margin=margin,
-                    logo=logo,
-                )
-            images.append(image)
-        if images:
-            images[0].save(
-                output_path,
-                save_all=True,
-                append_images=images[1:],
-                duration=duration,
-                loop=0,
-                optimize=False,
-            )
-            logger.info(f"Created GIF at {output_path}")
-        else:
-            logger.warning("No images found in history to create GIF")
+            goal_text = item.model_output.current_state.thought if show_goals and item.model_output else None
+            jobs.append(FrameJob(step_number=i, text=goal_text, **source))
+        options = RenderOptions(
+            duration=duration,
+            font_size=font_size,
+            title_font_size=title_font_size,
+            goal_font_size=goal_font_size,
+            margin=margin,
+            line_spacing=line_spacing,
+            logo_path="./static/browser-use.png" if show_logo else None,
+        )
+        self.history_renderer.render(jobs, output_path, options)
+
+    @staticmethod
+    def _frame_source(state) -> Dict[str, str]:
+        # stored frames are opened from disk by the renderer, the base64 data is never loaded here
+        screenshot_path = getattr(state, "screenshot_path", None)
+        if screenshot_path:
+            return {"screenshot_path": screenshot_path}
+        return {"screenshot": state.screenshot} if state.screenshot else {}
@@ -1,24 +1,26 @@
 from __future__ import annotations
 
 import logging
-from typing import List, Optional, Type
+import time
+from typing import Any, Dict, List, Optional, Type
 
 from browser_use.agent.message_manager.service import MessageManager
-from browser_use.agent.message_manager.views import MessageHistory
+from browser_use.agent.message_manager.views import MessageHistory, MessageMetadata
 from browser_use.agent.prompts import SystemPrompt, AgentMessagePrompt
 from browser_use.agent.views import ActionResult, AgentStepInfo, ActionModel
 from browser_use.browser.views import BrowserState
 from langchain_core.language_models import BaseChatModel
-from langchain_anthropic import ChatAnthropic
-from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import (
     AIMessage,
     BaseMessage,
     HumanMessage,
-    ToolMessage
+    ToolMessage,
+    messages_from_dict,
+    messages_to_dict,
 )
-from langchain_openai import ChatOpenAI
-from ..utils.llm import DeepSeekR1ChatOpenAI
+from ..utils.dom_diff import DomDiff
+from ..utils.screenshot_pipeline import ScreenshotPipeline
+from ..utils.token_counter import get_token_counter
 from .custom_prompts import CustomAgentMessagePrompt
 
 logger = logging.getLogger(__name__)
@@ -39,7 +41,14 @@ class CustomMessageManager(MessageManager):
         max_error_length: int = 400,
         max_actions_per_step: int = 10,
         message_context: Optional[str] = None,
+        prompt_cache_layout: bool = False,
+        dom_diff: bool = False,
+        vision_pipeline: bool = False,
     ):
+        # Needed by _count_tokens, which the base constructor already calls
+        self.token_counter = get_token_counter(llm)
+        # total seconds spent counting tokens, for the agent's step spans
+        self.count_seconds = 0.0
         super().__init__(
             llm=llm,
             task=task,
@@ -54,6 +63,13 @@ class CustomMessageManager(MessageManager):
             message_context=message_context,
         )
         self.agent_prompt_class = agent_prompt_class
+        self.prompt_cache_layout = prompt_cache_layout
+        # Send the element list once as a page snapshot that stays in the history, then only its changes
+        self.dom_diff = DomDiff() if dom_diff else None
+        self._snapshot_message: Optional[HumanMessage] = None
+        # Downscale, re-encode and dedup screenshots, sent as a message that stays until the next one
+        self.screenshots = ScreenshotPipeline() if vision_pipeline else None
+        self._screenshot_message: Optional[HumanMessage] = None
         # Custom: Initialize history with system prompt and optional context.
         self.history = MessageHistory()
         self._add_message_with_tokens(self.system_prompt)
@@ -79,24 +95,129 @@ class CustomMessageManager(MessageManager):
         step_info: Optional[AgentStepInfo] = None,
     ) -> None:
         """Add the browser state as a human message. Note that we do not pass 'actions' since our prompt class doesn't expect it."""
-        state_message = self.agent_prompt_class(
+        prompt = self.agent_prompt_class(
             state=state,
             result=result,
             max_error_length=self.max_error_length,
             step_info=step_info,
-        ).get_user_message()
-        self._add_message_with_tokens(state_message)
+            prompt_cache_layout=self.prompt_cache_layout,
+        )
+        if self.dom_diff is not None and hasattr(prompt, "elements_diff"):
+            self._add_dom_diff(prompt, state)
+        if self.screenshots is not None and state.screenshot and hasattr(prompt, "screenshot_note"):
+            self._add_screenshot(prompt, state)
+        self._add_message_with_tokens(prompt.get_user_message())
 
-    def _count_text_tokens(self, text: str) -> int:
-        if isinstance(self.llm, (ChatOpenAI, ChatAnthropic, DeepSeekR1ChatOpenAI)):
-            try:
-                tokens = self.llm.get_num_tokens(text)
-            except Exception:
-                tokens = len(text) // self.estimated_characters_per_token  # rough estimate if tokenizer is unavailable
+    def _history_index(self, message: Optional[BaseMessage]) -> Optional[int]:
+        if message is None:
+            return None
+        for i, managed in enumerate(self.history.messages):
+            if managed.message is message:
+                return i
+        return None
+
+    def _add_screenshot(self, prompt: CustomAgentMessagePrompt, state: BrowserState) -> None:
+        """Replace the screenshot message with the processed capture, or only say so when it looks the same."""
+        screenshot_index = self._history_index(self._screenshot_message)
+        if screenshot_index is None:
+            # the last screenshot was trimmed from the history, so the next one cannot be a duplicate of it
+            self.screenshots.reset()
+        try:
+            processed = self.screenshots.process(state.screenshot)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not process the screenshot, sending it as captured: {e}")
+            return
+        original_tokens = self.token_counter.count_image(f"data:image/png;base64,{state.screenshot}", self.IMG_TOKENS)
+        if processed.duplicate:
+            self.screenshots.record_tokens(original_tokens, 0)
+            prompt.screenshot_note = "The page looks the same as in the screenshot above; no new screenshot is attached."
+            return
+        if screenshot_index is not None:
+            self.history.remove_message(screenshot_index)
+        image_url = {"url": processed.data_url}
+        if self.screenshots.detail:
+            image_url["detail"] = self.screenshots.detail
+        self._screenshot_message = HumanMessage(content=[
+            {"type": "text", "text": "Screenshot of the current page:"},
+            {"type": "image_url", "image_url": image_url},
+        ])
+        self._add_message_with_tokens(self._screenshot_message)
+        self.screenshots.record_tokens(original_tokens, self.token_counter.count_image(
+            processed.data_url, self.IMG_TOKENS, self.screenshots.detail or None))
+        prompt.screenshot_note = "The screenshot above shows the current page."
+
+    def _add_dom_diff(self, prompt: CustomAgentMessagePrompt, state: BrowserState) -> None:
+        """Point the state message at the page snapshot, refreshing the snapshot when a diff does not pay off."""
+        elements_text = state.element_tree.clickable_elements_to_string(include_attributes=prompt.include_attributes)
+        snapshot_index = self._history_index(self._snapshot_message)
+        diff = self.dom_diff.update(state.url, elements_text, snapshot_kept=snapshot_index is not None)
+        if diff is None:
+            if snapshot_index is not None:
+                self.history.remove_message(snapshot_index)
+            self._snapshot_message = HumanMessage(
+                content=f"Page snapshot of {state.url} (element indices stay valid until the next snapshot):\n"
+                        f"{prompt.elements_description()}")
+            self._add_message_with_tokens(self._snapshot_message)
+            prompt.elements_diff = "see the page snapshot above"
+            return
+        prompt.elements_diff = (
+            f"changes since the page snapshot above (+ added, - removed, ~ changed; other elements are unchanged):\n"
+            f"{diff}\n[{state.pixels_above} pixels above, {state.pixels_below} pixels below]")
+
+    def _count_tokens(self, message: BaseMessage) -> int:
+        start = time.perf_counter()
+        try:
+            return self._count_message_tokens(message)
+        finally:
+            self.count_seconds += time.perf_counter() - start
+
+    def _count_message_tokens(self, message: BaseMessage) -> int:
+        """Count tokens with the tokenizer of the model family, which memoizes the text counts."""
+        tool_calls = getattr(message, "tool_calls", None)
+        tokens = 0
+        if isinstance(message.content, list):
+            for item in message.content:
+                if isinstance(item, dict) and "image_url" in item:
+                    image_url = item["image_url"]
+                    url = image_url.get("url", "") if isinstance(image_url, dict) else image_url
+                    detail = image_url.get("detail") if isinstance(image_url, dict) else None
+                    tokens += self.token_counter.count_image(url, self.IMG_TOKENS, detail)
+                elif isinstance(item, dict) and "text" in item:
+                    tokens += self._count_text_tokens(item["text"])
+                elif isinstance(item, str):
+                    tokens += self._count_text_tokens(item)
         else:
-            tokens = len(text) // self.estimated_characters_per_token  # rough estimate
+            text = message.content
+            if tool_calls:
+                text += str(tool_calls)
+            tokens = self._count_text_tokens(text)
         return tokens
 
+    def _count_text_tokens(self, text: str) -> int:
+        return self.token_counter.count_text(text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        messages = self.history.messages
+        return {
+            "messages": messages_to_dict([managed.message for managed in messages]),
+            "tokens": [managed.metadata.input_tokens for managed in messages],
+            "snapshot_index": self._history_index(self._snapshot_message),
+            "screenshot_index": self._history_index(self._screenshot_message),
+        }
+
+    def restore(self, data: Dict[str, Any]) -> None:
+        """
+        Continue from a to_dict() checkpoint. The page snapshot and screenshot messages are kept; the
+        next state message replaces them, since the diff and dedup state starts over.
+        """
+        self.history = MessageHistory()
+        for message, tokens in zip(messages_from_dict(data["messages"]), data["tokens"]):
+            self.history.add_message(message, MessageMetadata(input_tokens=tokens))
+        snapshot_index, screenshot_index = data.get("snapshot_index"), data.get("screenshot_index")
+        self._snapshot_message = self.history.messages[snapshot_index].message if snapshot_index is not None else None
+        self._screenshot_message = (
+            self.history.messages[screenshot_index].message if screenshot_index is not None else None)
+
     def _remove_state_message_by_index(self, remove_ind=-1) -> None:
         """Remove the last state message from history based on the provided index."""
         i = len(self.history.messages) - 1
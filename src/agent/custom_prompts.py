@@ -89,7 +89,7 @@ class CustomSystemPrompt(SystemPrompt):
 
 
 class CustomAgentMessagePrompt(AgentMessagePrompt):
-    def __init__(self, *args, actions: Optional[List[ActionModel]] = None, **kwargs):
+    def __init__(self, *args, actions: Optional[List[ActionModel]] = None, prompt_cache_layout: bool = False, **kwargs):
         # Remove any 'include_attributes' from kwargs.
         kwargs.pop('include_attributes', None)
         # Initialize with include_attributes explicitly set to an empty list.
@@ -102,14 +102,14 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
         )
         self.actions = actions
         self.include_attributes = []  # Force an empty list
+        # Keep volatile lines (step counter, clock) at the end so the message head stays byte-stable
+        self.prompt_cache_layout = prompt_cache_layout
+        # Set by the message manager in DOM-diff mode to replace the full element list
+        self.elements_diff: Optional[str] = None
+        # Set by the message manager when the screenshot is sent separately or left out
+        self.screenshot_note: Optional[str] = None
 
-    def get_user_message(self) -> HumanMessage:
-        if self.step_info:
-            step_info_description = f"Current step: {self.step_info.step_number}/{self.step_info.max_steps}\n"
-        else:
-            step_info_description = ""
-        time_str = datetime.now().strftime("%Y-%m-%d %H:%M")
-        step_info_description += f"Current date and time: {time_str}"
+    def elements_description(self) -> str:
         elements_text = self.state.element_tree.clickable_elements_to_string(include_attributes=self.include_attributes)
         if elements_text:
             if self.state.pixels_above:
@@ -122,6 +122,19 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
                 elements_text = f"{elements_text}\n[End of page]"
         else:
             elements_text = "empty page"
+        return elements_text
+
+    def get_user_message(self) -> HumanMessage:
+        if self.step_info:
+            step_info_description = f"Current step: {self.step_info.step_number}/{self.step_info.max_steps}\n"
+        else:
+            step_info_description = ""
+        time_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+        step_info_description += f"Current date and time: {time_str}"
+        volatile_description = ""
+        if self.prompt_cache_layout:
+            volatile_description, step_info_description = step_info_description, ""
+        elements_text = self.elements_diff if self.elements_diff is not None else self.elements_description()
         state_description = f"""
 {step_info_description}
 1. Task: {self.step_info.task}.
@@ -157,7 +170,11 @@ class CustomAgentMessagePrompt(AgentMessagePrompt):
                         error_list = flatten_and_stringify(res.error)
                         error_str = ", ".join(error_list)[-self.max_error_length:]
                         state_description += f"Error of previous action {i+1}/{len(self.result)}: {error_str}\n"
-        if self.state.screenshot:
+        if self.screenshot_note:
+            state_description += f"\n{self.screenshot_note}\n"
+        if volatile_description:
+            state_description += f"\n{volatile_description}\n"
+        if self.state.screenshot and not self.screenshot_note:
             return HumanMessage(
                 content=[
                     {"type": "text", "text": state_description},
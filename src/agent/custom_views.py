@@ -1,10 +1,16 @@
+import json
+import os
+from collections import Counter
 from dataclasses import dataclass
-from typing import Type
+from pathlib import Path
+from typing import Any, Dict, Optional, Type
 
-from browser_use.agent.views import AgentOutput
+from browser_use.agent.views import AgentHistory, AgentHistoryList, AgentOutput
 from browser_use.controller.registry.views import ActionModel
 from pydantic import BaseModel, ConfigDict, Field, create_model
 
+from src.utils.screenshot_store import ScreenshotStore, StoredBrowserStateHistory
+
 
 @dataclass
 class CustomAgentStepInfo:
@@ -52,3 +58,75 @@ class CustomAgentOutput(AgentOutput):
             ),
             __module__=CustomAgentOutput.__module__,
         )
+
+
+class CustomAgentHistory(AgentHistory):
+    """History item that also records which model produced the step, its token usage and phase timings"""
+
+    routing: Optional[Dict[str, Any]] = None
+    token_usage: Optional[Dict[str, int]] = None
+    spans: Optional[list[Dict[str, Any]]] = None
+
+    def model_dump(self, **kwargs) -> Dict[str, Any]:
+        data = super().model_dump(**kwargs)
+        if self.routing is not None:
+            data["routing"] = self.routing
+        if self.token_usage is not None:
+            data["token_usage"] = self.token_usage
+        if self.spans is not None:
+            data["spans"] = self.spans
+        return data
+
+
+class CustomAgentHistoryList(AgentHistoryList):
+    """List of agent history items with per-model step counts"""
+
+    history: list[CustomAgentHistory]
+
+    def model_step_counts(self) -> Dict[str, int]:
+        return dict(Counter(h.routing["model"] for h in self.history if h.routing))
+
+    def routing_decisions(self) -> list[Dict[str, Any]]:
+        return [h.routing for h in self.history if h.routing]
+
+    @classmethod
+    def load_from_file(cls, filepath: str | Path, output_model: Type[AgentOutput]) -> "CustomAgentHistoryList":
+        """Load history, reconnecting screenshot references to their store"""
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.load_from_dict(data, output_model)
+
+    @classmethod
+    def load_from_dict(cls, data: Dict[str, Any], output_model: Type[AgentOutput]) -> "CustomAgentHistoryList":
+        """Rebuild history from model_dump() output"""
+        history_data = []
+        for h in data["history"]:
+            h = dict(h)
+            if isinstance(h["model_output"], dict):
+                h["model_output"] = output_model.model_validate(h["model_output"])
+            else:
+                h["model_output"] = None
+            if "interacted_element" not in h["state"]:
+                h["state"] = {**h["state"], "interacted_element": None}
+            history_data.append(h)
+        history = cls.model_validate({"history": history_data})
+        stores: Dict[str, ScreenshotStore] = {}
+        for item, raw in zip(history.history, data["history"]):
+            ref, path = raw["state"].get("screenshot_ref"), raw["state"].get("screenshot_path")
+            if not ref or not path:
+                continue
+            root = os.path.dirname(path)
+            store = stores.setdefault(root, ScreenshotStore(root))
+            state = item.state
+            item.state = StoredBrowserStateHistory(
+                url=state.url, title=state.title, tabs=state.tabs, interacted_element=state.interacted_element,
+                store=store, screenshot_ref=ref,
+            )
+        return history
+
+    def model_dump(self, **kwargs) -> Dict[str, Any]:
+        data = super().model_dump(**kwargs)
+        model_steps = self.model_step_counts()
+        if model_steps:
+            data["model_steps"] = model_steps
+        return data
@@ -0,0 +1,119 @@
+import logging
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+LOW_CONFIDENCE_MARKERS = (
+    "not sure",
+    "unsure",
+    "uncertain",
+    "unclear",
+    "i don't know",
+    "i do not know",
+    "cannot determine",
+    "can't determine",
+    "confused",
+)
+
+
+def llm_name(llm: BaseChatModel) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or llm.__class__.__name__
+
+
+@dataclass
+class RoutingDecision:
+    """Which model produced a step and why it was (or was not) escalated."""
+    step: int
+    model: str
+    tier: str  # "small" or "large"
+    reason: str
+    attempts: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ModelRouter:
+    """
+    Sends agent steps to a small, fast model and escalates to the large model when the small one
+    fails to produce a parseable response, reports repeated failed actions or sounds unsure.
+
+    After an escalation caused by repeated failures the large model keeps the next
+    `escalation_steps` steps before routing falls back to the small model.
+    """
+
+    def __init__(
+            self,
+            small_llm: BaseChatModel,
+            large_llm: BaseChatModel,
+            failure_threshold: int = 2,
+            escalation_steps: int = 3,
+    ):
+        self.small_llm = small_llm
+        self.large_llm = large_llm
+        self.failure_threshold = failure_threshold
+        self.escalation_steps = escalation_steps
+        self.consecutive_failures = 0
+        self._large_steps_left = 0
+        self._pending_reason: Optional[str] = None
+        self.decisions: List[RoutingDecision] = []
+
+    def select(self, step: int) -> RoutingDecision:
+        if self._large_steps_left > 0:
+            self._large_steps_left -= 1
+            return RoutingDecision(step=step, model=llm_name(self.large_llm), tier="large",
+                                   reason=self._pending_reason or "escalated")
+        self._pending_reason = None
+        return RoutingDecision(step=step, model=llm_name(self.small_llm), tier="small", reason="default")
+
+    def llm_for(self, decision: RoutingDecision) -> BaseChatModel:
+        return self.large_llm if decision.tier == "large" else self.small_llm
+
+    def escalate(self, decision: RoutingDecision, reason: str) -> None:
+        """Re-route the current step to the large model."""
+        logger.info(f"🔀 Escalating step {decision.step} from {decision.model} to {llm_name(self.large_llm)}: {reason}")
+        decision.attempts.append({"model": decision.model, "tier": decision.tier, "reason": reason})
+        decision.model = llm_name(self.large_llm)
+        decision.tier = "large"
+        decision.reason = reason
+
+    def escalation_reason(self, model_output: Any) -> Optional[str]:
+        """Inspect a parsed response; returns why the step should go to the large model, if it should."""
+        state = model_output.current_state
+        if "Failed" in state.prev_action_evaluation:
+            self.consecutive_failures += 1
+        else:
+            self.consecutive_failures = 0
+        if self.consecutive_failures >= self.failure_threshold:
+            return f"{self.consecutive_failures} consecutive failed evaluations"
+        if not model_output.action:
+            return "no actions returned"
+        text = f"{state.prev_action_evaluation} {state.thought}".lower()
+        for marker in LOW_CONFIDENCE_MARKERS:
+            if marker in text:
+                return f"low confidence ({marker!r})"
+        return None
+
+    def record(self, decision: RoutingDecision) -> None:
+        if decision.attempts and "failed evaluations" in decision.reason:
+            # keep the large model for a few steps instead of bouncing back immediately
+            self._large_steps_left = self.escalation_steps
+            self._pending_reason = decision.reason
+            self.consecutive_failures = 0
+        self.decisions.append(decision)
+
+    def step_counts(self) -> Dict[str, int]:
+        return dict(Counter(decision.model for decision in self.decisions))
+
+    def stats(self) -> Dict[str, Any]:
+        escalations = sum(1 for decision in self.decisions if decision.attempts)
+        return {
+            "steps": len(self.decisions),
+            "escalations": escalations,
+            "escalation_rate": round(escalations / len(self.decisions), 3) if self.decisions else 0.0,
+            "model_steps": self.step_counts(),
+        }
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of `values` (0 < q <= 100)."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class StepSpans:
+    """
+    Phase timings of one agent step. A span is a dict with its name, start offset (when known) and
+    duration in seconds plus any attributes; a dotted name ("get_state.dom") breaks down the span
+    named by its prefix.
+    """
+
+    def __init__(self, step: int):
+        self.step = step
+        self.spans: List[Dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """Time the block; the yielded span takes attributes known only later (e.g. ttft)."""
+        start = time.perf_counter()
+        entry = {"name": name, "start": round(start - self._start, 4), "seconds": 0.0, **attributes}
+        self.spans.append(entry)
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = round(time.perf_counter() - start, 4)
+
+    def add(self, name: str, seconds: float, start: Optional[float] = None, **attributes: Any) -> None:
+        """Add a span timed elsewhere; `start` is its perf_counter start."""
+        entry: Dict[str, Any] = {"name": name}
+        if start is not None:
+            entry["start"] = round(start - self._start, 4)
+        entry["seconds"] = round(seconds, 4)
+        entry.update(attributes)
+        self.spans.append(entry)
+
+    def seconds(self) -> float:
+        return time.perf_counter() - self._start
+
+
+class SpanRecorder:
+    """Collects the spans of a run's steps, appends each step as a JSON line to `path` and summarizes them."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.durations: Dict[str, List[float]] = {}
+
+    def record(self, step_spans: StepSpans) -> None:
+        for span in step_spans.spans:
+            self.durations.setdefault(span["name"], []).append(span["seconds"])
+        self.durations.setdefault("step", []).append(round(step_spans.seconds(), 4))
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"step": step_spans.step, "seconds": round(step_spans.seconds(), 4),
+                                    "spans": step_spans.spans}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write step spans to {self.path}: {e}")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95/total seconds and count per span name."""
+        return {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "total": round(sum(values), 4),
+            }
+            for name, values in self.durations.items()
+        }
@@ -0,0 +1,269 @@
+import copy
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Type
+
+from json_repair import repair_json
+from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_ollama import ChatOllama
+from pydantic import BaseModel
+
+from src.llm.gemini_llm import GeminiLLM
+from src.utils.llm import DeepSeekR1ChatOllama
+from src.utils.llm_circuit_breaker import CircuitBreakerChatModel, unwrap_llm
+from src.utils.llm_key_scheduling import KeyScheduledChatModel
+from src.utils.prompt_cache import provider_family
+
+logger = logging.getLogger(__name__)
+
+# Native constrained-decoding modes; None means the response is free text repaired with json_repair
+NATIVE_METHODS = ("json_schema", "function_calling", "gemini", "ollama_format")
+
+
+def structured_output_method(llm: BaseChatModel, tool_calling_method: Optional[str] = "auto") -> Optional[str]:
+    """
+    Constrained-decoding mode for `llm`. "auto" picks the provider's native JSON-schema mode;
+    "json_schema"/"function_calling" force an OpenAI or Anthropic mode; None disables it.
+    """
+    if tool_calling_method is None or tool_calling_method in ("none", "raw"):
+        return None
+    if isinstance(llm, KeyScheduledChatModel):
+        # every key serves the same provider and model
+        return structured_output_method(llm.primary, tool_calling_method)
+    if isinstance(llm, CircuitBreakerChatModel):
+        method = structured_output_method(llm.primary, tool_calling_method)
+        if llm.fallback is not None and (
+                structured_output_method(llm.fallback, tool_calling_method) != method
+                or provider_label(llm.fallback) != provider_label(llm.primary)):
+            # the same kwargs go to the fallback, which must accept them
+            return None
+        return method
+    family = provider_family(llm)
+    if isinstance(llm, ChatAnthropic):
+        return "function_calling"
+    if family in ("openai", "azure_openai", "openai_compatible"):
+        if tool_calling_method in ("json_schema", "function_calling"):
+            return tool_calling_method
+        # OpenAI-compatible endpoints (DeepSeek, Qwen, ...) rarely support json_schema
+        return "json_schema" if family != "openai_compatible" else None
+    if isinstance(llm, (ChatGoogleGenerativeAI, GeminiLLM)):
+        return "gemini"
+    if isinstance(llm, ChatOllama) and not isinstance(llm, DeepSeekR1ChatOllama):
+        # deepseek-r1 has to think before it answers, which a format constraint does not allow
+        return "ollama_format"
+    return None
+
+
+def provider_label(llm: BaseChatModel) -> str:
+    llm = unwrap_llm(llm)
+    family = provider_family(llm)
+    if family != "other":
+        return family
+    if isinstance(llm, GeminiLLM):
+        return "google"
+    if isinstance(llm, ChatOllama):
+        return "ollama"
+    return llm.__class__.__name__
+
+
+def _resolve(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in schema:
+        return _resolve(defs[schema["$ref"].split("/")[-1]], defs)
+    return schema
+
+
+def _nullable_branch(schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The non-null branch of an `Optional[X]` anyOf, if that is what `schema` is."""
+    branches = schema.get("anyOf")
+    if not branches or len(branches) != 2:
+        return None
+    others = [branch for branch in branches if branch.get("type") != "null"]
+    return others[0] if len(others) == 1 else None
+
+
+def _one_of_actions(action_model: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    An ActionModel (every action an optional key) as an anyOf with one branch per action, so a
+    strict schema asks for the chosen action only instead of all of them written out as null.
+    """
+    branches = [
+        {"type": "object", "properties": {name: _nullable_branch(params) or params}, "required": [name]}
+        for name, params in action_model.get("properties", {}).items()
+    ]
+    one_of: Dict[str, Any] = {"anyOf": branches}
+    if action_model.get("description"):
+        one_of["description"] = action_model["description"]
+    return one_of
+
+
+def strict_json_schema(schema: Dict[str, Any], action_model: str = "ActionModel") -> Dict[str, Any]:
+    """
+    OpenAI strict-mode schema: every object closed and fully required (optional fields stay
+    nullable), no defaults. The `action_model` definition becomes one branch per action.
+    """
+    schema = copy.deepcopy(schema)
+    defs = schema.get("$defs", {})
+    if action_model in defs:
+        defs[action_model] = _one_of_actions(defs[action_model])
+
+    def visit(node: Any) -> None:
+        if isinstance(node, dict):
+            node.pop("default", None)
+            if node.get("type") == "object" or "properties" in node:
+                node.setdefault("properties", {})
+                node["additionalProperties"] = False
+                node["required"] = list(node["properties"])
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for item in node:
+                visit(item)
+
+    visit(schema)
+    return schema
+
+
+def gemini_schema(schema: Dict[str, Any], gapic: bool = False) -> Dict[str, Any]:
+    """
+    Gemini response_schema (OpenAPI subset): references inlined, Optional[X] as nullable X.
+    `gapic` emits the field names of the generativelanguage protos used by ChatGoogleGenerativeAI;
+    otherwise google-genai's Schema, which also keeps the property order.
+    """
+    defs = schema.get("$defs", {})
+    type_key = "type_" if gapic else "type"
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        node = _resolve(node, defs)
+        nullable = False
+        branch = _nullable_branch(node)
+        if branch is not None:
+            description = node.get("description")
+            node = dict(_resolve(branch, defs), **({"description": description} if description else {}))
+            nullable = True
+        converted: Dict[str, Any] = {}
+        if "enum" in node:
+            converted[type_key] = "STRING"
+            converted["enum"] = [str(value) for value in node["enum"]]
+        elif node.get("type") == "object" or "properties" in node:
+            # Gemini rejects OBJECT schemas without properties, so parameterless actions get an optional flag
+            properties = {name: convert(value) for name, value in node.get("properties", {}).items()}
+            converted[type_key] = "OBJECT"
+            converted["properties"] = properties or {"confirm": {type_key: "BOOLEAN", "nullable": True}}
+            if not gapic:
+                converted["property_ordering"] = list(converted["properties"])
+            if node.get("required"):
+                converted["required"] = list(node["required"])
+        elif node.get("type") == "array":
+            converted[type_key] = "ARRAY"
+            converted["items"] = convert(node.get("items", {"type": "string"}))
+        else:
+            converted[type_key] = {"integer": "INTEGER", "number": "NUMBER", "boolean": "BOOLEAN"}.get(
+                node.get("type"), "STRING")
+        if node.get("description"):
+            converted["description"] = node["description"]
+        if nullable:
+            converted["nullable"] = True
+        return converted
+
+    return convert(schema)
+
+
+def structured_output_kwargs(llm: BaseChatModel, method: Optional[str], output_model: Type[BaseModel]) -> Dict[str, Any]:
+    """Invoke kwargs that constrain `llm` to the JSON schema of `output_model`."""
+    if method is None:
+        return {}
+    llm = unwrap_llm(llm)
+    schema = output_model.model_json_schema()
+    if method == "json_schema":
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "agent_output", "schema": strict_json_schema(schema), "strict": True},
+        }}
+    if method == "function_calling":
+        tool = convert_to_openai_tool(output_model)
+        name = tool["function"]["name"]
+        if isinstance(llm, ChatAnthropic):
+            function = tool["function"]
+            return {
+                "tools": [{"name": name, "description": function.get("description") or "Agent response",
+                           "input_schema": function["parameters"]}],
+                "tool_choice": {"type": "tool", "name": name},
+            }
+        return {"tools": [tool], "tool_choice": {"type": "function", "function": {"name": name}}}
+    if method == "gemini":
+        if isinstance(llm, GeminiLLM):
+            return {"response_mime_type": "application/json", "response_schema": gemini_schema(schema)}
+        return {"generation_config": {"response_mime_type": "application/json",
+                                      "response_schema": gemini_schema(schema, gapic=True)}}
+    if method == "ollama_format":
+        return {"format": schema}
+    raise ValueError(f"Unsupported structured output method: {method}")
+
+
+def response_json(ai_message: AIMessage, method: Optional[str]) -> tuple[Dict[str, Any], bool]:
+    """
+    Decoded agent response and whether it needed repair. Tool calls are read from their arguments;
+    constrained text is decoded as-is first, free text goes through fence stripping and json_repair.
+    """
+    if ai_message.tool_calls:
+        return ai_message.tool_calls[0]["args"], False
+    content = ai_message.content
+    if isinstance(content, list):
+        content = "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    if method is not None:
+        try:
+            return json.loads(content), False
+        except json.JSONDecodeError:
+            logger.debug(f"Constrained {method} response is not valid JSON, repairing it")
+    content = content.replace("```json", "").replace("```", "")
+    return json.loads(repair_json(content)), True
+
+
+def drop_null_actions(parsed_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the actions the model chose; schema-constrained modes may write the others as null."""
+    actions = parsed_json.get("action")
+    if isinstance(actions, list):
+        parsed_json["action"] = [
+            {name: params for name, params in action.items() if params is not None}
+            if isinstance(action, dict) else action
+            for action in actions
+        ]
+    return parsed_json
+
+
+class ParseStats:
+    """Parse-failure rate, repair rate and parse time of agent responses, per provider and mode."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, provider: str, method: Optional[str], seconds: float, ok: bool, repaired: bool = False) -> None:
+        key = f"{provider}/{method or 'repair'}"
+        with self._lock:
+            stats = self._stats.setdefault(
+                key, {"responses": 0, "failures": 0, "repaired": 0, "parse_seconds": 0.0, "max_parse_seconds": 0.0})
+            stats["responses"] += 1
+            stats["failures"] += 0 if ok else 1
+            stats["repaired"] += 1 if repaired else 0
+            stats["parse_seconds"] += seconds
+            stats["max_parse_seconds"] = max(stats["max_parse_seconds"], seconds)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                key: {
+                    "responses": int(stats["responses"]),
+                    "failures": int(stats["failures"]),
+                    "failure_rate": round(stats["failures"] / stats["responses"], 3),
+                    "repaired": int(stats["repaired"]),
+                    "avg_parse_ms": round(1000 * stats["parse_seconds"] / stats["responses"], 3),
+                    "max_parse_ms": round(1000 * stats["max_parse_seconds"], 3),
+                }
+                for key, stats in self._stats.items()
+            }
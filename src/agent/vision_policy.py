@@ -0,0 +1,86 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from browser_use.agent.views import ActionModel, ActionResult
+from browser_use.browser.views import BrowserState
+from browser_use.dom.views import DOMElementNode
+
+logger = logging.getLogger(__name__)
+
+VISION_MODES = ("always", "on_demand")
+VISUAL_TAGS = {"canvas", "img", "svg", "video", "picture"}
+
+
+def visual_elements(element_tree: DOMElementNode) -> Dict[str, int]:
+    """Visible canvas and image-like elements of the tree, by tag."""
+    counts: Dict[str, int] = {}
+    stack: List[Any] = [element_tree]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, DOMElementNode):
+            continue
+        if node.is_visible and node.tag_name in VISUAL_TAGS:
+            counts[node.tag_name] = counts.get(node.tag_name, 0) + 1
+        stack.extend(node.children)
+    return counts
+
+
+class VisionPolicy:
+    """
+    Decides per step whether the agent needs a screenshot: after a failed action, when the model
+    asked for one with the `look` action, on pages with fewer than `few_elements` clickable elements
+    that have a canvas or more images than clickable elements, and every `every_n_steps` steps
+    (0 disables, the first step counts). Tracks capture time and image tokens per run.
+    """
+
+    def __init__(self, every_n_steps: Optional[int] = None, few_elements: Optional[int] = None):
+        self.every_n_steps = every_n_steps if every_n_steps is not None else int(
+            os.getenv("VISION_EVERY_N_STEPS", "5"))
+        self.few_elements = few_elements if few_elements is not None else int(os.getenv("VISION_FEW_ELEMENTS", "10"))
+        self.steps = 0
+        self.reasons: Dict[str, int] = {}
+        self.capture_seconds = 0.0
+        self.image_tokens = 0
+
+    def reason(
+            self,
+            state: BrowserState,
+            last_actions: Optional[List[ActionModel]],
+            last_result: Optional[List[ActionResult]],
+            step: int,
+    ) -> Optional[str]:
+        """Why this step needs a screenshot, or None."""
+        if last_result and any(result.error for result in last_result):
+            return "failed_action"
+        if last_actions and any("look" in action.model_dump(exclude_unset=True) for action in last_actions):
+            return "look"
+        clickable = len(state.selector_map)
+        if clickable < self.few_elements:
+            visuals = visual_elements(state.element_tree)
+            if visuals.get("canvas") or sum(visuals.values()) > clickable:
+                return "visual_page"
+        if self.every_n_steps > 0 and (step - 1) % self.every_n_steps == 0:
+            return "periodic"
+        return None
+
+    def record(self, reason: Optional[str], seconds: float = 0.0, image_tokens: int = 0) -> None:
+        self.steps += 1
+        if reason is None:
+            return
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        self.capture_seconds += seconds
+        self.image_tokens += image_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        screenshots = sum(self.reasons.values())
+        average_tokens = self.image_tokens / screenshots if screenshots else 0
+        return {
+            "steps": self.steps,
+            "screenshots": screenshots,
+            "reasons": dict(self.reasons),
+            "capture_seconds": round(self.capture_seconds, 3),
+            "image_tokens": self.image_tokens,
+            # what the skipped steps would have cost at the average screenshot size
+            "image_tokens_saved": round(average_tokens * (self.steps - screenshots)),
+        }
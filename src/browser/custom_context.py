@@ -1,14 +1,44 @@
+import asyncio
 import json
 import logging
 import os
+import time
+from typing import Any, Dict, Optional, Tuple
 
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.browser.views import BrowserState
 from playwright.async_api import Browser as PlaywrightBrowser
 from playwright.async_api import BrowserContext as PlaywrightBrowserContext
 
+from src.utils.dom_diff import StableElementIds
+
 logger = logging.getLogger(__name__)
 
+# Installs a MutationObserver once per document and returns its version: a per-document token, the number of
+# DOM mutations seen so far and the scroll position. Mutations made by browser-use's own highlighting are ignored.
+DOM_VERSION_JS = """
+() => {
+    const inHighlight = (node) => {
+        const element = node && (node.nodeType === 1 ? node : node.parentElement);
+        return !!(element && element.closest && element.closest('#playwright-highlight-container'));
+    };
+    if (!window.__agentDomVersion) {
+        const version = {token: Math.random().toString(36).slice(2), mutations: 0};
+        new MutationObserver((records) => {
+            for (const record of records) {
+                if (record.type === 'attributes' && record.attributeName === 'browser-user-highlight-id') continue;
+                if (inHighlight(record.target)) continue;
+                if (record.type === 'childList' && [...record.addedNodes, ...record.removedNodes].every(inHighlight)) continue;
+                version.mutations++;
+            }
+        }).observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+        window.__agentDomVersion = version;
+    }
+    return [window.__agentDomVersion.token, window.__agentDomVersion.mutations, window.scrollX, window.scrollY];
+}
+"""
+
 
 class CustomBrowserContext(BrowserContext):
     def __init__(
@@ -16,4 +46,154 @@ class CustomBrowserContext(BrowserContext):
         browser: "Browser",
         config: BrowserContextConfig = BrowserContextConfig()
     ):
-        super(CustomBrowserContext, self).__init__(browser=browser, config=config)
\ No newline at end of file
+        super(CustomBrowserContext, self).__init__(browser=browser, config=config)
+        # 0 disables the snapshot cache
+        self.state_cache_ttl = float(os.getenv("BROWSER_STATE_CACHE_TTL", "5"))
+        self.state_cache_hits = 0
+        self.state_cache_misses = 0
+        self._state_generation = 0
+        self._state_cache: Optional[Tuple[tuple, float, BrowserState]] = None
+        self.element_ids: Optional[StableElementIds] = None
+        # seconds spent in the phases of the last get_state
+        self.last_state_timings: Dict[str, Any] = {}
+        self._screenshot_seconds = 0.0
+
+    def use_stable_element_ids(self, enabled: bool = True) -> None:
+        """Keep an element's highlight index across captures of the same page (screenshot labels keep the page's own)."""
+        self.element_ids = StableElementIds() if enabled else None
+        self.invalidate_state()
+
+    def invalidate_state(self) -> None:
+        """Drop the cached state snapshot so the next get_state captures the page again."""
+        self._state_generation += 1
+        self._state_cache = None
+
+    def state_cache_stats(self) -> Dict[str, Any]:
+        lookups = self.state_cache_hits + self.state_cache_misses
+        return {
+            "hits": self.state_cache_hits,
+            "misses": self.state_cache_misses,
+            "hit_ratio": round(self.state_cache_hits / lookups, 3) if lookups else 0.0,
+        }
+
+    async def _state_key(self, use_vision: bool) -> Optional[tuple]:
+        """What a snapshot depends on; None if the page cannot be probed, which never matches."""
+        try:
+            session = await self.get_session()
+            page = session.current_page
+            token, mutations, scroll_x, scroll_y = await page.evaluate(DOM_VERSION_JS)
+            tabs = tuple(tab.url for tab in session.context.pages)
+        except Exception as e:
+            logger.debug(f"Could not read the DOM version: {e}")
+            return None
+        return self._state_generation, id(page), page.url, tabs, token, mutations, scroll_x, scroll_y, use_vision
+
+    async def get_state(self, use_vision: bool = False) -> BrowserState:
+        """
+        Current browser state. A snapshot is reused while the page, its DOM mutation counter, scroll
+        position and tabs are unchanged and no action ran since, for at most `state_cache_ttl` seconds.
+        Changes inside iframes are not observed and only expire with the TTL.
+        """
+        session = await self.get_session()
+        if self.state_cache_ttl > 0 and self._state_cache is not None:
+            key, captured_at, state = self._state_cache
+            if time.monotonic() - captured_at <= self.state_cache_ttl and await self._state_key(use_vision) == key:
+                self.state_cache_hits += 1
+                session.cached_state = state
+                self.last_state_timings = {"cache_hit": True}
+                return state
+        self.state_cache_misses += 1
+        self._state_cache = None
+
+        start = time.perf_counter()
+        await self._wait_for_page_and_frames_load()
+        page_load = time.perf_counter() - start
+        key = await self._state_key(use_vision) if self.state_cache_ttl > 0 else None
+        previous = getattr(self, "current_state", None)
+        self._screenshot_seconds = 0.0
+        start = time.perf_counter()
+        state = await self._update_state(use_vision=use_vision)
+        self.last_state_timings = {
+            "cache_hit": False,
+            "page_load": page_load,
+            "dom": time.perf_counter() - start - self._screenshot_seconds,
+            "screenshot": self._screenshot_seconds,
+        }
+        session = await self.get_session()
+        if self.element_ids is not None and state is not previous:
+            self.element_ids.assign(state)
+        session.cached_state = state
+        # only keep a fresh capture that saw no change while it ran (_update_state returns the old state on failure)
+        if key is not None and state is not previous and await self._state_key(use_vision) == key:
+            self._state_cache = (key, time.monotonic(), state)
+
+        if self.config.cookies_file:
+            asyncio.create_task(self.save_cookies())
+        return state
+
+    async def take_screenshot(self, full_page: bool = False) -> str:
+        start = time.perf_counter()
+        try:
+            return await super().take_screenshot(full_page)
+        finally:
+            self._screenshot_seconds += time.perf_counter() - start
+
+    async def navigate_to(self, url: str):
+        try:
+            await super().navigate_to(url)
+        finally:
+            self.invalidate_state()
+
+    async def refresh_page(self):
+        try:
+            await super().refresh_page()
+        finally:
+            self.invalidate_state()
+
+    async def go_back(self):
+        try:
+            await super().go_back()
+        finally:
+            self.invalidate_state()
+
+    async def go_forward(self):
+        try:
+            await super().go_forward()
+        finally:
+            self.invalidate_state()
+
+    async def close_current_tab(self):
+        try:
+            await super().close_current_tab()
+        finally:
+            self.invalidate_state()
+
+    async def switch_to_tab(self, page_id: int) -> None:
+        try:
+            await super().switch_to_tab(page_id)
+        finally:
+            self.invalidate_state()
+
+    async def create_new_tab(self, url: Optional[str] = None) -> None:
+        try:
+            await super().create_new_tab(url)
+        finally:
+            self.invalidate_state()
+
+    async def execute_javascript(self, script: str):
+        try:
+            return await super().execute_javascript(script)
+        finally:
+            self.invalidate_state()
+
+    async def _click_element_node(self, element_node):
+        try:
+            return await super()._click_element_node(element_node)
+        finally:
+            self.invalidate_state()
+
+    async def _input_text_element_node(self, element_node, text: str):
+        try:
+            return await super()._input_text_element_node(element_node, text)
+        finally:
+            self.invalidate_state()
@@ -5,6 +5,7 @@ from typing import Optional, Type
 from pydantic import BaseModel
 from browser_use.agent.views import ActionResult
 from browser_use.browser.context import BrowserContext
+from browser_use.controller.registry.views import ActionModel
 from browser_use.controller.service import Controller, DoneAction
 from main_content_extractor import MainContentExtractor
 from browser_use.controller.views import (
@@ -20,16 +21,53 @@ from browser_use.controller.views import (
     SwitchTabAction,
 )
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 
+def register_look_action(controller: Controller):
+    """
+    Register `look` on any controller, once. It only has an effect with on-demand vision, whose
+    agents register it themselves.
+    """
+    if "look" in controller.registry.registry.actions:
+        return
+
+    @controller.registry.action(
+        "Look at a screenshot of the page in the next step, when the element list is not enough to understand it")
+    def look():
+        return ActionResult(extracted_content="Requested a screenshot of the page", include_in_memory=True)
+
+
 class CustomController(Controller):
     def __init__(self, exclude_actions: list[str] = [],
-                 output_model: Optional[Type[BaseModel]] = None
+                 output_model: Optional[Type[BaseModel]] = None,
+                 look_action: bool = False,
                  ):
         super().__init__(exclude_actions=exclude_actions, output_model=output_model)
         self._register_custom_actions()
+        if look_action:
+            self.register_look_action()
+        # (action name, perf_counter start, seconds, error) of each executed action, drained by the agent per step
+        self.action_timings: list[tuple[str, float, float, Optional[str]]] = []
+
+    async def act(self, action: ActionModel, browser_context: BrowserContext) -> ActionResult:
+        start = time.perf_counter()
+        error = None
+        try:
+            result = await super().act(action, browser_context)
+            error = result.error
+            return result
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            name = next(iter(action.model_dump(exclude_unset=True)), "unknown")
+            self.action_timings.append((name, start, time.perf_counter() - start, error))
+
+    def register_look_action(self):
+        register_look_action(self)
 
     def _register_custom_actions(self):
         """Register all custom browser actions"""
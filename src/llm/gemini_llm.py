@@ -1,22 +1,215 @@
 # src/llm/gemini_llm.py
+import base64
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
 from google import genai
+from google.genai import types
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[Tuple[str, Optional[float]], genai.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str, timeout: Optional[float] = None) -> genai.Client:
+    """
+    One client (and connection pool) per api key and request timeout, shared by every GeminiLLM
+    instance. The timeout (seconds) bounds each HTTP request inside the SDK.
+    """
+    key = (hashlib.sha256(api_key.encode("utf-8")).hexdigest(), timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_options = types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None
+            client = genai.Client(api_key=api_key, http_options=http_options)
+            _clients[key] = client
+        return client
+
+
+def _to_parts(content: Any) -> List[Dict[str, Any]]:
+    if isinstance(content, str):
+        return [{"text": content}] if content else []
+    parts = []
+    for item in content:
+        if isinstance(item, str):
+            parts.append({"text": item})
+        elif item.get("type") == "text" or "text" in item:
+            parts.append({"text": item.get("text", "")})
+        elif item.get("type") == "image_url":
+            image_url = item["image_url"]
+            url = image_url.get("url", "") if isinstance(image_url, dict) else image_url
+            if url.startswith("data:"):
+                header, data = url.split(",", 1)
+                mime_type = header[len("data:"):].split(";")[0] or "image/png"
+                parts.append({"inline_data": {"mime_type": mime_type, "data": base64.b64decode(data)}})
+            else:
+                parts.append({"file_data": {"file_uri": url, "mime_type": "image/png"}})
+    return parts
+
+
+def to_gemini_contents(messages: List[BaseMessage]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Convert chat messages to a system instruction plus role-preserving Gemini `contents`.
+    Consecutive messages of the same role are merged, as Gemini expects alternating turns.
+    """
+    system_parts = []
+    contents: List[Dict[str, Any]] = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            system_parts.extend(part["text"] for part in _to_parts(message.content) if "text" in part)
+            continue
+        role = "model" if isinstance(message, AIMessage) else "user"
+        parts = _to_parts(message.content)
+        if not parts:
+            continue
+        if contents and contents[-1]["role"] == role:
+            contents[-1]["parts"].extend(parts)
+        else:
+            contents.append({"role": role, "parts": parts})
+    return ("\n".join(system_parts) or None), contents
+
+
+def _usage_metadata(response: Any) -> Optional[UsageMetadata]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    input_tokens = usage.prompt_token_count or 0
+    output_tokens = usage.candidates_token_count or 0
+    return UsageMetadata(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        total_tokens=usage.total_token_count or input_tokens + output_tokens,
+        input_token_details={"cache_read": usage.cached_content_token_count or 0},
+    )
+
+
+def _response_text(response: Any) -> str:
+    try:
+        return response.text or ""
+    except (ValueError, AttributeError):
+        # blocked or empty candidates
+        return ""
 
-class GeminiLLM:
-    def __init__(self, api_key: str, model_name: str):
-        self.client = genai.Client(api_key=api_key)
-        self.model_name = model_name
-
-    def invoke(self, messages):
-        """
-        A simple implementation that concatenates the contents of all messages and sends them to Gemini.
-        You may need to adjust this based on how your agent expects the response.
-        """
-        # Assume messages is a list of objects with a .content attribute.
-        prompt = "\n".join(m.content for m in messages if hasattr(m, "content"))
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=prompt
+
+class GeminiLLM(BaseChatModel):
+    """
+    Chat model on the google-genai SDK, usable wherever a langchain chat model is expected
+    (e.g. as the `llm` of CustomAgent).
+
+    Messages keep their roles (system instruction + user/model turns), every request is bounded by
+    `timeout` in the SDK's HTTP client, async calls and streams use the SDK's async API, and
+    responses carry usage metadata including cached tokens.
+    """
+
+    api_key: str = Field(default_factory=lambda: os.getenv("GOOGLE_API_KEY", ""), repr=False)
+    model_name: str = "gemini-2.0-flash-exp"
+    temperature: Optional[float] = 0.0
+    max_output_tokens: Optional[int] = None
+    timeout: Optional[float] = Field(default_factory=lambda: float(os.getenv("LLM_REQUEST_TIMEOUT", "600")))
+    cached_content: Optional[str] = None
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None, **kwargs: Any):
+        # keep the old positional GeminiLLM(api_key, model_name) signature working
+        if api_key is not None:
+            kwargs["api_key"] = api_key
+        if model_name is not None:
+            kwargs["model_name"] = model_name
+        super().__init__(**kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "google-genai"
+
+    @property
+    def client(self) -> genai.Client:
+        return get_client(self.api_key, self.timeout)
+
+    def _request(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        system_instruction, contents = to_gemini_contents(messages)
+        config = {
+            "temperature": self.temperature,
+            "max_output_tokens": self.max_output_tokens,
+            "stop_sequences": stop,
+            "system_instruction": system_instruction,
+            "cached_content": kwargs.get("cached_content") or self.cached_content,
+            "response_mime_type": kwargs.get("response_mime_type"),
+            "response_schema": kwargs.get("response_schema"),
+        }
+        return {
+            "model": self.model_name,
+            "contents": contents,
+            "config": types.GenerateContentConfig(**{k: v for k, v in config.items() if v is not None}),
+        }
+
+    def _to_result(self, response: Any) -> ChatResult:
+        message = AIMessage(
+            content=_response_text(response),
+            usage_metadata=_usage_metadata(response),
+            response_metadata={"model_name": self.model_name},
         )
-        # We return an object with a 'content' attribute for compatibility.
-        # In a production implementation, you would wrap the response properly.
-        return type("LLMResponse", (object,), {"content": response.text})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return self._to_result(self.client.models.generate_content(**self._request(messages, stop, **kwargs)))
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        response = await self.client.aio.models.generate_content(**self._request(messages, stop, **kwargs))
+        return self._to_result(response)
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        usage = None
+        for response in self.client.models.generate_content_stream(**self._request(messages, stop, **kwargs)):
+            usage = _usage_metadata(response) or usage
+            text = _response_text(response)
+            if text:
+                if run_manager:
+                    run_manager.on_llm_new_token(text)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        # usage is cumulative per chunk; report it once so merged chunks are not double counted
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    async def _astream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        usage = None
+        stream = await self.client.aio.models.generate_content_stream(**self._request(messages, stop, **kwargs))
+        async for response in stream:
+            usage = _usage_metadata(response) or usage
+            text = _response_text(response)
+            if text:
+                if run_manager:
+                    await run_manager.on_llm_new_token(text)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import shutil
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def run_dir(run_id: str) -> str:
+    """Per-run working directory for files an agent run writes as it goes."""
+    return os.path.join(os.getenv("AGENT_RUN_DIR", "./tmp/agent_runs"), run_id)
+
+
+def _last_write(path: str) -> float:
+    """When a run last wrote to its directory; appends to its files do not touch the directory itself."""
+    try:
+        with os.scandir(path) as entries:
+            return max([os.path.getmtime(path)] + [entry.stat().st_mtime for entry in entries])
+    except OSError:
+        return 0.0
+
+
+def prune_run_dirs(current: Optional[str] = None, keep: Optional[int] = None, root: Optional[str] = None) -> List[str]:
+    """
+    Remove all but the `keep` (AGENT_RUN_KEEP) most recently written run directories, counting the
+    run `current` as one of them and never removing it; 0 keeps every run. Returns the removed paths.
+    """
+    keep = keep if keep is not None else int(os.getenv("AGENT_RUN_KEEP", "50"))
+    root = root or os.getenv("AGENT_RUN_DIR", "./tmp/agent_runs")
+    if keep <= 0 or not os.path.isdir(root):
+        return []
+    with os.scandir(root) as entries:
+        runs = [entry.path for entry in entries if entry.is_dir() and entry.name != current]
+    runs.sort(key=_last_write, reverse=True)
+    removed = runs[keep - 1 if current else keep:]
+    for path in removed:
+        # another agent may be pruning the same directory
+        shutil.rmtree(path, ignore_errors=True)
+    if removed:
+        logger.info(f"Removed {len(removed)} old run director{'y' if len(removed) == 1 else 'ies'} from {root}")
+    return removed
+
+
+class ContentAccumulator:
+    """
+    Append-only text store for extracted page content. Chunks are deduplicated by content hash and
+    at most `max_memory_chars` stay in memory; older chunks are appended to `spill_path` and only
+    read back, streamed, when the whole text is materialized.
+    """
+
+    def __init__(self, spill_path: str, max_memory_chars: Optional[int] = None, read_block_chars: int = 65536):
+        self.spill_path = spill_path
+        self.max_memory_chars = max_memory_chars if max_memory_chars is not None else int(
+            os.getenv("AGENT_EXTRACTED_MEMORY_CHARS", "262144"))
+        self.read_block_chars = read_block_chars
+        self._chunks: "deque[str]" = deque()
+        self._memory_chars = 0
+        self._spilled_chars = 0
+        self._digests = set()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return self._memory_chars + self._spilled_chars
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def add(self, text: str) -> bool:
+        """Append a chunk unless the same text was added before; returns whether it was added."""
+        if not text:
+            return False
+        digest = hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest()
+        if digest in self._digests:
+            self.duplicates += 1
+            return False
+        self._digests.add(digest)
+        self._chunks.append(text)
+        self._memory_chars += len(text)
+        if self._memory_chars > self.max_memory_chars:
+            self._spill()
+        return True
+
+    def _spill(self) -> None:
+        # keep the newest chunk in memory even when it alone is over the cap
+        if len(self._chunks) < 2:
+            return
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a" if self._spilled_chars else "w", encoding="utf-8") as f:
+            while len(self._chunks) > 1 and self._memory_chars > self.max_memory_chars:
+                chunk = self._chunks.popleft()
+                f.write(chunk)
+                self._memory_chars -= len(chunk)
+                self._spilled_chars += len(chunk)
+        logger.debug(f"Spilled extracted content to {self.spill_path} ({self._spilled_chars} chars on disk)")
+
+    def iter_text(self) -> Iterator[str]:
+        """The accumulated text in order, spilled part first, in blocks."""
+        if self._spilled_chars:
+            with open(self.spill_path, "r", encoding="utf-8") as f:
+                while True:
+                    block = f.read(self.read_block_chars)
+                    if not block:
+                        break
+                    yield block
+        yield from self._chunks
+
+    def text(self) -> str:
+        return "".join(self.iter_text())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The in-memory part and dedup state; the spilled part stays in `spill_path`."""
+        return {
+            "chunks": list(self._chunks),
+            "spilled_chars": self._spilled_chars,
+            "digests": sorted(digest.hex() for digest in self._digests),
+            "duplicates": self.duplicates,
+        }
+
+    def restore(self, data: Dict[str, Any]) -> None:
+        """Continue from a to_dict() checkpoint taken with the same `spill_path`."""
+        self._chunks = deque(data["chunks"])
+        self._memory_chars = sum(len(chunk) for chunk in self._chunks)
+        self._spilled_chars = data["spilled_chars"]
+        self._digests = {bytes.fromhex(digest) for digest in data["digests"]}
+        self.duplicates = data["duplicates"]
+        if self._spilled_chars and os.path.exists(self.spill_path):
+            # chunks spilled after the checkpoint are in memory again
+            with open(self.spill_path, "r+", encoding="utf-8") as f:
+                f.read(self._spilled_chars)
+                f.truncate(f.tell())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chars": len(self),
+            "memory_chars": self._memory_chars,
+            "spilled_chars": self._spilled_chars,
+            "chunks": len(self._digests),
+            "duplicates": self.duplicates,
+        }
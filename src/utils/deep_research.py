@@ -9,8 +9,6 @@ import sys
 import logging
 import json
 import re
-import time
-import random
 from pprint import pprint
 from uuid import uuid4
 from src.utils import utils
@@ -24,38 +22,30 @@ from src.controller.custom_controller import CustomController
 from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import BrowserContextConfig
 from browser_use.browser.context import BrowserContextConfig, BrowserContextWindowSize
-import google.api_core.exceptions
 
 logger = logging.getLogger(__name__)
 
-# API Key Rotation
-import itertools
-api_keys = itertools.cycle(os.getenv("GOOGLE_API_KEYS", "").split(","))
-
-def get_api_key():
-    """Rotate through multiple API keys to avoid rate limits."""
-    return next(api_keys).strip()
-
-def invoke_with_retry(messages, retries=3):
-    """Invoke the LLM with API key rotation and retry logic."""
-    for attempt in range(retries):
-        try:
-            # Attempt to process the AI query message response
-            llm = utils.get_llm_model(
-                provider="google",
-                model_name="gemini-2.0-flash-thinking-exp-01-21",
-                temperature=1.0,
-                api_key=get_api_key()
-            )
-            return llm.invoke(messages)
-        except google.api_core.exceptions.ResourceExhausted:
-            if attempt < retries - 1:
-                wait_time = 5 * (attempt + 1)  # Exponential backoff (5s, 10s, 15s)
-                logging.warning(f"🔄 Rate limit hit (429). Retrying with new key in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                logging.error("❌ Max retries reached for 429 error.")
-                return {"error": "API rate limit exceeded. Please wait and try again later."}
+# API Key Scheduling
+from src.utils.key_scheduler import is_rate_limit_error
+from src.utils.llm_cache import get_response_cache, response_cache_enabled, with_response_cache
+
+
+async def invoke_with_retry(messages, retries=3):
+    """Invoke the LLM on the least-loaded API key, cooling down keys that hit rate limits."""
+    llm = utils.get_scheduled_llm_model(
+        provider="google",
+        model_name="gemini-2.0-flash-thinking-exp-01-21",
+        temperature=1.0,
+        retries=retries,
+        use_cache=response_cache_enabled()
+    )
+    try:
+        return await llm.ainvoke(messages)
+    except Exception as e:
+        if not is_rate_limit_error(e):
+            raise
+        logging.error("❌ Max retries reached for 429 error.")
+        return {"error": "API rate limit exceeded. Please wait and try again later."}
 
 async def deep_research(task, llm, agent_state=None, **kwargs):
     task_id = str(uuid4())
@@ -112,7 +102,7 @@ Previous Search Results: {json.dumps(history_infos)}
                 SystemMessage(content="Process the following task and return a valid JSON object with a 'queries' key:"),
                 HumanMessage(content=query_prompt)
             ]
-            ai_query_msg = invoke_with_retry(search_messages)
+            ai_query_msg = await invoke_with_retry(search_messages)
 
             # Log the raw response for debugging
             logger.debug(f"Raw LLM response: {ai_query_msg.content}")
@@ -206,7 +196,11 @@ async def generate_final_report(task, history_infos, save_dir, llm, error_msg=No
             SystemMessage(content=writer_system_prompt),
             HumanMessage(content=report_prompt)
         ]  # New context for report generation
+        if response_cache_enabled():
+            llm = with_response_cache(llm)
         ai_report_msg = llm.invoke(report_messages)
+        if response_cache_enabled():
+            logger.info(f"LLM response cache: {get_response_cache().stats()}")
         if hasattr(ai_report_msg, "reasoning_content"):
             logger.info("🤯 Start Report Deep Thinking: ")
             logger.info(ai_report_msg.reasoning_content)
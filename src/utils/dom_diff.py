@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+from collections import Counter, defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+from browser_use.browser.views import BrowserState
+from browser_use.dom.views import DOMElementNode
+
+logger = logging.getLogger(__name__)
+
+_ELEMENT_LINE = re.compile(r"^(\d+)\[:\]")
+
+
+def _document(url: str) -> str:
+    return url.split("#", 1)[0]
+
+
+class StableElementIds:
+    """
+    Renumbers the highlight indices of a capture so an element keeps its index across captures of
+    the same document. Elements are matched on tag, parent branch, attributes and text first, then on
+    xpath (same element, changed content); new elements get fresh indices. A new URL starts over
+    from the page's own numbering.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._document: Optional[str] = None
+        self._elements: Dict[int, DOMElementNode] = {}
+        self._next_id = 0
+
+    @staticmethod
+    def _fingerprint(node: DOMElementNode) -> tuple:
+        return (node.tag_name, node.hash.branch_path_hash, node.hash.attributes_hash,
+                node.get_all_text_till_next_clickable_element())
+
+    def assign(self, state: BrowserState) -> None:
+        """Rewrite `state.selector_map` and the highlight indices of its nodes in place."""
+        document = _document(state.url)
+        if document != self._document:
+            self._document = document
+            self._elements = dict(state.selector_map)
+            self._next_id = max(state.selector_map, default=-1) + 1
+            return
+        by_fingerprint: Dict[tuple, deque] = defaultdict(deque)
+        for element_id in sorted(self._elements):
+            by_fingerprint[self._fingerprint(self._elements[element_id])].append(element_id)
+        assigned: Dict[int, DOMElementNode] = {}
+        unmatched: List[DOMElementNode] = []
+        for index in sorted(state.selector_map):
+            node = state.selector_map[index]
+            ids = by_fingerprint.get(self._fingerprint(node))
+            if ids:
+                assigned[ids.popleft()] = node
+            else:
+                unmatched.append(node)
+        by_xpath = {(node.tag_name, node.xpath): element_id
+                    for element_id, node in self._elements.items() if element_id not in assigned}
+        for node in unmatched:
+            element_id = by_xpath.pop((node.tag_name, node.xpath), None)
+            if element_id is None:
+                element_id = self._next_id
+                self._next_id += 1
+            assigned[element_id] = node
+        for element_id, node in assigned.items():
+            node.highlight_index = element_id
+        state.selector_map = dict(sorted(assigned.items()))
+        self._elements = state.selector_map
+
+
+def _split_lines(elements_text: str) -> tuple[Dict[int, str], Counter]:
+    elements: Dict[int, str] = {}
+    texts: Counter = Counter()
+    for line in elements_text.splitlines():
+        match = _ELEMENT_LINE.match(line)
+        if match:
+            elements[int(match.group(1))] = line
+        elif line:
+            texts[line] += 1
+    return elements, texts
+
+
+class DomDiff:
+    """
+    Element-list changes against the last full page snapshot sent to the model. Needs stable element
+    indices (StableElementIds). The full list is sent again on navigation, when the snapshot left the
+    history, or when more than `max_change_ratio` of the snapshot changed.
+    """
+
+    def __init__(self, max_change_ratio: Optional[float] = None):
+        if max_change_ratio is None:
+            max_change_ratio = float(os.getenv("AGENT_DOM_DIFF_MAX_RATIO", "0.5"))
+        self.max_change_ratio = max_change_ratio
+        self._document: Optional[str] = None
+        self._elements: Dict[int, str] = {}
+        self._texts: Counter = Counter()
+        self.full_sends = 0
+        self.diff_sends = 0
+        self.full_chars = 0
+        self.sent_chars = 0
+
+    def update(self, url: str, elements_text: str, snapshot_kept: bool = True) -> Optional[str]:
+        """
+        Changes since the snapshot, one `+ ` (added), `- ` (removed) or `~ ` (changed) line each.
+        None means the full list has to be sent; it then becomes the new snapshot.
+        """
+        self.full_chars += len(elements_text)
+        elements, texts = _split_lines(elements_text)
+        diff = None
+        if snapshot_kept and elements_text and _document(url) == self._document:
+            diff = self._diff(elements, texts)
+            if diff is not None and len(diff) >= len(elements_text):
+                diff = None
+        if diff is None:
+            self._document = _document(url)
+            self._elements, self._texts = elements, texts
+            self.full_sends += 1
+            self.sent_chars += len(elements_text)
+            return None
+        self.diff_sends += 1
+        self.sent_chars += len(diff)
+        return diff
+
+    def _diff(self, elements: Dict[int, str], texts: Counter) -> Optional[str]:
+        lines = []
+        for element_id, line in self._elements.items():
+            if element_id not in elements:
+                lines.append(f"- {line}")
+        for element_id, line in elements.items():
+            if element_id not in self._elements:
+                lines.append(f"+ {line}")
+            elif self._elements[element_id] != line:
+                lines.append(f"~ {line}")
+        lines.extend(f"- {line}" for line in (self._texts - texts).elements())
+        lines.extend(f"+ {line}" for line in (texts - self._texts).elements())
+        snapshot_size = len(self._elements) + sum(self._texts.values())
+        if len(lines) > self.max_change_ratio * max(snapshot_size, 1):
+            logger.debug(f"DOM diff of {len(lines)} lines exceeds the threshold, sending the full element list")
+            return None
+        return "\n".join(lines) if lines else "No changes."
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "full_sends": self.full_sends,
+            "diff_sends": self.diff_sends,
+            "chars_saved": self.full_chars - self.sent_chars,
+        }
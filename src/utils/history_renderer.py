@@ -0,0 +1,265 @@
+import base64
+import io
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Iterator, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("gif", "webp", "mp4")
+FONT_OPTIONS = ("Helvetica", "Arial", "DejaVuSans", "Verdana")
+
+
+@dataclass
+class RenderOptions:
+    duration: int = 3000
+    font_size: int = 40
+    title_font_size: int = 56
+    goal_font_size: int = 44
+    margin: int = 40
+    line_spacing: float = 1.5
+    logo_path: Optional[str] = None
+    webp_quality: int = 70
+
+
+@dataclass
+class FrameJob:
+    """One output frame: a step screenshot with its goal overlay, or the task intro frame (step 0)."""
+    step_number: int
+    text: Optional[str] = None
+    screenshot_path: Optional[str] = None
+    screenshot: Optional[str] = None
+
+
+def output_format(output_path: str) -> str:
+    extension = os.path.splitext(output_path)[1].lower().lstrip(".")
+    return extension if extension in FORMATS else "gif"
+
+
+@lru_cache(maxsize=None)
+def _font_name() -> Optional[str]:
+    """The first preferred font installed, probed once per process."""
+    for font_name in FONT_OPTIONS:
+        if platform.system() == "Windows":
+            font_name = os.path.join(os.getenv("WIN_FONT_DIR", "C:\\Windows\\Fonts"), font_name + ".ttf")
+        try:
+            ImageFont.truetype(font_name, 10)
+            return font_name
+        except OSError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=None)
+def load_font(size: int):
+    font_name = _font_name()
+    if font_name:
+        return ImageFont.truetype(font_name, size)
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 has only the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4)
+def _load_logo(path: str) -> Optional[Image.Image]:
+    try:
+        logo = Image.open(path)
+        logo_height = 150
+        logo_width = int(logo_height * logo.width / logo.height)
+        return logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
+    except Exception as e:
+        logger.warning(f"Could not load logo: {e}")
+        return None
+
+
+def wrap_text(text: str, font, max_width: int) -> str:
+    lines: List[str] = []
+    current_line: List[str] = []
+    for word in text.split():
+        current_line.append(word)
+        if font.getbbox(" ".join(current_line))[2] > max_width and len(current_line) > 1:
+            current_line.pop()
+            lines.append(" ".join(current_line))
+            current_line = [word]
+    if current_line:
+        lines.append(" ".join(current_line))
+    return "\n".join(lines)
+
+
+def _open_screenshot(job: FrameJob) -> Image.Image:
+    if job.screenshot_path:
+        return Image.open(job.screenshot_path)
+    return Image.open(io.BytesIO(base64.b64decode(job.screenshot)))
+
+
+def _paste_logo(image: Image.Image, logo: Optional[Image.Image]) -> None:
+    if logo:
+        logo_margin = 20
+        image.paste(logo, (image.width - logo.width - logo_margin, logo_margin), logo if logo.mode == "RGBA" else None)
+
+
+def _task_frame(job: FrameJob, options: RenderOptions, logo: Optional[Image.Image]) -> Image.Image:
+    template = _open_screenshot(job)
+    image = Image.new("RGB", template.size, (0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    font = load_font(options.font_size + 16)
+    wrapped = wrap_text(job.text or "", font, image.width - 2 * 140)
+    line_height = font.size * options.line_spacing
+    lines = wrapped.split("\n")
+    text_y = image.height // 2 - line_height * len(lines) / 2 + 50
+    for line in lines:
+        line_bbox = draw.textbbox((0, 0), line, font=font)
+        draw.text(((image.width - (line_bbox[2] - line_bbox[0])) // 2, text_y), line, font=font, fill=(255, 255, 255))
+        text_y += line_height
+    _paste_logo(image, logo)
+    return image
+
+
+def _step_frame(job: FrameJob, options: RenderOptions, logo: Optional[Image.Image]) -> Image.Image:
+    image = _open_screenshot(job)
+    if job.text is None:
+        return image.convert("RGB")
+    image = image.convert("RGBA")
+    title_font = load_font(options.title_font_size)
+    goal_font = load_font(options.goal_font_size)
+    margin = options.margin
+    layer = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    # step number in the bottom left
+    step_text = str(job.step_number)
+    step_bbox = draw.textbbox((0, 0), step_text, font=title_font)
+    x_step = margin + 10
+    y_step = image.height - margin - (step_bbox[3] - step_bbox[1]) - 10
+    padding = 20
+    draw.rounded_rectangle((x_step - padding, y_step - padding, x_step + step_bbox[2] - step_bbox[0] + padding,
+                            y_step + step_bbox[3] - step_bbox[1] + padding), radius=15, fill=(0, 0, 0, 255))
+    draw.text((x_step, y_step), step_text, font=title_font, fill=(255, 255, 255, 255))
+    # goal centered above it
+    wrapped_goal = wrap_text(job.text, goal_font, image.width - 4 * margin)
+    goal_bbox = draw.multiline_textbbox((0, 0), wrapped_goal, font=goal_font)
+    x_goal = (image.width - (goal_bbox[2] - goal_bbox[0])) // 2
+    y_goal = y_step - (goal_bbox[3] - goal_bbox[1]) - padding * 4
+    padding_goal = 25
+    draw.rounded_rectangle((x_goal - padding_goal, y_goal - padding_goal,
+                            x_goal + goal_bbox[2] - goal_bbox[0] + padding_goal,
+                            y_goal + goal_bbox[3] - goal_bbox[1] + padding_goal), radius=15, fill=(0, 0, 0, 255))
+    draw.multiline_text((x_goal, y_goal), wrapped_goal, font=goal_font, fill=(255, 255, 255, 255), align="center")
+    _paste_logo(layer, logo)
+    return Image.alpha_composite(image, layer).convert("RGB")
+
+
+def render_frame(job: FrameJob, options: RenderOptions) -> Image.Image:
+    """Render one frame; runs in the pool workers, each caching its fonts and logo."""
+    logo = _load_logo(options.logo_path) if options.logo_path else None
+    if job.step_number == 0:
+        return _task_frame(job, options, logo)
+    return _step_frame(job, options, logo)
+
+
+class HistoryRenderer:
+    """
+    Renders agent history frames in a process pool (`workers` <= 1 renders in-process) and writes
+    them, in order, into a GIF, an animated WebP or, with ffmpeg installed, an MP4. Only MP4 is
+    streamed to the encoder frame by frame; Pillow's GIF and WebP writers hold every frame in memory
+    until the file is written. The pool starts on the first render and is kept for later ones, since
+    spawning workers costs more than a short history takes to draw; `close()` shuts it down.
+    """
+
+    def __init__(self, workers: Optional[int] = None, ffmpeg: Optional[str] = None):
+        self.workers = workers if workers is not None else int(
+            os.getenv("AGENT_RENDER_WORKERS") or min(4, os.cpu_count() or 1))
+        self.ffmpeg = shutil.which(ffmpeg or os.getenv("FFMPEG_BINARY", "ffmpeg"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: the agent runs with threads and an event loop, which fork does not copy safely
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def frames(self, jobs: List[FrameJob], options: RenderOptions) -> Iterator[Image.Image]:
+        render = partial(render_frame, options=options)
+        if self.workers <= 1 or len(jobs) < 2:
+            yield from map(render, jobs)
+            return
+        yield from self.pool().map(render, jobs, chunksize=max(1, len(jobs) // (self.workers * 4)))
+
+    def render(self, jobs: List[FrameJob], output_path: str, options: Optional[RenderOptions] = None) -> Optional[str]:
+        """Write the frames to `output_path`, whose extension picks the format; returns the path written."""
+        options = options or RenderOptions()
+        if not jobs:
+            logger.warning("No images found in history to render")
+            return None
+        fmt = output_format(output_path)
+        if fmt == "mp4" and not self.ffmpeg:
+            output_path = os.path.splitext(output_path)[0] + ".webp"
+            logger.warning(f"ffmpeg not found, writing an animated WebP to {output_path} instead of MP4")
+            fmt = "webp"
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        frames = self.frames(jobs, options)
+        frames = _same_size(next(frames), frames)
+        if fmt != "mp4":
+            logger.info(f"Encoding {len(jobs)} frames as {fmt.upper()} keeps them all in memory; "
+                        f"write an .mp4 with ffmpeg installed to stream them")
+        if fmt == "mp4":
+            self._write_mp4(frames, output_path, options)
+        elif fmt == "webp":
+            frames = list(frames)
+            frames[0].save(output_path, save_all=True, append_images=frames[1:], duration=options.duration, loop=0,
+                           quality=options.webp_quality)
+        else:
+            first = next(frames)
+            first.save(output_path, save_all=True, append_images=frames, duration=options.duration, loop=0,
+                       optimize=False)
+        logger.info(f"Created {fmt.upper()} at {output_path}")
+        return output_path
+
+    def _write_mp4(self, frames: Iterator[Image.Image], output_path: str, options: RenderOptions) -> None:
+        first = next(frames)
+        width, height = first.size
+        command = [
+            self.ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+            "-framerate", f"1000/{options.duration}", "-i", "-",
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+            "-r", "25", output_path,
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            process.stdin.write(first.tobytes())
+            for frame in frames:
+                process.stdin.write(frame.tobytes())
+        finally:
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+
+
+history_renderer = HistoryRenderer()
+
+
+def _same_size(first: Image.Image, frames: Iterator[Image.Image]) -> Iterator[Image.Image]:
+    """Animations need one frame size; later frames of another size are fitted to the first."""
+    yield first
+    for frame in frames:
+        yield frame if frame.size == first.size else frame.resize(first.size, Image.Resampling.LANCZOS)
@@ -0,0 +1,236 @@
+import asyncio
+import email.utils
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_RETRY_PATTERNS = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry(?:\s+again)?\s+(?:in|after)\s+(\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+    re.compile(r'"retryDelay":\s*"(\d+(?:\.\d+)?)s"', re.IGNORECASE),
+]
+
+
+class TokenBucket:
+    """Continuously refilling bucket; capacity units are restored over `period` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= amount
+
+    def fill_ratio(self, now: float) -> float:
+        self._refill(now)
+        return max(self.tokens, 0.0) / self.capacity
+
+
+@dataclass
+class KeyState:
+    key: str
+    requests: TokenBucket
+    tokens: TokenBucket
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    strikes: int = 0
+    total_requests: int = 0
+    rate_limited: int = 0
+    reserved: Dict[int, int] = field(default_factory=dict)
+
+
+class KeyScheduler:
+    """
+    Rate-limit-aware API key scheduler.
+
+    Each key has a request bucket (RPM) and a token bucket (TPM). `acquire` picks the least-loaded
+    key that can serve the request right now, waiting only as long as the soonest key needs.
+    Keys that hit a 429 are cooled down for the server's Retry-After hint, or an exponential
+    backoff when none is given, so parallel callers spread across keys instead of retrying in lockstep.
+    """
+
+    def __init__(
+            self,
+            keys: List[str],
+            rpm: int = 15,
+            tpm: int = 1_000_000,
+            default_cooldown: float = 10.0,
+            max_cooldown: float = 300.0,
+    ):
+        if not keys:
+            keys = [""]
+        self.default_cooldown = default_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._ticket = 0
+        self._states: Dict[str, KeyState] = {
+            key: KeyState(key=key, requests=TokenBucket(rpm), tokens=TokenBucket(tpm))
+            for key in dict.fromkeys(keys)
+        }
+
+    @classmethod
+    def from_env(cls, provider: str) -> "KeyScheduler":
+        prefix = provider.upper()
+        keys = [k.strip() for k in os.getenv(f"{prefix}_API_KEYS", "").split(",") if k.strip()]
+        if not keys:
+            keys = [os.getenv(f"{prefix}_API_KEY", "")]
+        return cls(
+            keys=keys,
+            rpm=int(os.getenv(f"{prefix}_RPM", "15")),
+            tpm=int(os.getenv(f"{prefix}_TPM", "1000000")),
+        )
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self._states)
+
+    def _try_acquire(self, estimated_tokens: int) -> Tuple[Optional[str], Optional[int], float]:
+        """Return (key, ticket, 0) on success or (None, None, seconds_to_wait)."""
+        with self._lock:
+            now = time.monotonic()
+            best: Optional[KeyState] = None
+            best_score = None
+            min_wait = float("inf")
+            for state in self._states.values():
+                wait = max(
+                    state.cooldown_until - now,
+                    state.requests.wait_time(1, now),
+                    state.tokens.wait_time(estimated_tokens, now),
+                )
+                if wait > 0:
+                    min_wait = min(min_wait, wait)
+                    continue
+                load = min(state.requests.fill_ratio(now), state.tokens.fill_ratio(now))
+                score = (load, -state.in_flight)
+                if best is None or score > best_score:
+                    best, best_score = state, score
+            if best is None:
+                return None, None, min_wait
+            best.requests.consume(1, now)
+            best.tokens.consume(estimated_tokens, now)
+            best.in_flight += 1
+            best.total_requests += 1
+            self._ticket += 1
+            best.reserved[self._ticket] = estimated_tokens
+            return best.key, self._ticket, 0.0
+
+    async def acquire(self, estimated_tokens: int = 0) -> Tuple[str, int]:
+        """Wait (without blocking the loop) for a key; returns (key, ticket) for `release`."""
+        while True:
+            key, ticket, wait = self._try_acquire(estimated_tokens)
+            if key is not None:
+                return key, ticket
+            logger.debug(f"All API keys busy, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, estimated_tokens: int = 0) -> Tuple[str, int]:
+        """Blocking variant for synchronous callers such as the Flask handlers."""
+        while True:
+            key, ticket, wait = self._try_acquire(estimated_tokens)
+            if key is not None:
+                return key, ticket
+            time.sleep(wait)
+
+    def release(self, key: str, ticket: int, tokens_used: Optional[int] = None) -> None:
+        """Finish a request; charges the actual token usage against the key's TPM bucket."""
+        with self._lock:
+            state = self._states[key]
+            state.in_flight = max(state.in_flight - 1, 0)
+            reserved = state.reserved.pop(ticket, 0)
+            if tokens_used is not None:
+                state.tokens.consume(tokens_used - reserved, time.monotonic())
+            state.strikes = 0
+
+    def report_rate_limited(self, key: str, ticket: int, retry_after: Optional[float] = None) -> float:
+        """Cool the key down after a 429 and return the cooldown applied in seconds."""
+        with self._lock:
+            state = self._states[key]
+            state.in_flight = max(state.in_flight - 1, 0)
+            state.reserved.pop(ticket, None)
+            state.strikes += 1
+            state.rate_limited += 1
+            if retry_after is None:
+                retry_after = self.default_cooldown * (2 ** (state.strikes - 1))
+            cooldown = min(retry_after, self.max_cooldown)
+            state.cooldown_until = time.monotonic() + cooldown
+            return cooldown
+
+    def stats(self) -> List[Dict[str, object]]:
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "key": f"...{state.key[-4:]}" if state.key else "<env>",
+                    "in_flight": state.in_flight,
+                    "requests": state.total_requests,
+                    "rate_limited": state.rate_limited,
+                    "cooldown_remaining": round(max(state.cooldown_until - now, 0.0), 1),
+                }
+                for state in self._states.values()
+            ]
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}"
+    return "ResourceExhausted" in text or "RESOURCE_EXHAUSTED" in text or "RateLimit" in text or " 429" in text
+
+
+def parse_retry_after(error: BaseException) -> Optional[float]:
+    """Extract a Retry-After hint (seconds) from an HTTP response header or the error text."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                pass
+            try:
+                parsed = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                # a malformed header must not turn the rate-limit handling into a crash
+                logger.debug(f"Ignoring malformed Retry-After header: {value!r}")
+                parsed = None
+            if parsed is not None:
+                return max(parsed.timestamp() - time.time(), 0.0)
+    text = str(error)
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+_schedulers: Dict[str, KeyScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_key_scheduler(provider: str = "google") -> KeyScheduler:
+    """Process-wide scheduler for a provider, configured from <PROVIDER>_API_KEYS / _RPM / _TPM."""
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            _schedulers[provider] = KeyScheduler.from_env(provider)
+        return _schedulers[provider]
@@ -1,6 +1,11 @@
-from openai import OpenAI
+import logging
+import os
+
+from openai import AsyncOpenAI, OpenAI
 import pdb
 from langchain_openai import ChatOpenAI
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain_core.globals import get_llm_cache
 from langchain_core.language_models.base import (
     BaseLanguageModel,
@@ -10,6 +15,7 @@ from langchain_core.language_models.base import (
 from langchain_core.load import dumpd, dumps
 from langchain_core.messages import (
     AIMessage,
+    AIMessageChunk,
     SystemMessage,
     AnyMessage,
     BaseMessage,
@@ -30,33 +36,37 @@ from langchain_core.output_parsers.base import OutputParserLike
 from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.tools import BaseTool
 
+from pydantic import Field
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncIterator,
     Callable,
+    Iterator,
     Literal,
     Optional,
+    Tuple,
     Union,
     cast,
 )
 
+from .llm_pool import DEFAULT_TIMEOUT, llm_pool
+
+logger = logging.getLogger(__name__)
+
 class DeepSeekR1ChatOpenAI(ChatOpenAI):
     
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         self.client = OpenAI(
             base_url=kwargs.get("base_url"),
-            api_key=kwargs.get("api_key")
-        ) 
-        
-    async def ainvoke(
-        self,
-        input: LanguageModelInput,
-        config: Optional[RunnableConfig] = None,
-        *,
-        stop: Optional[list[str]] = None,
-        **kwargs: Any,
-    ) -> AIMessage:
+            api_key=kwargs.get("api_key"),
+            timeout=self.request_timeout if self.request_timeout is not None else DEFAULT_TIMEOUT,
+            http_client=llm_pool.get_http_client(kwargs.get("base_url")),
+        )
+
+    @staticmethod
+    def _to_openai_messages(input: LanguageModelInput) -> list[dict]:
         message_history = []
         for input_ in input:
             if isinstance(input_, SystemMessage):
@@ -65,15 +75,74 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
                 message_history.append({"role": "assistant", "content": input_.content})
             else:
                 message_history.append({"role": "user", "content": input_.content})
-        
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=message_history
+        return message_history
+
+    @staticmethod
+    def _to_ai_message(response: Any) -> AIMessage:
+        message = response.choices[0].message
+        reasoning_content = getattr(message, "reasoning_content", None)
+        usage_metadata = None
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # DeepSeek reports context cache hits as prompt_cache_hit_tokens
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)
+            if cached is None:
+                cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+            usage_metadata = {
+                "input_tokens": usage.prompt_tokens,
+                "output_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+                "input_token_details": {"cache_read": cached or 0},
+            }
+        return AIMessage(content=message.content, reasoning_content=reasoning_content, usage_metadata=usage_metadata)
+
+    def _cache_lookup(self, input: LanguageModelInput) -> Optional[AIMessage]:
+        if not isinstance(self.cache, BaseCache):
+            return None
+        generations = self.cache.lookup(dumps(list(input)), self._get_llm_string())
+        if not generations:
+            return None
+        message = generations[0].message
+        return AIMessage(content=message.content, reasoning_content=message.additional_kwargs.get("reasoning_content"))
+
+    def _cache_update(self, input: LanguageModelInput, ai_message: AIMessage) -> None:
+        if not isinstance(self.cache, BaseCache):
+            return
+        # reasoning_content is not part of the serialized AIMessage, keep it in additional_kwargs
+        cached_message = AIMessage(
+            content=ai_message.content,
+            additional_kwargs={"reasoning_content": getattr(ai_message, "reasoning_content", None)},
         )
+        self.cache.update(dumps(list(input)), self._get_llm_string(), [ChatGeneration(message=cached_message)])
 
-        reasoning_content = response.choices[0].message.reasoning_content
-        content = response.choices[0].message.content
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+    def _get_async_client(self) -> AsyncOpenAI:
+        api_key = self.openai_api_key.get_secret_value() if self.openai_api_key else None
+        return llm_pool.get_async_openai_client(
+            base_url=self.openai_api_base,
+            api_key=api_key,
+            timeout=self.request_timeout,
+        )
+
+    async def ainvoke(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        *,
+        stop: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> AIMessage:
+        cached = self._cache_lookup(input)
+        if cached is not None:
+            return cached
+        # Awaiting the async client keeps the event loop free during the reasoning phase,
+        # and cancelling the calling task aborts the in-flight HTTP request.
+        response = await self._get_async_client().chat.completions.create(
+            model=self.model_name,
+            messages=self._to_openai_messages(input)
+        )
+        ai_message = self._to_ai_message(response)
+        self._cache_update(input, ai_message)
+        return ai_message
     
     def invoke(
         self,
@@ -83,26 +152,221 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
-        
+        cached = self._cache_lookup(input)
+        if cached is not None:
+            return cached
         response = self.client.chat.completions.create(
             model=self.model_name,
-            messages=message_history
+            messages=self._to_openai_messages(input)
         )
-
-        reasoning_content = response.choices[0].message.reasoning_content
-        content = response.choices[0].message.content
-        return AIMessage(content=content, reasoning_content=reasoning_content)
+        ai_message = self._to_ai_message(response)
+        self._cache_update(input, ai_message)
+        return ai_message
     
+class ThinkTagSplitter:
+    """
+    Incremental splitter for deepseek-r1 replies of the form `<think>reasoning</think>answer`.
+
+    Text is fed chunk by chunk and each call returns the (reasoning, answer) text it completed, so
+    the answer can be handed on as soon as `</think>` arrives. Reasoning beyond
+    `max_reasoning_chars` is dropped (None keeps everything, 0 discards it). A "**JSON Response:**"
+    preamble before the answer is removed. Chunks are counted per channel: Ollama streams one
+    token per chunk.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+    ANSWER_MARKER = "**JSON Response:**"
+
+    def __init__(self, max_reasoning_chars: Optional[int] = None):
+        self.max_reasoning_chars = max_reasoning_chars
+        self.in_reasoning = True
+        self.reasoning_chars = 0
+        self.reasoning_truncated = False
+        self.reasoning_chunks = 0
+        self.answer_chunks = 0
+        self._reasoning_parts: list[str] = []
+        # untruncated reasoning, needed only if `</think>` never comes and it turns out to be the answer
+        self._raw_reasoning: list[str] = []
+        self._pending = ""
+        self._open_checked = False
+        self._answer_started = False
+
+    @property
+    def reasoning(self) -> str:
+        return "".join(self._reasoning_parts)
+
+    def _keep_reasoning(self, text: str) -> str:
+        self.reasoning_chars += len(text)
+        self._raw_reasoning.append(text)
+        if self.max_reasoning_chars is not None:
+            kept = sum(len(part) for part in self._reasoning_parts)
+            room = max(self.max_reasoning_chars - kept, 0)
+            if len(text) > room:
+                self.reasoning_truncated = True
+                text = text[:room]
+        if text:
+            self._reasoning_parts.append(text)
+        return text
+
+    def _answer(self, text: str, final: bool = False) -> str:
+        if self._answer_started:
+            return text
+        # hold the answer back until its JSON begins, so a preamble marker can be dropped
+        self._pending += text
+        if "{" not in self._pending and not final:
+            return ""
+        answer = self._pending
+        if self.ANSWER_MARKER in answer:
+            answer = answer.split(self.ANSWER_MARKER)[-1]
+        self._pending = ""
+        self._answer_started = True
+        return answer
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        if not text:
+            return "", ""
+        if not self.in_reasoning:
+            self.answer_chunks += 1
+            return "", self._answer(text)
+        self.reasoning_chunks += 1
+        buffer = self._pending + text
+        self._pending = ""
+        if not self._open_checked:
+            stripped = buffer.lstrip()
+            if self.OPEN_TAG.startswith(stripped):
+                self._pending = buffer
+                return "", ""
+            self._open_checked = True
+            if not stripped.startswith(self.OPEN_TAG):
+                # no reasoning block: the whole reply is the answer
+                self.in_reasoning = False
+                self.reasoning_chunks, self.answer_chunks = 0, self.reasoning_chunks
+                return "", self._answer(buffer)
+            buffer = stripped[len(self.OPEN_TAG):]
+        if self.CLOSE_TAG in buffer:
+            reasoning, answer = buffer.split(self.CLOSE_TAG, 1)
+            self.in_reasoning = False
+            reasoning = self._keep_reasoning(reasoning)
+            self._raw_reasoning = []
+            return reasoning, self._answer(answer)
+        # keep a possible partial closing tag for the next chunk
+        hold = next((n for n in range(len(self.CLOSE_TAG) - 1, 0, -1) if buffer.endswith(self.CLOSE_TAG[:n])), 0)
+        if hold:
+            self._pending = buffer[-hold:]
+            buffer = buffer[:-hold]
+        return self._keep_reasoning(buffer), ""
+
+    def finish(self) -> Tuple[str, str]:
+        """Flush held-back text once the stream has ended."""
+        if self.in_reasoning:
+            # `<think>` was never closed (or the reply was too short to tell): use it all as the answer
+            if self._open_checked:
+                logger.warning("deepseek-r1 reply has no </think> tag, using it as the answer")
+            text = "".join(self._raw_reasoning) + self._pending
+            self._reasoning_parts = []
+            self._raw_reasoning = []
+            self._pending = ""
+            self.in_reasoning = False
+            self.answer_chunks, self.reasoning_chunks = self.reasoning_chunks, 0
+            return "", self._answer(text, final=True)
+        return "", self._answer("", final=True)
+
+    def token_counts(self, output_tokens: Optional[int] = None) -> dict[str, int]:
+        """Reasoning vs answer tokens; `output_tokens` (Ollama's eval_count) is split by chunk ratio."""
+        reasoning = self.reasoning_chunks
+        if output_tokens is None:
+            return {"reasoning_tokens": reasoning, "answer_tokens": self.answer_chunks}
+        reasoning = min(reasoning, output_tokens)
+        return {"reasoning_tokens": reasoning, "answer_tokens": output_tokens - reasoning}
+
+
+def _env_reasoning_max_chars() -> Optional[int]:
+    value = os.getenv("OLLAMA_REASONING_MAX_CHARS", "").strip()
+    return int(value) if value else None
+
+
 class DeepSeekR1ChatOllama(ChatOllama):
-        
+    """
+    ChatOllama for deepseek-r1: the `<think>` block is split off while streaming, so the answer
+    chunks carry only the JSON and the reasoning goes to `additional_kwargs["reasoning_content"]`
+    (capped at `reasoning_max_chars`). Usage metadata reports the reasoning token count.
+    """
+
+    reasoning_max_chars: Optional[int] = Field(default_factory=_env_reasoning_max_chars)
+
+    def _split_chunk(self, splitter: ThinkTagSplitter, chunk: ChatGenerationChunk) -> Optional[ChatGenerationChunk]:
+        reasoning, answer = splitter.feed(chunk.text)
+        return self._to_chunk(reasoning, answer) if reasoning or answer else None
+
+    @staticmethod
+    def _to_chunk(reasoning: str, answer: str, **kwargs: Any) -> ChatGenerationChunk:
+        additional_kwargs = {"reasoning_content": reasoning} if reasoning else {}
+        return ChatGenerationChunk(message=AIMessageChunk(content=answer, additional_kwargs=additional_kwargs, **kwargs))
+
+    def _final_chunk(self, splitter: ThinkTagSplitter, final: Optional[ChatGenerationChunk]) -> ChatGenerationChunk:
+        reasoning, answer = splitter.finish()
+        usage = cast(AIMessageChunk, final.message).usage_metadata if final is not None else None
+        counts = splitter.token_counts(usage["output_tokens"] if usage else None)
+        if usage:
+            usage = dict(usage, output_token_details={"reasoning": counts["reasoning_tokens"]})
+        chunk = self._to_chunk(
+            reasoning, answer, usage_metadata=usage,
+            response_metadata=dict(counts, reasoning_truncated=splitter.reasoning_truncated),
+        )
+        chunk.generation_info = final.generation_info if final is not None else None
+        return chunk
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        splitter = ThinkTagSplitter(self.reasoning_max_chars)
+        final = None
+        for chunk in super()._stream(messages, stop, **kwargs):
+            if chunk.generation_info:
+                final = chunk
+            split = self._split_chunk(splitter, chunk)
+            if split is not None:
+                if run_manager and split.text:
+                    run_manager.on_llm_new_token(split.text)
+                yield split
+        yield self._final_chunk(splitter, final)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        splitter = ThinkTagSplitter(self.reasoning_max_chars)
+        final = None
+        async for chunk in super()._astream(messages, stop, **kwargs):
+            if chunk.generation_info:
+                final = chunk
+            split = self._split_chunk(splitter, chunk)
+            if split is not None:
+                if run_manager and split.text:
+                    await run_manager.on_llm_new_token(split.text)
+                yield split
+        yield self._final_chunk(splitter, final)
+
+    @staticmethod
+    def _to_ai_message(chunk: Optional[BaseMessageChunk]) -> AIMessage:
+        if chunk is None:
+            raise ValueError("Empty response from Ollama")
+        message = message_chunk_to_message(chunk)
+        return AIMessage(
+            content=message.content,
+            reasoning_content=message.additional_kwargs.get("reasoning_content", ""),
+            usage_metadata=message.usage_metadata,
+            response_metadata=message.response_metadata,
+        )
+
     async def ainvoke(
         self,
         input: LanguageModelInput,
@@ -111,14 +375,11 @@ class DeepSeekR1ChatOllama(ChatOllama):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> AIMessage:
-        org_ai_message = await super().ainvoke(input=input)
-        org_content = org_ai_message.content
-        reasoning_content = org_content.split("</think>")[0].replace("<think>", "")
-        content = org_content.split("</think>")[1]
-        if "**JSON Response:**" in content:
-            content = content.split("**JSON Response:**")[-1]
-        return AIMessage(content=content, reasoning_content=reasoning_content)
-    
+        ai_chunk = None
+        async for chunk in self.astream(input, config, stop=stop, **kwargs):
+            ai_chunk = chunk if ai_chunk is None else ai_chunk + chunk
+        return self._to_ai_message(ai_chunk)
+
     def invoke(
         self,
         input: LanguageModelInput,
@@ -127,10 +388,7 @@ class DeepSeekR1ChatOllama(ChatOllama):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> AIMessage:
-        org_ai_message = super().invoke(input=input)
-        org_content = org_ai_message.content
-        reasoning_content = org_content.split("</think>")[0].replace("<think>", "")
-        content = org_content.split("</think>")[1]
-        if "**JSON Response:**" in content:
-            content = content.split("**JSON Response:**")[-1]
-        return AIMessage(content=content, reasoning_content=reasoning_content)
\ No newline at end of file
+        ai_chunk = None
+        for chunk in self.stream(input, config, stop=stop, **kwargs):
+            ai_chunk = chunk if ai_chunk is None else ai_chunk + chunk
+        return self._to_ai_message(ai_chunk)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from .llm_circuit_breaker import CircuitBreakerChatModel
+from .llm_hedging import HedgedChatModel
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteResponseCache(BaseCache):
+    """
+    Persistent, content-addressed LLM response cache.
+
+    Keys are the sha256 of the normalized messages (role + content only) and the model's
+    parameter string, so re-running the same research task or report prompt skips the call.
+    Entries are bounded by count, total size and TTL and evicted least-recently-used first.
+    """
+
+    def __init__(
+            self,
+            database_path: str = "./tmp/llm_cache/responses.sqlite",
+            max_entries: int = 5000,
+            max_bytes: int = 256 * 1024 * 1024,
+            ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        self.database_path = database_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def _normalize_prompt(prompt: str) -> str:
+        """Drop message ids and metadata that differ between otherwise identical requests."""
+        try:
+            messages = json.loads(prompt)
+        except (TypeError, ValueError):
+            return prompt
+        if not isinstance(messages, list):
+            return prompt
+        normalized = []
+        for message in messages:
+            if not isinstance(message, dict):
+                normalized.append(message)
+                continue
+            kwargs = message.get("kwargs", {})
+            normalized.append({
+                "type": kwargs.get("type", message.get("id", [""])[-1]),
+                "content": kwargs.get("content"),
+                "tool_calls": kwargs.get("tool_calls") or None,
+            })
+        return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+    def make_key(self, prompt: str, llm_string: str) -> str:
+        payload = f"{llm_string}\x00{self._normalize_prompt(prompt)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and row[1] + self.ttl_seconds < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = self.make_key(prompt, llm_string)
+        response = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += max(cursor.rowcount, 0)
+        count, total_size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total_size -= size
+            self.evictions += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_response_cache: Optional[SQLiteResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def response_cache_enabled() -> bool:
+    return os.getenv("LLM_RESPONSE_CACHE", "false").lower() == "true"
+
+
+def get_response_cache() -> SQLiteResponseCache:
+    """Process-wide cache configured from the LLM_RESPONSE_CACHE_* environment variables."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            ttl = float(os.getenv("LLM_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+            _response_cache = SQLiteResponseCache(
+                database_path=os.getenv("LLM_RESPONSE_CACHE_PATH", "./tmp/llm_cache/responses.sqlite"),
+                max_entries=int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+                max_bytes=int(os.getenv("LLM_RESPONSE_CACHE_MAX_MB", "256")) * 1024 * 1024,
+                ttl_seconds=ttl if ttl > 0 else None,
+            )
+        return _response_cache
+
+
+def with_response_cache(llm: BaseChatModel, cache: Optional[BaseCache] = None) -> BaseChatModel:
+    """
+    Return a copy of `llm` that reads and writes the response cache.
+
+    A copy is used so pooled model instances shared with agents stay uncached.
+    """
+    if isinstance(llm, HedgedChatModel):
+        # the hedged wrapper dispatches to its models directly, so cache those instead
+        return llm.model_copy(update={
+            "primary": with_response_cache(llm.primary, cache),
+            "backup": with_response_cache(llm.backup, cache),
+        })
+    if isinstance(llm, CircuitBreakerChatModel):
+        # the breaker stays on the wrapper, cached replies count as fast successes
+        return llm.model_copy(update={
+            "primary": with_response_cache(llm.primary, cache),
+            "fallback": with_response_cache(llm.fallback, cache) if llm.fallback is not None else None,
+        })
+    return llm.model_copy(update={"cache": cache or get_response_cache()})
@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, BaseMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableConfig
+from pydantic import ConfigDict
+
+from .llm_key_scheduling import KeyScheduledChatModel
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit for {name} is open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Rolling error-rate and p95-latency breaker for one (provider, model, key).
+
+    Closed: calls pass and their outcome and latency go into a window of the last `window` calls;
+    once `min_requests` are in, an error rate of at least `error_rate` or a p95 latency above
+    `latency_slo` opens the circuit (only for calls recorded with `check_latency`). Open: calls are refused for `open_seconds`. Half-open: up to
+    `probes` calls go through; all succeeding within the SLO closes the circuit, any failure
+    re-opens it.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            window: int = 20,
+            min_requests: int = 5,
+            error_rate: float = 0.5,
+            latency_slo: Optional[float] = None,
+            open_seconds: float = 30.0,
+            probes: int = 1,
+    ):
+        self.name = name
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.latency_slo = latency_slo
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.open_reason = ""
+        self.times_opened = 0
+        self.requests = 0
+        self.rejected = 0
+        self._calls: "deque[Tuple[bool, float]]" = deque(maxlen=window)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic()) if self.opened_at else 0.0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; a True in half-open state reserves a probe."""
+        with self._lock:
+            if self.state == OPEN and self._retry_in() <= 0:
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+                logger.info(f"Circuit for {self.name} is half-open, probing")
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return self._retry_in()
+
+    def _p95(self) -> Optional[float]:
+        latencies = sorted(latency for ok, latency in self._calls if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.open_reason = reason
+        self.times_opened += 1
+        logger.warning(f"Circuit for {self.name} opened: {reason}")
+
+    def record(self, ok: bool, latency: float, check_latency: bool = True) -> None:
+        latency_slo = self.latency_slo if check_latency else None
+        with self._lock:
+            self.requests += 1
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not ok:
+                    self._open("probe failed")
+                elif latency_slo and latency > latency_slo:
+                    self._open(f"probe took {latency:.1f}s > {latency_slo:.1f}s")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.probes:
+                        self.state = CLOSED
+                        self.opened_at = None
+                        self._calls.clear()
+                        logger.info(f"Circuit for {self.name} closed")
+                return
+            self._calls.append((ok, latency))
+            if self.state != CLOSED or len(self._calls) < self.min_requests:
+                return
+            failures = sum(1 for call_ok, _ in self._calls if not call_ok)
+            p95 = self._p95()
+            if failures / len(self._calls) >= self.error_rate:
+                self._open(f"error rate {failures}/{len(self._calls)}")
+            elif latency_slo and p95 is not None and p95 > latency_slo:
+                self._open(f"p95 latency {p95:.1f}s > {latency_slo:.1f}s")
+
+    def release(self) -> None:
+        """Give back a probe whose call was cancelled before it finished."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            failures = sum(1 for ok, _ in self._calls if not ok)
+            p95 = self._p95()
+            return {
+                "name": self.name,
+                "state": self.state,
+                "error_rate": round(failures / len(self._calls), 3) if self._calls else 0.0,
+                "p95_latency": round(p95, 3) if p95 is not None else None,
+                "window_requests": len(self._calls),
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "open_reason": self.open_reason if self.state != CLOSED else "",
+                "retry_in": round(self._retry_in(), 1) if self.state == OPEN else 0.0,
+            }
+
+
+class CircuitBreakerRegistry:
+    """Process-wide breakers keyed by (provider, model, api key digest), configured from the environment."""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model: str, api_key: Optional[str] = None) -> CircuitBreaker:
+        digest = hashlib.sha256(str(api_key or "").encode("utf-8")).hexdigest()[:8]
+        key = (provider, model, digest)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                latency_slo = float(os.getenv("LLM_BREAKER_P95_SLO", "120"))
+                breaker = CircuitBreaker(
+                    name=f"{provider}/{model}" + (f"/key-{digest}" if api_key else ""),
+                    window=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+                    min_requests=int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "5")),
+                    error_rate=float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")),
+                    latency_slo=latency_slo if latency_slo > 0 else None,
+                    open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30")),
+                    probes=int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1")),
+                )
+                self._breakers[key] = breaker
+            return breaker
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.snapshot() for breaker in breakers]
+
+
+circuit_breakers = CircuitBreakerRegistry()
+
+
+class CircuitBreakerChatModel(BaseChatModel):
+    """
+    Chat model guarded by a CircuitBreaker. While the circuit is open calls fail fast with
+    CircuitOpenError, or go to `fallback` when one is configured; a failed call is also retried
+    on the fallback. Streams fail over only if the primary fails before its first chunk. Slow
+    replies open the circuit only when there is a fallback to send calls to; without one the
+    circuit opens on errors alone, since refusing a slow but working model only fails the run.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    primary: BaseChatModel
+    breaker: Any
+    fallback: Optional[BaseChatModel] = None
+    model_name: str = ""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        if not self.model_name:
+            self.model_name = getattr(self.primary, "model_name", None) or getattr(self.primary, "model", "")
+
+    @property
+    def _llm_type(self) -> str:
+        return "circuit-breaker"
+
+    def _record_success(self, start: float) -> None:
+        self.breaker.record(True, time.monotonic() - start, check_latency=self.fallback is not None)
+
+    def _failover(self, error: Exception) -> BaseChatModel:
+        if self.fallback is None:
+            raise error
+        fallback_name = getattr(self.fallback, "model_name", None) or self.fallback.__class__.__name__
+        logger.warning(f"{error}; failing over to {fallback_name}")
+        return self.fallback
+
+    async def ainvoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AIMessage:
+        if not self.breaker.allow():
+            fallback = self._failover(CircuitOpenError(self.breaker.name, self.breaker.retry_in()))
+            return await fallback.ainvoke(input, config, stop=stop, **kwargs)
+        start = time.monotonic()
+        try:
+            message = await self.primary.ainvoke(input, config, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.breaker.record(False, time.monotonic() - start)
+            return await self._failover(e).ainvoke(input, config, stop=stop, **kwargs)
+        self._record_success(start)
+        return message
+
+    def invoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AIMessage:
+        if not self.breaker.allow():
+            fallback = self._failover(CircuitOpenError(self.breaker.name, self.breaker.retry_in()))
+            return fallback.invoke(input, config, stop=stop, **kwargs)
+        start = time.monotonic()
+        try:
+            message = self.primary.invoke(input, config, stop=stop, **kwargs)
+        except Exception as e:
+            self.breaker.record(False, time.monotonic() - start)
+            return self._failover(e).invoke(input, config, stop=stop, **kwargs)
+        except BaseException:
+            self.breaker.release()
+            raise
+        self._record_success(start)
+        return message
+
+    async def astream(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[BaseMessageChunk]:
+        if not self.breaker.allow():
+            fallback = self._failover(CircuitOpenError(self.breaker.name, self.breaker.retry_in()))
+            async for chunk in fallback.astream(input, config, stop=stop, **kwargs):
+                yield chunk
+            return
+        start = time.monotonic()
+        started = False
+        ok: Optional[bool] = None
+        try:
+            async for chunk in self.primary.astream(input, config, stop=stop, **kwargs):
+                started = True
+                yield chunk
+            ok = True
+        except Exception as e:
+            ok = False
+            self.breaker.record(False, time.monotonic() - start)
+            if started:
+                raise
+            fallback = self._failover(e)
+        finally:
+            if ok is None:
+                # cancelled, or the consumer stopped reading
+                self.breaker.release()
+        if ok:
+            self._record_success(start)
+            return
+        async for chunk in fallback.astream(input, config, stop=stop, **kwargs):
+            yield chunk
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self.invoke(messages, stop=stop, **kwargs))])
+
+
+def unwrap_llm(llm: Any) -> Any:
+    """The model behind any circuit-breaker or key-scheduling wrappers."""
+    while isinstance(llm, (CircuitBreakerChatModel, KeyScheduledChatModel)):
+        llm = llm.primary
+    return llm
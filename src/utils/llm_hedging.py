@@ -0,0 +1,251 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, BaseMessageChunk
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import RunnableConfig
+from pydantic import ConfigDict, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+_hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+
+class HedgeStats:
+    """Rolling primary latency window plus hedge / win counters."""
+
+    def __init__(self, window: int = 50):
+        self.latencies: "deque[float]" = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.primary_wins = 0
+        self.backup_wins = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay(self, percentile: float, min_samples: int, initial_delay: float, min_delay: float) -> float:
+        with self._lock:
+            if len(self.latencies) < min_samples:
+                return initial_delay
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(percentile * (len(ordered) - 1))))
+        return max(min_delay, ordered[index])
+
+    def record(self, winner: Optional[str], hedged: bool, primary_latency: Optional[float] = None) -> None:
+        with self._lock:
+            self.requests += 1
+            if hedged:
+                self.hedged += 1
+            if winner == "primary":
+                self.primary_wins += 1
+            elif winner == "backup":
+                self.backup_wins += 1
+            else:
+                self.failures += 1
+            if primary_latency is not None:
+                self.latencies.append(primary_latency)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            wins = self.primary_wins + self.backup_wins
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+                "primary_wins": self.primary_wins,
+                "backup_wins": self.backup_wins,
+                "backup_win_ratio": round(self.backup_wins / wins, 3) if wins else 0.0,
+                "hedged_backup_win_ratio": round(self.backup_wins / self.hedged, 3) if self.hedged else 0.0,
+                "failures": self.failures,
+                "latency_samples": len(self.latencies),
+            }
+
+
+def default_response_validator(message: BaseMessage) -> bool:
+    content = message.content
+    if isinstance(content, str):
+        return bool(content.strip())
+    return bool(content)
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Sends a request to `primary` and, if it has not answered within the `percentile` of its
+    recent latencies, sends the same request to `backup`. The first valid response wins and
+    the other call is cancelled. Until `min_samples` latencies are known, `initial_delay` is used.
+
+    Streaming (`astream`) is not hedged and always goes to the primary model.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    primary: BaseChatModel
+    backup: BaseChatModel
+    model_name: str = ""
+    percentile: float = 0.95
+    min_samples: int = 5
+    initial_delay: float = 10.0
+    min_delay: float = 0.5
+    window: int = 50
+    validator: Callable[[BaseMessage], bool] = default_response_validator
+
+    _stats: HedgeStats = PrivateAttr()
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        if not self.model_name:
+            self.model_name = getattr(self.primary, "model_name", None) or getattr(self.primary, "model", "")
+        self._stats = HedgeStats(window=self.window)
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat-model"
+
+    def hedge_delay(self) -> float:
+        return self._stats.hedge_delay(self.percentile, self.min_samples, self.initial_delay, self.min_delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._stats.as_dict()
+
+    def _is_valid(self, message: Any) -> bool:
+        try:
+            return self.validator(message)
+        except Exception as e:
+            logger.debug(f"Response validator failed: {e}")
+            return False
+
+    async def ainvoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AIMessage:
+        start = time.monotonic()
+        deadline = start + self.hedge_delay()
+        primary_task = asyncio.create_task(self.primary.ainvoke(input, config, stop=stop, **kwargs))
+        tasks = {primary_task: "primary"}
+        pending = set(tasks)
+        hedged = False
+        primary_latency = None
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                if not pending or (not hedged and time.monotonic() >= deadline):
+                    if hedged:
+                        break
+                    # primary is slow, failed or returned garbage: send the backup request
+                    hedged = True
+                    logger.info(f"Hedging LLM request to backup model after {time.monotonic() - start:.2f}s")
+                    backup_task = asyncio.create_task(self.backup.ainvoke(input, config, stop=stop, **kwargs))
+                    tasks[backup_task] = "backup"
+                    pending.add(backup_task)
+                timeout = None if hedged else max(0.0, deadline - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks[task]
+                    if task.exception() is not None:
+                        error = task.exception()
+                        logger.warning(f"Hedged {name} LLM call failed: {error}")
+                        continue
+                    if name == "primary" or primary_task in pending:
+                        # a cancelled primary still contributes its elapsed time as a lower bound
+                        primary_latency = time.monotonic() - start
+                    if self._is_valid(task.result()):
+                        self._stats.record(name, hedged, primary_latency)
+                        return task.result()
+                    logger.warning(f"Hedged {name} LLM call returned an invalid response")
+        finally:
+            for task in pending:
+                task.cancel()
+        self._stats.record(None, hedged, primary_latency)
+        if error is not None:
+            raise error
+        raise ValueError("Neither the primary nor the backup model returned a valid response")
+
+    def invoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AIMessage:
+        # Threads cannot be interrupted: a losing call is abandoned and its result discarded.
+        start = time.monotonic()
+        deadline = start + self.hedge_delay()
+        primary_future = _hedge_executor.submit(self.primary.invoke, input, config, stop=stop, **kwargs)
+        futures = {primary_future: "primary"}
+        pending = set(futures)
+        hedged = False
+        primary_latency = None
+        error: Optional[BaseException] = None
+        while True:
+            if not pending or (not hedged and time.monotonic() >= deadline):
+                if hedged:
+                    break
+                hedged = True
+                logger.info(f"Hedging LLM request to backup model after {time.monotonic() - start:.2f}s")
+                backup_future = _hedge_executor.submit(self.backup.invoke, input, config, stop=stop, **kwargs)
+                futures[backup_future] = "backup"
+                pending.add(backup_future)
+            timeout = None if hedged else max(0.0, deadline - time.monotonic())
+            done, pending = concurrent.futures.wait(
+                pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name = futures[future]
+                if future.exception() is not None:
+                    error = future.exception()
+                    logger.warning(f"Hedged {name} LLM call failed: {error}")
+                    continue
+                if name == "primary" or primary_future in pending:
+                    primary_latency = time.monotonic() - start
+                if self._is_valid(future.result()):
+                    for other in pending:
+                        other.cancel()
+                    self._stats.record(name, hedged, primary_latency)
+                    return future.result()
+                logger.warning(f"Hedged {name} LLM call returned an invalid response")
+        self._stats.record(None, hedged, primary_latency)
+        if error is not None:
+            raise error
+        raise ValueError("Neither the primary nor the backup model returned a valid response")
+
+    async def astream(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[BaseMessageChunk]:
+        async for chunk in self.primary.astream(input, config, stop=stop, **kwargs):
+            yield chunk
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return self.primary._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return await self.primary._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
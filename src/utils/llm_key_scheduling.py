@@ -0,0 +1,166 @@
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, PrivateAttr
+
+from .key_scheduler import KeyScheduler, is_rate_limit_error, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(messages: List[BaseMessage], chars_per_token: int = 3) -> int:
+    """Rough prompt size used to reserve TPM budget before the call."""
+    return sum(len(str(message.content)) for message in messages) // chars_per_token
+
+
+def _total_tokens(message: BaseMessage) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
+
+class KeyScheduledChatModel(BaseChatModel):
+    """
+    Chat model that takes an API key from a KeyScheduler for every call, so each request and its
+    tokens are charged against the RPM/TPM budget of the key that served it. A call that hits a
+    rate limit cools its key down and is retried on another one, up to `retries` attempts; a
+    stream is retried only if it failed before its first chunk.
+
+    `model_factory` builds (or fetches from the pool) the model for one key. The wrapper goes
+    through BaseChatModel's generate path, so a response cache set on it answers without a key.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    scheduler: KeyScheduler
+    model_factory: Callable[[str], BaseChatModel]
+    retries: int = 3
+    model_name: str = ""
+
+    _models: Dict[str, BaseChatModel] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "key-scheduled"
+
+    def model_for(self, api_key: str) -> BaseChatModel:
+        model = self._models.get(api_key)
+        if model is None:
+            model = self._models[api_key] = self.model_factory(api_key)
+        return model
+
+    @property
+    def primary(self) -> BaseChatModel:
+        """A model of the first key, for callers that inspect the provider behind the wrapper."""
+        return self.model_for(self.scheduler.keys[0])
+
+    def _settle_error(self, api_key: str, ticket: int, error: BaseException, retry: bool) -> bool:
+        """Give the key back after a failed call; True if the call should be retried on another key."""
+        if not isinstance(error, Exception) or not is_rate_limit_error(error):
+            self.scheduler.release(api_key, ticket)
+            return False
+        cooldown = self.scheduler.report_rate_limited(api_key, ticket, parse_retry_after(error))
+        if retry:
+            logger.warning(f"Rate limit hit (429). Key cooling down for {cooldown:.0f}s, retrying with another key...")
+        return retry
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        estimated_tokens = estimate_tokens(messages)
+        for attempt in range(max(self.retries, 1)):
+            api_key, ticket = self.scheduler.acquire_sync(estimated_tokens)
+            try:
+                message = self.model_for(api_key).invoke(messages, stop=stop, **kwargs)
+            except BaseException as e:
+                if self._settle_error(api_key, ticket, e, retry=attempt < self.retries - 1):
+                    continue
+                raise
+            self.scheduler.release(api_key, ticket, _total_tokens(message))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        estimated_tokens = estimate_tokens(messages)
+        for attempt in range(max(self.retries, 1)):
+            api_key, ticket = await self.scheduler.acquire(estimated_tokens)
+            try:
+                message = await self.model_for(api_key).ainvoke(messages, stop=stop, **kwargs)
+            except BaseException as e:
+                if self._settle_error(api_key, ticket, e, retry=attempt < self.retries - 1):
+                    continue
+                raise
+            self.scheduler.release(api_key, ticket, _total_tokens(message))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        estimated_tokens = estimate_tokens(messages)
+        for attempt in range(max(self.retries, 1)):
+            api_key, ticket = self.scheduler.acquire_sync(estimated_tokens)
+            started = False
+            settled = False
+            tokens: Optional[int] = None
+            try:
+                for chunk in self.model_for(api_key).stream(messages, stop=stop, **kwargs):
+                    started = True
+                    # chunk usage adds up, as when the chunks are summed into one message
+                    tokens = (tokens or 0) + _total_tokens(chunk) if _total_tokens(chunk) else tokens
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                settled = True
+                if self._settle_error(api_key, ticket, e, retry=not started and attempt < self.retries - 1):
+                    continue
+                raise
+            finally:
+                if not settled:
+                    # finished, or the consumer stopped reading
+                    self.scheduler.release(api_key, ticket, tokens)
+            return
+
+    async def _astream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        estimated_tokens = estimate_tokens(messages)
+        for attempt in range(max(self.retries, 1)):
+            api_key, ticket = await self.scheduler.acquire(estimated_tokens)
+            started = False
+            settled = False
+            tokens: Optional[int] = None
+            try:
+                async for chunk in self.model_for(api_key).astream(messages, stop=stop, **kwargs):
+                    started = True
+                    # chunk usage adds up, as when the chunks are summed into one message
+                    tokens = (tokens or 0) + _total_tokens(chunk) if _total_tokens(chunk) else tokens
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                settled = True
+                if self._settle_error(api_key, ticket, e, retry=not started and attempt < self.retries - 1):
+                    continue
+                raise
+            finally:
+                if not settled:
+                    # finished, cancelled, or the consumer stopped reading
+                    self.scheduler.release(api_key, ticket, tokens)
+            return
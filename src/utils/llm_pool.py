@@ -0,0 +1,217 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_REQUEST_TIMEOUT", "600")), connect=10.0)
+
+
+class LLMClientPool:
+    """
+    Process-wide pool of chat model instances keyed by their construction parameters.
+
+    Entries are evicted in LRU order once `max_size` is reached. OpenAI-compatible
+    providers additionally share one keep-alive `httpx.Client` per base url, so
+    repeated agents and research iterations reuse warm TLS connections. Models built
+    under `tracks_http_clients` count as users of the clients they picked up: a client
+    the pool drops is closed at once if idle, or when its last user is released.
+    """
+
+    def __init__(
+            self,
+            max_size: int = 16,
+            max_connections: int = 20,
+            max_keepalive_connections: int = 10,
+            keepalive_expiry: float = 60.0,
+    ):
+        self.max_size = max_size
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._models: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._http_clients: Dict[str, httpx.Client] = {}
+        # live models using each shared client
+        self._http_client_users: Dict[httpx.Client, int] = {}
+        self._async_openai_clients: Dict[Tuple, Tuple[asyncio.AbstractEventLoop, AsyncOpenAI, AsyncIterator]] = {}
+        # reentrant: a model's finalizer may release its clients during a GC run inside a locked section
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(secret: Optional[str]) -> str:
+        return hashlib.sha256(str(secret or "").encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def make_key(cls, provider: str, params: Dict[str, Any]) -> Tuple:
+        """Build a hashable pool key; api keys are stored as digests only."""
+        items = []
+        for name, value in sorted(params.items()):
+            if name.endswith("api_key"):
+                value = cls._digest(value)
+            items.append((name, repr(value)))
+        return (provider,) + tuple(items)
+
+    def get_or_create(self, provider: str, params: Dict[str, Any], factory: Callable[[], Any]) -> Any:
+        key = self.make_key(provider, params)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+            self.misses += 1
+        # Build outside the lock: model construction may be slow or raise.
+        model = factory()
+        with self._lock:
+            existing = self._models.get(key)
+            if existing is not None:
+                self._models.move_to_end(key)
+                return existing
+            self._models[key] = model
+            while len(self._models) > self.max_size:
+                evicted_key, _ = self._models.popitem(last=False)
+                self.evictions += 1
+                logger.debug(f"Evicted LLM client for {evicted_key[0]} from pool")
+        return model
+
+    def tracks_http_clients(self, factory: Callable[..., Any]) -> Callable[..., Any]:
+        """Decorate a model factory so the shared HTTP clients it picks up stay open while its model lives."""
+
+        @functools.wraps(factory)
+        def build(*args, **kwargs):
+            handed_out: List[httpx.Client] = []
+            outer = getattr(self._local, "handed_out", None)
+            self._local.handed_out = handed_out
+            try:
+                model = factory(*args, **kwargs)
+            finally:
+                self._local.handed_out = outer
+            for client in {id(client): client for client in handed_out}.values():
+                with self._lock:
+                    self._http_client_users[client] = self._http_client_users.get(client, 0) + 1
+                weakref.finalize(model, self._release_http_client, client)
+            return model
+
+        return build
+
+    def _release_http_client(self, client: httpx.Client) -> None:
+        with self._lock:
+            users = self._http_client_users.get(client, 1) - 1
+            if users > 0:
+                self._http_client_users[client] = users
+                return
+            self._http_client_users.pop(client, None)
+            dropped = all(pooled is not client for pooled in self._http_clients.values())
+        if dropped:
+            client.close()
+
+    def get_http_client(self, base_url: Optional[str]) -> httpx.Client:
+        """Shared keep-alive HTTP client for a given endpoint."""
+        base_url = base_url or ""
+        with self._lock:
+            client = self._http_clients.get(base_url)
+            if client is None or client.is_closed:
+                client = httpx.Client(limits=self.limits, follow_redirects=True)
+                self._http_clients[base_url] = client
+        handed_out = getattr(self._local, "handed_out", None)
+        if handed_out is not None:
+            handed_out.append(client)
+        return client
+
+    def get_async_openai_client(
+            self,
+            base_url: Optional[str],
+            api_key: Optional[str],
+            timeout: Union[float, httpx.Timeout, None] = None,
+    ) -> AsyncOpenAI:
+        """
+        Shared AsyncOpenAI client for the running event loop.
+
+        httpx async connections cannot cross event loops, so clients are kept per loop (the
+        Flask handlers run each request in a new loop) and closed while their loop shuts
+        down, since they cannot be closed once it is gone.
+        """
+        loop = asyncio.get_running_loop()
+        key = (base_url or "", self._digest(api_key), repr(timeout), id(loop))
+        with self._lock:
+            for stale_key, (stale_loop, stale_client, _) in list(self._async_openai_clients.items()):
+                if stale_loop.is_closed():
+                    del self._async_openai_clients[stale_key]
+                    if not stale_client.is_closed():
+                        logger.debug("Event loop closed without shutting down its async generators, "
+                                     "its AsyncOpenAI connections are left to the garbage collector")
+            entry = self._async_openai_clients.get(key)
+            if entry is not None and entry[0] is loop:
+                return entry[1]
+            client = AsyncOpenAI(
+                base_url=base_url or None,
+                api_key=api_key,
+                timeout=timeout if timeout is not None else DEFAULT_TIMEOUT,
+                http_client=httpx.AsyncClient(limits=self.limits, follow_redirects=True),
+            )
+            self._async_openai_clients[key] = (loop, client, self._close_with_loop(loop, client))
+            return client
+
+    @staticmethod
+    def _close_with_loop(loop: asyncio.AbstractEventLoop, client: AsyncOpenAI) -> AsyncIterator:
+        """
+        Close `client` while `loop` shuts down: asyncio.run finalizes the async generators still
+        suspended before it closes the loop, which runs this one's `finally`.
+        """
+
+        async def close_on_shutdown():
+            try:
+                yield
+            finally:
+                await client.close()
+
+        closer = close_on_shutdown()
+        loop.create_task(closer.__anext__())
+        return closer
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._models),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "http_clients": len(self._http_clients),
+                "async_openai_clients": len(self._async_openai_clients),
+            }
+
+    def clear(self) -> None:
+        """
+        Drop the pooled models and HTTP clients, closing the idle clients now and the ones live
+        models still use once those are released. Per-loop async clients close with their loop.
+        """
+        with self._lock:
+            self._models.clear()
+            dropped = list(self._http_clients.values())
+            self._http_clients.clear()
+            idle = [client for client in dropped if client not in self._http_client_users]
+        for client in idle:
+            client.close()
+
+
+llm_pool = LLMClientPool(
+    max_size=int(os.getenv("LLM_POOL_MAX_SIZE", "16")),
+    max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10")),
+)
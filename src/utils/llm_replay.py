@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableConfig
+from pydantic import ConfigDict, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Lines that change between otherwise identical runs and must not affect the cassette key
+VOLATILE_PATTERNS = [
+    (re.compile(r"Current date and time: \d{4}-\d{2}-\d{2} \d{2}:\d{2}"), "Current date and time: <now>"),
+]
+
+
+def _tool_call_chunks(message: AIMessage) -> List[Dict[str, Any]]:
+    """The tool calls of a whole message as stream chunks, which merge back into the same calls."""
+    chunks = [{"name": call["name"], "args": json.dumps(call["args"]), "id": call.get("id"), "index": i}
+              for i, call in enumerate(message.tool_calls)]
+    return chunks + [{"name": call.get("name"), "args": call.get("args"), "id": call.get("id"), "index": i}
+                     for i, call in enumerate(message.invalid_tool_calls, start=len(chunks))]
+
+
+class ReplayMissError(KeyError):
+    """Raised in strict replay mode when the cassette has no response for a request."""
+
+
+def normalize_messages(messages: List[BaseMessage]) -> List[Dict[str, Any]]:
+    """Role and text of each message; images and clock lines are replaced by placeholders."""
+
+    def normalize_text(text: str) -> str:
+        for pattern, replacement in VOLATILE_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text
+
+    normalized = []
+    for message in messages:
+        if isinstance(message.content, str):
+            content: Any = normalize_text(message.content)
+        else:
+            content = []
+            for item in message.content:
+                if isinstance(item, dict) and item.get("type") == "image_url":
+                    content.append("<image>")
+                elif isinstance(item, dict) and "text" in item:
+                    content.append(normalize_text(item["text"]))
+                else:
+                    content.append(normalize_text(str(item)))
+        normalized.append({"type": message.type, "content": content})
+    return normalized
+
+
+def request_key(messages: List[BaseMessage]) -> str:
+    payload = json.dumps(normalize_messages(messages), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Record/replay chat model for offline runs.
+
+    In "record" mode every request goes to `recorder` and the request/response pair is appended to
+    a JSONL cassette. In "replay" mode responses are served from the cassette by request key; when a
+    key is missing (e.g. a page rendered slightly differently) the next unused response in recorded
+    order is returned, unless `strict` is set. "auto" replays hits and records misses.
+
+    Each replayed call sleeps `latency + latency_scale * recorded_latency` seconds, so the agent loop
+    can be profiled at full speed (the default) or with realistic provider timing.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassette_path: str
+    model_name: str = "replay"
+    mode: str = "replay"
+    recorder: Optional[BaseChatModel] = None
+    latency: float = 0.0
+    latency_scale: float = 0.0
+    strict: bool = False
+    stream_chunk_size: int = 20
+
+    _by_key: Dict[str, deque] = PrivateAttr(default_factory=lambda: defaultdict(deque))
+    _in_order: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    _used: set = PrivateAttr(default_factory=set)
+    _cursor: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        if self.mode not in ("replay", "record", "auto"):
+            raise ValueError(f"Unsupported replay mode: {self.mode}")
+        if self.mode != "replay" and self.recorder is None:
+            raise ValueError(f"Replay mode '{self.mode}' needs a recorder model")
+        self._load()
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay-chat-model"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.cassette_path):
+            if self.mode == "replay":
+                raise FileNotFoundError(f"Cassette not found: {self.cassette_path}")
+            return
+        with open(self.cassette_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._add_interaction(json.loads(line))
+        logger.info(f"Loaded {len(self._in_order)} interactions from {self.cassette_path}")
+
+    def _add_interaction(self, interaction: Dict[str, Any]) -> None:
+        interaction["index"] = len(self._in_order)
+        self._in_order.append(interaction)
+        self._by_key[interaction["key"]].append(interaction)
+
+    def _next_interaction(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            candidates = self._by_key.get(key)
+            while candidates:
+                interaction = candidates.popleft()
+                if interaction["index"] not in self._used:
+                    self._used.add(interaction["index"])
+                    return interaction
+            if self.mode != "replay" or self.strict:
+                return None
+            while self._cursor < len(self._in_order) and self._cursor in self._used:
+                self._cursor += 1
+            if self._cursor >= len(self._in_order):
+                return None
+            interaction = self._in_order[self._cursor]
+            self._used.add(self._cursor)
+            logger.warning(f"No cassette entry for request {key[:12]}, replaying interaction {self._cursor} in order")
+            return interaction
+
+    @staticmethod
+    def _to_message(interaction: Dict[str, Any]) -> AIMessage:
+        message = loads(interaction["response"])
+        reasoning_content = message.additional_kwargs.get("reasoning_content")
+        if reasoning_content is not None:
+            # DeepSeek-R1 models expose the reasoning as an attribute of the message
+            message = AIMessage(**dict(message), reasoning_content=reasoning_content)
+        return message
+
+    def _record(self, key: str, messages: List[BaseMessage], message: AIMessage, latency: float) -> None:
+        reasoning_content = getattr(message, "reasoning_content", None)
+        stored = AIMessage(
+            content=message.content,
+            additional_kwargs=dict(message.additional_kwargs,
+                                   **({"reasoning_content": reasoning_content} if reasoning_content else {})),
+            response_metadata=message.response_metadata,
+            usage_metadata=message.usage_metadata,
+            tool_calls=message.tool_calls,
+            invalid_tool_calls=message.invalid_tool_calls,
+        )
+        interaction = {
+            "key": key,
+            "model": self.model_name,
+            "latency": round(latency, 4),
+            "request": normalize_messages(messages),
+            "response": dumps(stored),
+        }
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cassette_path)), exist_ok=True)
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+            self._add_interaction(interaction)
+            self._used.add(interaction["index"])
+
+    def _synthetic_latency(self, interaction: Dict[str, Any]) -> float:
+        return self.latency + self.latency_scale * interaction.get("latency", 0.0)
+
+    def _miss(self, key: str) -> ReplayMissError:
+        return ReplayMissError(f"No cassette entry for request {key} in {self.cassette_path}")
+
+    async def ainvoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AIMessage:
+        messages = self._convert_input(input).to_messages()
+        key = request_key(messages)
+        interaction = self._next_interaction(key) if self.mode != "record" else None
+        if interaction is not None:
+            delay = self._synthetic_latency(interaction)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return self._to_message(interaction)
+        if self.mode == "replay":
+            raise self._miss(key)
+        start = time.monotonic()
+        message = await self.recorder.ainvoke(messages, config, stop=stop, **kwargs)
+        self._record(key, messages, message, time.monotonic() - start)
+        return message
+
+    def invoke(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AIMessage:
+        messages = self._convert_input(input).to_messages()
+        key = request_key(messages)
+        interaction = self._next_interaction(key) if self.mode != "record" else None
+        if interaction is not None:
+            delay = self._synthetic_latency(interaction)
+            if delay > 0:
+                time.sleep(delay)
+            return self._to_message(interaction)
+        if self.mode == "replay":
+            raise self._miss(key)
+        start = time.monotonic()
+        message = self.recorder.invoke(messages, config, stop=stop, **kwargs)
+        self._record(key, messages, message, time.monotonic() - start)
+        return message
+
+    async def astream(
+            self,
+            input: LanguageModelInput,
+            config: Optional[RunnableConfig] = None,
+            *,
+            stop: Optional[list[str]] = None,
+            **kwargs: Any,
+    ) -> AsyncIterator[AIMessageChunk]:
+        """Replay the response in small chunks, spreading the synthetic latency over them."""
+        messages = self._convert_input(input).to_messages()
+        key = request_key(messages)
+        interaction = self._next_interaction(key) if self.mode != "record" else None
+        if interaction is None:
+            if self.mode == "replay":
+                raise self._miss(key)
+            message = await self.ainvoke(messages, config, stop=stop, **kwargs)
+            yield AIMessageChunk(content=message.content, usage_metadata=message.usage_metadata,
+                                 tool_call_chunks=_tool_call_chunks(message))
+            return
+        message = self._to_message(interaction)
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        pieces = [content[i:i + self.stream_chunk_size] for i in range(0, len(content), self.stream_chunk_size)] or [""]
+        delay = self._synthetic_latency(interaction) / len(pieces)
+        for i, piece in enumerate(pieces):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            last = i == len(pieces) - 1
+            yield AIMessageChunk(content=piece, usage_metadata=message.usage_metadata if last else None,
+                                 tool_call_chunks=_tool_call_chunks(message) if last else [])
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self.invoke(messages, stop=stop, **kwargs))])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cassette": self.cassette_path, "mode": self.mode,
+                    "interactions": len(self._in_order), "used": len(self._used)}
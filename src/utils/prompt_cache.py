@@ -0,0 +1,156 @@
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import AzureChatOpenAI, ChatOpenAI
+
+from .llm_circuit_breaker import CircuitBreakerChatModel, unwrap_llm
+from .llm_hedging import HedgedChatModel
+from .llm_key_scheduling import KeyScheduledChatModel
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def provider_family(llm: BaseChatModel) -> str:
+    """Provider family that decides which cache hints can be sent."""
+    if isinstance(llm, KeyScheduledChatModel) or isinstance(llm, CircuitBreakerChatModel) and llm.fallback is None:
+        return provider_family(llm.primary)
+    if isinstance(llm, (HedgedChatModel, CircuitBreakerChatModel)):
+        backup = llm.backup if isinstance(llm, HedgedChatModel) else llm.fallback
+        primary, backup = provider_family(llm.primary), provider_family(backup)
+        # hints are passed to both models, so they must understand the same ones
+        return primary if primary == backup and primary != "google" else "other"
+    if isinstance(llm, ChatAnthropic):
+        return "anthropic"
+    if isinstance(llm, AzureChatOpenAI):
+        return "azure_openai"
+    if isinstance(llm, ChatOpenAI):
+        base_url = str(llm.openai_api_base or "")
+        return "openai" if not base_url or "api.openai.com" in base_url else "openai_compatible"
+    if isinstance(llm, ChatGoogleGenerativeAI):
+        return "google"
+    return "other"
+
+
+def _with_cache_control(message: BaseMessage) -> BaseMessage:
+    content = message.content
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = [block if isinstance(block, dict) else {"type": "text", "text": block} for block in content]
+    text_blocks = [i for i, block in enumerate(blocks) if block.get("type") == "text" and block.get("text", "").strip()]
+    if not text_blocks:
+        return message
+    blocks = [dict(block) for block in blocks]
+    blocks[text_blocks[-1]]["cache_control"] = CACHE_CONTROL
+    return message.model_copy(update={"content": blocks})
+
+
+def cache_usage(ai_message: BaseMessage) -> Optional[Dict[str, int]]:
+    """Cached vs uncached input tokens reported by the provider, if any."""
+    usage = getattr(ai_message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens")
+    details = usage.get("input_token_details") or {}
+    cached = details.get("cache_read")
+    cache_creation = details.get("cache_creation")
+    token_usage = (getattr(ai_message, "response_metadata", None) or {}).get("token_usage") or {}
+    if cached is None and "prompt_cache_hit_tokens" in token_usage:
+        # DeepSeek reports its automatic context cache outside prompt_tokens_details
+        cached = token_usage["prompt_cache_hit_tokens"]
+    if input_tokens is None:
+        input_tokens = token_usage.get("prompt_tokens")
+    if input_tokens is None:
+        return None
+    cached = cached or 0
+    return {
+        "input_tokens": input_tokens,
+        "cached_input_tokens": cached,
+        "cache_creation_input_tokens": cache_creation or 0,
+        "uncached_input_tokens": max(input_tokens - cached, 0),
+        "output_tokens": usage.get("output_tokens") or token_usage.get("completion_tokens") or 0,
+    }
+
+
+class PromptCacheManager:
+    """
+    Adds provider prompt-cache hints to agent requests and tracks cached vs uncached input tokens.
+
+    - Anthropic: `cache_control` breakpoints on the system prompt and on the last message before
+      the current browser state, so the growing conversation prefix is reused on the next step.
+    - OpenAI: prefix caching is automatic; a stable `prompt_cache_key` derived from the system
+      prompt keeps requests of the same agent on the same cache shard.
+    - Gemini: the system prompt is uploaded once as cached content and referenced by name.
+      Prompts below the provider minimum are rejected by the API and sent uncached.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600):
+        self.ttl_seconds = ttl_seconds
+        self._gemini_caches: Dict[Tuple[str, str], Optional[str]] = {}
+        self.totals = {"steps": 0, "input_tokens": 0, "cached_input_tokens": 0,
+                       "cache_creation_input_tokens": 0, "uncached_input_tokens": 0}
+
+    @staticmethod
+    def _prefix_digest(messages: List[BaseMessage]) -> str:
+        system = next((m for m in messages if isinstance(m, SystemMessage)), None)
+        text = system.content if system is not None and isinstance(system.content, str) else repr(system)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def prepare(self, llm: BaseChatModel, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """Return the messages and extra invoke kwargs to send to `llm`."""
+        family = provider_family(llm)
+        if family == "anthropic":
+            return self._prepare_anthropic(messages), {}
+        if family == "openai":
+            return messages, {"prompt_cache_key": f"browser-agent-{self._prefix_digest(messages)}"}
+        if family == "google":
+            return self._prepare_gemini(unwrap_llm(llm), messages)
+        return messages, {}
+
+    @staticmethod
+    def _prepare_anthropic(messages: List[BaseMessage]) -> List[BaseMessage]:
+        prepared = list(messages)
+        if prepared and isinstance(prepared[0], SystemMessage):
+            prepared[0] = _with_cache_control(prepared[0])
+        # the last message is the per-step browser state; everything before it is stable
+        if len(prepared) > 2:
+            prepared[-2] = _with_cache_control(prepared[-2])
+        return prepared
+
+    def _prepare_gemini(self, llm: ChatGoogleGenerativeAI, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        if not messages or not isinstance(messages[0], SystemMessage):
+            return messages, {}
+        key = (llm.model, self._prefix_digest(messages))
+        if key not in self._gemini_caches:
+            try:
+                self._gemini_caches[key] = llm.create_cached_content([messages[0]], ttl=self.ttl_seconds)
+                logger.info(f"Created Gemini cached content {self._gemini_caches[key]}")
+            except Exception as e:
+                # typically the prompt is below the model's minimum cacheable size
+                logger.debug(f"Gemini cached content unavailable, sending the prompt uncached: {e}")
+                self._gemini_caches[key] = None
+        name = self._gemini_caches[key]
+        if name is None:
+            return messages, {}
+        return messages[1:], {"cached_content": name}
+
+    def record(self, ai_message: AIMessage) -> Optional[Dict[str, int]]:
+        usage = cache_usage(ai_message)
+        if usage is None:
+            return None
+        self.totals["steps"] += 1
+        for name in ("input_tokens", "cached_input_tokens", "cache_creation_input_tokens", "uncached_input_tokens"):
+            self.totals[name] += usage[name]
+        return usage
+
+    def stats(self) -> Dict[str, Any]:
+        input_tokens = self.totals["input_tokens"]
+        return dict(
+            self.totals,
+            cached_ratio=round(self.totals["cached_input_tokens"] / input_tokens, 3) if input_tokens else 0.0,
+        )
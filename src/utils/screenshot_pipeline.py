@@ -0,0 +1,124 @@
+import base64
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+def difference_hash(image: Image.Image, hash_size: int = 16) -> int:
+    """Perceptual dHash: one bit per horizontally adjacent pair of a (hash_size+1) x hash_size grayscale thumbnail."""
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+@dataclass
+class ProcessedScreenshot:
+    data_url: str
+    width: int
+    height: int
+    # Hamming distance to the previously sent screenshot's hash; None for the first one or without dedup
+    distance: Optional[int] = None
+    duplicate: bool = False
+
+
+class ScreenshotPipeline:
+    """
+    Prepares page screenshots for vision messages: downscales to `max_edge` pixels on the long edge,
+    re-encodes as png, jpeg or webp at `quality`, and flags a screenshot whose perceptual hash is
+    within `dedup_distance` bits of the last one sent (a negative distance disables dedup).
+    `detail` is passed on as the OpenAI image detail ("low" is a flat 85 tokens).
+    """
+
+    def __init__(
+            self,
+            max_edge: Optional[int] = None,
+            image_format: Optional[str] = None,
+            quality: Optional[int] = None,
+            dedup_distance: Optional[int] = None,
+            detail: Optional[str] = None,
+            hash_size: int = 16,
+    ):
+        self.max_edge = max_edge if max_edge is not None else int(os.getenv("VISION_MAX_EDGE", "1024"))
+        self.image_format = (image_format or os.getenv("VISION_IMAGE_FORMAT", "jpeg")).lower()
+        if self.image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported screenshot format: {self.image_format}")
+        self.quality = quality if quality is not None else int(os.getenv("VISION_IMAGE_QUALITY", "70"))
+        self.dedup_distance = dedup_distance if dedup_distance is not None else int(
+            os.getenv("VISION_DEDUP_DISTANCE", "0"))
+        self.detail = detail if detail is not None else os.getenv("VISION_IMAGE_DETAIL", "")
+        self.hash_size = hash_size
+        self._last_hash: Optional[int] = None
+        self.screenshots = 0
+        self.duplicates = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def reset(self) -> None:
+        """Forget the last sent screenshot, so the next one is never a duplicate."""
+        self._last_hash = None
+
+    def process(self, screenshot_b64: str) -> ProcessedScreenshot:
+        raw = base64.b64decode(screenshot_b64)
+        self.screenshots += 1
+        self.bytes_in += len(raw)
+        with Image.open(io.BytesIO(raw)) as image:
+            image.load()
+            distance = None
+            if self.dedup_distance >= 0:
+                image_hash = difference_hash(image, self.hash_size)
+                if self._last_hash is not None:
+                    distance = bin(image_hash ^ self._last_hash).count("1")
+                if distance is not None and distance <= self.dedup_distance:
+                    self.duplicates += 1
+                    return ProcessedScreenshot(data_url="", width=image.width, height=image.height,
+                                               distance=distance, duplicate=True)
+                self._last_hash = image_hash
+            if self.max_edge > 0 and max(image.size) > self.max_edge:
+                scale = self.max_edge / max(image.size)
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                     Image.Resampling.LANCZOS)
+            pil_format, mime_type = IMAGE_FORMATS[self.image_format]
+            if pil_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            if pil_format == "PNG":
+                image.save(buffer, format=pil_format, optimize=True)
+            else:
+                image.save(buffer, format=pil_format, quality=self.quality)
+            encoded = buffer.getvalue()
+            self.bytes_out += len(encoded)
+            return ProcessedScreenshot(
+                data_url=f"data:{mime_type};base64,{base64.b64encode(encoded).decode('utf-8')}",
+                width=image.width,
+                height=image.height,
+                distance=distance,
+            )
+
+    def record_tokens(self, original: int, sent: int) -> None:
+        """Image tokens the screenshot would have cost as captured, and what was sent instead."""
+        self.tokens_in += original
+        self.tokens_out += sent
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "screenshots": self.screenshots,
+            "duplicates": self.duplicates,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "image_tokens_in": self.tokens_in,
+            "image_tokens_out": self.tokens_out,
+        }
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from browser_use.browser.views import BrowserStateHistory
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotStore:
+    """
+    Content-addressed screenshot files under `root`: a frame is written once as `<sha256>.png` and
+    every history item showing the same frame refers to that file.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.frames = 0
+        self.duplicates = 0
+        self.bytes_written = 0
+        self._known = set()
+
+    def path(self, ref: str) -> str:
+        return os.path.join(self.root, f"{ref}.png")
+
+    def put(self, screenshot: str) -> str:
+        """Store a base64 screenshot and return its reference."""
+        data = base64.b64decode(screenshot)
+        ref = hashlib.sha256(data).hexdigest()
+        if ref in self._known or os.path.exists(self.path(ref)):
+            self.duplicates += 1
+        else:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.path(ref) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(ref))
+            self.frames += 1
+            self.bytes_written += len(data)
+        self._known.add(ref)
+        return ref
+
+    def read_bytes(self, ref: str) -> bytes:
+        with open(self.path(ref), "rb") as f:
+            return f.read()
+
+    def get(self, ref: str) -> str:
+        """The base64 screenshot for a reference."""
+        return base64.b64encode(self.read_bytes(ref)).decode("ascii")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "duplicates": self.duplicates,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class StoredBrowserStateHistory(BrowserStateHistory):
+    """
+    History state whose screenshot lives in a ScreenshotStore. `screenshot` reads the frame back on
+    access; serialized history carries the reference and file path instead of the base64 data.
+    """
+
+    def __init__(self, url, title, tabs, interacted_element, screenshot: Optional[str] = None,
+                 store: Optional[ScreenshotStore] = None, screenshot_ref: Optional[str] = None):
+        self.store = store
+        self.screenshot_ref = screenshot_ref
+        super().__init__(url=url, title=title, tabs=tabs, interacted_element=interacted_element,
+                         screenshot=screenshot)
+
+    @property
+    def screenshot(self) -> Optional[str]:
+        if not self.screenshot_ref or self.store is None:
+            return None
+        try:
+            return self.store.get(self.screenshot_ref)
+        except OSError as e:
+            logger.warning(f"Screenshot {self.screenshot_ref} is no longer available: {e}")
+            return None
+
+    @screenshot.setter
+    def screenshot(self, value: Optional[str]) -> None:
+        if value is None:
+            return
+        if self.store is None:
+            raise ValueError("StoredBrowserStateHistory needs a store to keep a screenshot")
+        self.screenshot_ref = self.store.put(value)
+
+    @property
+    def screenshot_path(self) -> Optional[str]:
+        if not self.screenshot_ref or self.store is None:
+            return None
+        return self.store.path(self.screenshot_ref)
+
+    @classmethod
+    def from_state(cls, state: BrowserStateHistory, store: ScreenshotStore) -> "StoredBrowserStateHistory":
+        return cls(url=state.url, title=state.title, tabs=state.tabs, interacted_element=state.interacted_element,
+                   screenshot=state.screenshot, store=store)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "tabs": [tab.model_dump() for tab in self.tabs],
+            "screenshot": None,
+            "interacted_element": [el.to_dict() if el else None for el in self.interacted_element],
+            "url": self.url,
+            "title": self.title,
+        }
+        if self.screenshot_ref:
+            data["screenshot_ref"] = self.screenshot_ref
+            data["screenshot_path"] = self.screenshot_path
+        return data
@@ -0,0 +1,256 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_DIR = os.getenv("TOKENIZER_DIR", "./tmp/tokenizers")
+
+# Split patterns of the OpenAI encodings, so local .tiktoken files can be loaded without tiktoken_ext
+TIKTOKEN_PATTERNS = {
+    "o200k_base": "|".join([
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""\p{N}{1,3}""",
+        r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+        r"""\s*[\r\n]+""",
+        r"""\s+(?!\S)""",
+        r"""\s+""",
+    ]),
+    "cl100k_base": r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+}
+
+# family -> (tokenizer file names tried in TOKENIZER_DIR, characters per token for the fallback estimate)
+TOKENIZER_FAMILIES: Dict[str, Tuple[Tuple[str, ...], float]] = {
+    "openai-o200k": (("o200k_base.tiktoken",), 4.0),
+    "openai-cl100k": (("cl100k_base.tiktoken",), 3.8),
+    "anthropic": (("anthropic.json",), 3.5),
+    "google": (("gemma.json", "google.json"), 4.0),
+    "mistral": (("mistral.json",), 3.5),
+    "deepseek": (("deepseek.json",), 3.6),
+    "qwen": (("qwen.json",), 3.6),
+    "llama": (("llama.json",), 3.8),
+    "generic": ((), 3.0),
+}
+
+
+def tokenizer_family(llm: Any) -> str:
+    """Map a chat model to the tokenizer family used to count its tokens."""
+    primary = getattr(llm, "primary", None)
+    if primary is not None:
+        # hedged models are billed by whichever model answers; count with the primary's tokenizer
+        return tokenizer_family(primary)
+    class_name = llm.__class__.__name__
+    model_name = str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or "").lower()
+    if "Anthropic" in class_name or "claude" in model_name:
+        return "anthropic"
+    if "Google" in class_name or "gemini" in model_name or "gemma" in model_name:
+        return "google"
+    if "Mistral" in class_name or "mistral" in model_name or "pixtral" in model_name:
+        return "mistral"
+    if "deepseek" in model_name:
+        return "deepseek"
+    if "qwen" in model_name:
+        return "qwen"
+    if "llama" in model_name:
+        return "llama"
+    if "OpenAI" in class_name:
+        if "gpt-4o" in model_name or model_name.startswith(("o1", "o3", "o4", "gpt-4.1", "gpt-5")):
+            return "openai-o200k"
+        return "openai-cl100k"
+    return "generic"
+
+
+def _load_tiktoken(file_name: str) -> Optional[Callable[[str], int]]:
+    import tiktoken
+    from tiktoken.load import load_tiktoken_bpe
+
+    encoding_name = file_name.split(".")[0]
+    local_path = os.path.join(TOKENIZER_DIR, file_name)
+    if os.path.exists(local_path):
+        encoding = tiktoken.Encoding(
+            name=encoding_name,
+            pat_str=TIKTOKEN_PATTERNS[encoding_name],
+            mergeable_ranks=load_tiktoken_bpe(local_path),
+            special_tokens={},
+        )
+        return lambda text: len(encoding.encode_ordinary(text))
+    # reuse tiktoken's own download cache, but never download from here
+    cache_dir = os.getenv("TIKTOKEN_CACHE_DIR") or os.getenv("DATA_GYM_CACHE_DIR") or os.path.join(
+        tempfile.gettempdir(), "data-gym-cache")
+    url = f"https://openaipublic.blob.core.windows.net/encodings/{file_name}"
+    if os.path.exists(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())):
+        encoding = tiktoken.get_encoding(encoding_name)
+        return lambda text: len(encoding.encode_ordinary(text))
+    return None
+
+
+def model_token_counter(llm: Any) -> Optional[Callable[[str], int]]:
+    """The model's own `get_num_tokens`, for OpenAI models whose encoding is not on disk."""
+    while getattr(llm, "primary", None) is not None:
+        llm = llm.primary
+    if "OpenAI" not in llm.__class__.__name__:
+        return None
+    return llm.get_num_tokens
+
+
+def _load_hf_tokenizer(file_name: str) -> Optional[Callable[[str], int]]:
+    local_path = os.path.join(TOKENIZER_DIR, file_name)
+    if not os.path.exists(local_path):
+        return None
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(local_path)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    """Character based estimate; non-ASCII characters (e.g. CJK) are close to one token each."""
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return int((len(text) - non_ascii) / chars_per_token + non_ascii)
+
+
+def image_size(image_url: str) -> Optional[Tuple[int, int]]:
+    """Width and height of a base64 data url; only the image header is decoded."""
+    if not image_url.startswith("data:"):
+        return None
+    try:
+        data = image_url.split(",", 1)[1]
+        # PNG keeps the size in the IHDR chunk, within the first 24 bytes
+        header = base64.b64decode(data[:32])
+        if header[:8] == b"\x89PNG\r\n\x1a\n":
+            return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+        with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+            return image.size
+    except (IndexError, ValueError, binascii.Error, OSError):
+        return None
+
+
+def image_tokens(family: str, width: int, height: int, default: int = 800) -> int:
+    """Provider-specific input tokens for an image of the given size."""
+    if family.startswith("openai"):
+        # fit in 2048x2048, shortest side to 768, then 170 tokens per 512px tile plus 85 base tokens
+        scale = min(1.0, 2048 / max(width, height))
+        width, height = width * scale, height * scale
+        scale = min(1.0, 768 / min(width, height))
+        width, height = width * scale, height * scale
+        return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+    if family == "anthropic":
+        # long edge is limited to 1568px, then about one token per 750 pixels
+        scale = min(1.0, 1568 / max(width, height))
+        return min(1600, math.ceil(width * scale * height * scale / 750))
+    if family == "google":
+        # small images are a single 258 token tile, larger ones are cropped into 768x768 tiles
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+    if family == "mistral":
+        # pixtral: 16x16 patches on an image whose long edge is at most 1024px, plus one break token per row
+        scale = min(1.0, 1024 / max(width, height))
+        rows, cols = math.ceil(height * scale / 16), math.ceil(width * scale / 16)
+        return rows * cols + rows
+    if family == "qwen":
+        return math.ceil(width / 28) * math.ceil(height / 28)
+    return default
+
+
+class TokenCounter:
+    """
+    Offline token counter for one tokenizer family.
+
+    Tokenizer files are only read from TOKENIZER_DIR (or tiktoken's local cache); nothing is
+    downloaded here. Without a tokenizer file, `fallback` counts (the OpenAI models' own tiktoken
+    counter, which may fetch the encoding once), and without either a per-family
+    characters-per-token estimate is used. Text counts are memoized by content hash so long runs
+    never re-tokenize the same prompt; this is the only token count cache.
+    """
+
+    def __init__(self, family: str, max_cache_entries: int = 4096,
+                 fallback: Optional[Callable[[str], int]] = None):
+        self.family = family
+        file_names, self.chars_per_token = TOKENIZER_FAMILIES.get(family, TOKENIZER_FAMILIES["generic"])
+        self._count: Optional[Callable[[str], int]] = None
+        for file_name in file_names:
+            try:
+                loader = _load_tiktoken if file_name.endswith(".tiktoken") else _load_hf_tokenizer
+                self._count = loader(file_name)
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {file_name}: {e}")
+            if self._count is not None:
+                logger.debug(f"Using {file_name} for {family} token counts")
+                break
+        if self._count is None and fallback is not None:
+            logger.debug(f"No tokenizer file for {family}, counting tokens with the model")
+            self._count = fallback
+        self.exact = self._count is not None
+        self.max_cache_entries = max_cache_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+        tokens = self._count_uncached(text)
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def _count_uncached(self, text: str) -> int:
+        count = self._count
+        if count is not None:
+            try:
+                return count(text)
+            except Exception as e:
+                logger.warning(f"Could not count {self.family} tokens, estimating them from now on: {e}")
+                self._count, self.exact = None, False
+        return estimate_tokens(text, self.chars_per_token)
+
+    def count_image(self, image_url: str, default: int = 800, detail: Optional[str] = None) -> int:
+        if detail == "low" and self.family.startswith("openai"):
+            return 85
+        size = image_size(image_url)
+        if size is None:
+            return default
+        return image_tokens(self.family, size[0], size[1], default)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"family": self.family, "exact": self.exact, "entries": len(self._cache),
+                    "hits": self.hits, "misses": self.misses}
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(llm: Any) -> TokenCounter:
+    """Process-wide counter for the tokenizer family of `llm`."""
+    family = tokenizer_family(llm)
+    with _counters_lock:
+        counter = _counters.get(family)
+        if counter is None:
+            counter = TokenCounter(family, fallback=model_token_counter(llm) if family.startswith("openai") else None)
+            _counters[family] = counter
+        return counter
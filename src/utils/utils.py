@@ -12,7 +12,15 @@ from langchain_ollama import ChatOllama
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 import gradio as gr
 
+from src.llm.gemini_llm import GeminiLLM
 from .llm import DeepSeekR1ChatOpenAI, DeepSeekR1ChatOllama
+from .llm_cache import with_response_cache
+from .llm_circuit_breaker import CircuitBreakerChatModel, circuit_breakers
+from .key_scheduler import get_key_scheduler
+from .llm_hedging import HedgedChatModel
+from .llm_key_scheduling import KeyScheduledChatModel
+from .llm_replay import ReplayChatModel
+from .llm_pool import llm_pool
 
 PROVIDER_DISPLAY_NAMES = {
     "openai": "OpenAI",
@@ -20,16 +28,29 @@ PROVIDER_DISPLAY_NAMES = {
     "anthropic": "Anthropic",
     "deepseek": "DeepSeek",
     "google": "Google",
-    "alibaba": "Alibaba"
+    "alibaba": "Alibaba",
+    "replay": "Replay (offline cassettes)"
 }
 
 def get_llm_model(provider: str, **kwargs):
     """
     获取LLM 模型
+    Instances are shared through the process-wide `llm_pool`; pass use_pool=False to get a fresh one.
+    Pass use_cache=True to read and write the persistent response cache.
+    provider="replay" serves responses from a cassette (see ReplayChatModel); with replay_mode="record"
+    or "auto" the model of replay_provider (LLM_REPLAY_PROVIDER) is called and recorded.
+    Pass hedge_provider / hedge_model_name (or set LLM_HEDGE_PROVIDER / LLM_HEDGE_MODEL_NAME) to
+    hedge slow calls to a backup model; hedge_provider="" disables hedging.
+    With LLM_CIRCUIT_BREAKER=true (or circuit_breaker=True) models are guarded by a per (provider, model, key) breaker;
+    failover_provider / failover_model_name (LLM_FAILOVER_PROVIDER / LLM_FAILOVER_MODEL_NAME) name the
+    model used while the circuit is open, failover_provider="" disables failover.
     :param provider: 模型类型
     :param kwargs:
     :return:
     """
+    if provider == "replay":
+        # cassettes keep their own cursor, so replay models are never shared through the pool
+        return _create_replay_llm_model(**kwargs)
     if provider not in ["ollama"]:
         env_var = f"{provider.upper()}_API_KEY"
         api_key = kwargs.get("api_key", "") or os.getenv(env_var, "")
@@ -37,6 +58,136 @@ def get_llm_model(provider: str, **kwargs):
             handle_api_key_error(provider, env_var)
         kwargs["api_key"] = api_key
 
+    use_pool = kwargs.pop("use_pool", True)
+    use_cache = kwargs.pop("use_cache", False)
+    hedge_provider = kwargs.pop("hedge_provider", None)
+    if hedge_provider is None:
+        hedge_provider = os.getenv("LLM_HEDGE_PROVIDER", "")
+    hedge_kwargs = {name[len("hedge_"):]: kwargs.pop(name) for name in list(kwargs) if name.startswith("hedge_")}
+    failover_provider = kwargs.pop("failover_provider", None)
+    if failover_provider is None:
+        failover_provider = os.getenv("LLM_FAILOVER_PROVIDER", "")
+    failover_model_name = kwargs.pop("failover_model_name", "") or os.getenv("LLM_FAILOVER_MODEL_NAME", "")
+    use_breaker = kwargs.pop("circuit_breaker", os.getenv("LLM_CIRCUIT_BREAKER", "false").lower() == "true")
+    if hedge_provider:
+        factory = lambda: _create_hedged_llm_model(provider, hedge_provider, kwargs, hedge_kwargs, use_pool)
+        pool_params = dict(kwargs, hedge_provider=hedge_provider,
+                           **{f"hedge_{name}": value for name, value in hedge_kwargs.items()})
+    elif use_breaker:
+        factory = lambda: _create_guarded_llm_model(provider, kwargs, failover_provider, failover_model_name, use_pool)
+        pool_params = dict(kwargs, failover_provider=failover_provider, failover_model_name=failover_model_name)
+    else:
+        factory = lambda: _create_llm_model(provider, **kwargs)
+        pool_params = kwargs
+    if use_pool:
+        llm = llm_pool.get_or_create(provider, pool_params, factory)
+    else:
+        llm = factory()
+    if use_cache:
+        llm = with_response_cache(llm)
+    return llm
+
+
+def get_scheduled_llm_model(provider: str, retries: int = 3, **kwargs):
+    """
+    Model that takes a key from the provider's KeyScheduler (<PROVIDER>_API_KEYS, _RPM, _TPM) for
+    every call, so requests and tokens are charged per call against the key that served it. The
+    per-key models come from get_llm_model; a response cache goes in front of the scheduling.
+    """
+    use_cache = kwargs.pop("use_cache", False)
+    llm = KeyScheduledChatModel(
+        scheduler=get_key_scheduler(provider),
+        model_factory=lambda api_key: get_llm_model(provider, api_key=api_key, **kwargs),
+        model_name=kwargs.get("model_name", ""),
+        retries=retries,
+    )
+    if use_cache:
+        llm = with_response_cache(llm)
+    return llm
+
+
+def get_small_llm_model(temperature: float = 0.0):
+    """
+    Small/fast model for the agent step router, configured by AGENT_SMALL_LLM_PROVIDER and
+    AGENT_SMALL_LLM_MODEL_NAME. Returns None when routing is not configured.
+    """
+    provider = os.getenv("AGENT_SMALL_LLM_PROVIDER", "")
+    if not provider:
+        return None
+    kwargs = {"temperature": temperature}
+    if os.getenv("AGENT_SMALL_LLM_MODEL_NAME", ""):
+        kwargs["model_name"] = os.getenv("AGENT_SMALL_LLM_MODEL_NAME")
+    return get_llm_model(provider, **kwargs)
+
+
+def _create_replay_llm_model(**kwargs):
+    model_name = kwargs.pop("model_name", "") or "default"
+    mode = kwargs.pop("replay_mode", "") or os.getenv("LLM_REPLAY_MODE", "replay")
+    cassette_path = kwargs.pop("cassette_path", "") or os.path.join(
+        os.getenv("LLM_REPLAY_DIR", "./tmp/cassettes"), f"{model_name.replace('/', '_').replace(':', '_')}.jsonl")
+    record_provider = kwargs.pop("replay_provider", "") or os.getenv("LLM_REPLAY_PROVIDER", "")
+    latency = kwargs.pop("replay_latency", None)
+    if latency is None:
+        latency = os.getenv("LLM_REPLAY_LATENCY", "0")
+    latency_scale = kwargs.pop("replay_latency_scale", None)
+    if latency_scale is None:
+        latency_scale = os.getenv("LLM_REPLAY_LATENCY_SCALE", "0")
+    recorder = None
+    if mode != "replay":
+        if not record_provider:
+            raise ValueError("Recording a cassette needs replay_provider or LLM_REPLAY_PROVIDER")
+        recorder = get_llm_model(record_provider, model_name=model_name, **kwargs)
+    return ReplayChatModel(
+        cassette_path=cassette_path,
+        model_name=model_name,
+        mode=mode,
+        recorder=recorder,
+        latency=float(latency),
+        latency_scale=float(latency_scale),
+        strict=os.getenv("LLM_REPLAY_STRICT", "false").lower() == "true",
+    )
+
+
+def _create_guarded_llm_model(provider: str, kwargs: dict, failover_provider: str, failover_model_name: str,
+                              use_pool: bool):
+    llm = _create_llm_model(provider, **kwargs)
+    model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or ""
+    fallback = None
+    if failover_provider:
+        failover_kwargs = {"temperature": kwargs.get("temperature", 0.0)}
+        if failover_model_name:
+            failover_kwargs["model_name"] = failover_model_name
+        fallback = get_llm_model(failover_provider, failover_provider="", hedge_provider="", use_pool=use_pool,
+                                 **failover_kwargs)
+    return CircuitBreakerChatModel(
+        primary=llm,
+        breaker=circuit_breakers.get(provider, model_name, kwargs.get("api_key")),
+        fallback=fallback,
+    )
+
+
+def _create_hedged_llm_model(provider: str, hedge_provider: str, kwargs: dict, hedge_kwargs: dict, use_pool: bool):
+    backup_kwargs = {
+        "model_name": hedge_kwargs.get("model_name") or os.getenv("LLM_HEDGE_MODEL_NAME", ""),
+        "temperature": kwargs.get("temperature", 0.0),
+        "base_url": hedge_kwargs.get("base_url", ""),
+        "api_key": hedge_kwargs.get("api_key", ""),
+    }
+    backup_kwargs = {name: value for name, value in backup_kwargs.items() if value != ""}
+    primary = get_llm_model(provider, hedge_provider="", failover_provider="", use_pool=use_pool, **kwargs)
+    backup = get_llm_model(hedge_provider, hedge_provider="", failover_provider="", use_pool=use_pool, **backup_kwargs)
+    return HedgedChatModel(
+        primary=primary,
+        backup=backup,
+        percentile=float(hedge_kwargs.get("percentile") or os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+        initial_delay=float(hedge_kwargs.get("initial_delay") or os.getenv("LLM_HEDGE_INITIAL_DELAY", "10")),
+        min_samples=int(hedge_kwargs.get("min_samples") or os.getenv("LLM_HEDGE_MIN_SAMPLES", "5")),
+    )
+
+
+@llm_pool.tracks_http_clients
+def _create_llm_model(provider: str, **kwargs):
+    api_key = kwargs.get("api_key", "")
     if provider == "anthropic":
         if not kwargs.get("base_url", ""):
             base_url = "https://api.anthropic.com"
@@ -76,6 +227,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            http_client=llm_pool.get_http_client(base_url),
         )
     elif provider == "deepseek":
         if not kwargs.get("base_url", ""):
@@ -96,8 +248,15 @@ def get_llm_model(provider: str, **kwargs):
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
                 api_key=api_key,
+                http_client=llm_pool.get_http_client(base_url),
             )
     elif provider == "google":
+        if os.getenv("GOOGLE_LLM_BACKEND", "langchain") == "genai":
+            return GeminiLLM(
+                api_key=api_key,
+                model_name=kwargs.get("model_name", "gemini-2.0-flash-exp"),
+                temperature=kwargs.get("temperature", 0.0),
+            )
         return ChatGoogleGenerativeAI(
             model=kwargs.get("model_name", "gemini-2.0-flash-exp"),
             temperature=kwargs.get("temperature", 0.0),
@@ -136,6 +295,7 @@ def get_llm_model(provider: str, **kwargs):
             api_version=api_version,
             azure_endpoint=base_url,
             api_key=api_key,
+            http_client=llm_pool.get_http_client(base_url),
         )
     elif provider == "alibaba":
         if not kwargs.get("base_url", ""):
@@ -148,6 +308,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            http_client=llm_pool.get_http_client(base_url),
         )
     else:
         raise ValueError(f"Unsupported provider: {provider}")
@@ -161,7 +322,8 @@ model_names = {
     "ollama": ["qwen2.5:7b", "llama2:7b", "deepseek-r1:14b", "deepseek-r1:32b"],
     "azure_openai": ["gpt-4o", "gpt-4", "gpt-3.5-turbo"],
     "mistral": ["pixtral-large-latest", "mistral-large-latest", "mistral-small-latest", "ministral-8b-latest"],
-    "alibaba": ["qwen-plus", "qwen-max", "qwen-turbo", "qwen-long"]
+    "alibaba": ["qwen-plus", "qwen-max", "qwen-turbo", "qwen-long"],
+    "replay": ["default"]
 }
 
 # Callback to update the model name dropdown based on the selected provider
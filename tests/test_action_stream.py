@@ -0,0 +1,169 @@
+import asyncio
+import json
+import sys
+from types import SimpleNamespace
+
+sys.path.append(".")
+
+
+def test_incremental_parser_emits_actions_as_they_close():
+    from src.agent.action_stream import IncrementalAgentOutputParser
+
+    response = "```json\n" + json.dumps({
+        "current_state": {"thought": "braces {inside} and \"quotes\"", "summary": "open page"},
+        "action": [
+            {"go_to_url": {"url": "https://example.com/{x}"}},
+            {"input_text": {"index": 2, "text": "]}"}},
+        ],
+    }) + "\n```"
+    parser = IncrementalAgentOutputParser()
+    events = []
+    for i in range(0, len(response), 5):
+        events.extend((i, event) for event in parser.feed(response[i:i + 5]))
+
+    kinds = [event.kind for _, event in events]
+    assert kinds == ["current_state", "action", "action"]
+    assert events[0][1].data["summary"] == "open page"
+    assert events[1][1].data == {"go_to_url": {"url": "https://example.com/{x}"}}
+    assert events[2][1].data["input_text"]["text"] == "]}"
+    # the first action is surfaced before the second one has been written
+    assert events[1][0] < response.index("input_text")
+    assert parser.done
+
+
+def test_incremental_parser_ignores_incomplete_tail():
+    from src.agent.action_stream import IncrementalAgentOutputParser
+
+    parser = IncrementalAgentOutputParser()
+    events = parser.feed('{"current_state": {"summary": "s"}, "action": [{"click_element": {"index": 1}}, {"click_el')
+    assert [event.kind for event in events] == ["current_state", "action"]
+    assert not parser.done
+
+
+def test_dispatcher_runs_the_rest_of_the_final_plan_after_a_mismatch():
+    from browser_use.agent.views import ActionResult
+    from src.agent.action_stream import EarlyActionDispatcher
+    from src.controller.custom_controller import CustomController
+
+    ActionModel = CustomController().registry.create_action_model()
+
+    class FakeController:
+        executed = []
+
+        async def act(self, action, browser_context):
+            self.executed.append(action.model_dump(exclude_unset=True))
+            await asyncio.sleep(0.05)
+            return ActionResult(extracted_content="ok")
+
+    async def get_session():
+        return SimpleNamespace(cached_state=SimpleNamespace(selector_map={}))
+
+    async def remove_highlights():
+        pass
+
+    context = SimpleNamespace(get_session=get_session, remove_highlights=remove_highlights,
+                              config=SimpleNamespace(wait_between_actions=0))
+    scroll, back, forward = ActionModel(scroll_down={}), ActionModel(go_back={}), ActionModel(scroll_up={})
+
+    async def run():
+        controller = FakeController()
+        dispatcher = EarlyActionDispatcher(controller, context, max_actions=5)
+        dispatcher.start()
+        dispatcher.submit(scroll)
+        dispatcher.submit(forward)
+        # the first streamed action is running when the final response arrives
+        await asyncio.sleep(0.01)
+        result = await dispatcher.finish([scroll, back])
+        assert dispatcher.mismatch_index == 1 and not dispatcher.halted
+        assert len(result) <= dispatcher.mismatch_index
+        result = await dispatcher.run_remaining([scroll, back][len(result):])
+        return controller.executed, result
+
+    executed, result = asyncio.run(run())
+    assert executed == [{"scroll_down": {}}, {"go_back": {}}] and len(result) == 2
+
+
+def fake_browser_context():
+    from browser_use.browser.views import BrowserState
+    from browser_use.dom.views import DOMElementNode
+
+    state = BrowserState(
+        element_tree=DOMElementNode(is_visible=True, parent=None, tag_name="body", xpath="/body", attributes={},
+                                    children=[]),
+        selector_map={}, url="https://example.com", title="Example", tabs=[])
+
+    async def get_session():
+        return SimpleNamespace(cached_state=state)
+
+    async def get_state(use_vision=False):
+        return state
+
+    async def remove_highlights():
+        pass
+
+    return SimpleNamespace(get_session=get_session, get_state=get_state, remove_highlights=remove_highlights,
+                           config=SimpleNamespace(wait_between_actions=0))
+
+
+def test_actions_that_ran_before_a_mid_stream_failure_are_reported():
+    from browser_use.agent.views import ActionResult
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from src.agent.action_stream import EarlyActionDispatcher
+    from src.agent.custom_agent import CustomAgent
+    from src.agent.custom_prompts import CustomAgentMessagePrompt, CustomSystemPrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.controller.custom_controller import CustomController
+
+    class FailingController(CustomController):
+        executed = []
+
+        async def act(self, action, browser_context):
+            name = next(iter(action.model_dump(exclude_unset=True)))
+            self.executed.append(name)
+            if name == "go_back":
+                raise RuntimeError("browser crashed")
+            return ActionResult(extracted_content=f"ran {name}")
+
+    ActionModel = FailingController().registry.create_action_model()
+
+    async def dispatch():
+        dispatcher = EarlyActionDispatcher(FailingController(), fake_browser_context(), max_actions=5)
+        dispatcher.start()
+        dispatcher.submit(ActionModel(scroll_down={}))
+        dispatcher.submit(ActionModel(go_back={}))
+        try:
+            await dispatcher.finish([ActionModel(scroll_down={}), ActionModel(go_back={})])
+            assert False, "the failing action should surface from finish"
+        except RuntimeError:
+            pass
+        assert not dispatcher.closed
+        return await dispatcher.abort()
+
+    assert [result.extracted_content for result in asyncio.run(dispatch())] == ["ran scroll_down"]
+
+    reply = json.dumps({
+        "current_state": {"prev_action_evaluation": "", "important_contents": "", "task_progress": "",
+                          "future_plans": "", "thought": "", "summary": "go"},
+        "action": [{"scroll_down": {}}, {"go_back": {}}],
+    })
+    controller = FailingController()
+    controller.executed = []
+    agent = CustomAgent(task="Read the page", llm=GenericFakeChatModel(messages=iter([AIMessage(content=reply)])),
+                        browser_context=fake_browser_context(), controller=controller, use_vision=False,
+                        system_prompt_class=CustomSystemPrompt, agent_prompt_class=CustomAgentMessagePrompt,
+                        early_action_dispatch=True)
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="Read the page", add_infos="", memory="",
+                                    task_progress="", future_plans="")
+    asyncio.run(agent.step(step_info))
+    # the action that ran is reported with the error, so the next step does not run it again
+    assert controller.executed == ["scroll_down", "go_back"]
+    assert len(agent._last_result) == 1 and "browser crashed" in agent._last_result[0].error
+    assert agent._last_actions[0].model_dump(exclude_unset=True) == {"scroll_down": {}}
+
+
+if __name__ == "__main__":
+    test_incremental_parser_emits_actions_as_they_close()
+    test_incremental_parser_ignores_incomplete_tail()
+    test_dispatcher_runs_the_rest_of_the_final_plan_after_a_mismatch()
+    test_actions_that_ran_before_a_mid_stream_failure_are_reported()
@@ -0,0 +1,46 @@
+import asyncio
+import sys
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+sys.path.append(".")
+
+
+def test_memory_dedups_and_stays_within_budget():
+    from src.agent.agent_memory import MemoryStore
+    from src.utils.token_counter import TokenCounter
+
+    counter = TokenCounter("generic")
+    memory = MemoryStore(counter, budget_tokens=120, recent=3, summarizer="extractive")
+    assert memory.add("The cheapest flight from Berlin to Rome costs 89 EUR on 2024-05-03.")
+    assert not memory.add("the cheapest flight from Berlin to Rome costs 89 EUR on 2024-05-03")
+    assert not memory.add("Rome costs 89 EUR")
+    for step in range(60):
+        memory.add(f"Step {step}: looked at result page {step} and scrolled further down the list of offers.")
+        assert memory.tokens() <= 120
+    assert len(memory.entries) <= 3
+    assert memory.render().startswith("Digest of earlier steps:")
+    assert "Step 59" in memory.render()
+    # the final result still has every finding
+    assert "89 EUR" in memory.full_text() and "Step 0:" in memory.full_text()
+    assert memory.stats()["duplicates"] == 2
+
+
+def test_llm_summary_replaces_digest():
+    from src.agent.agent_memory import MemoryStore
+    from src.utils.token_counter import TokenCounter
+
+    memory = MemoryStore(TokenCounter("generic"), budget_tokens=80, recent=2, summarizer="llm")
+    for page, name in enumerate(("Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot")):
+        assert memory.add(f"Company {name} is listed on page {page + 1} with a rating of {35 + page * 3} points.")
+    assert memory.needs_summary
+    asyncio.run(memory.summarize(FakeListChatModel(responses=["Six companies rated 35-50 points."])))
+    assert not memory.needs_summary
+    assert memory.digest == ["Six companies rated 35-50 points."]
+    assert memory.render().startswith("Digest of earlier steps: Six companies")
+    assert memory.stats()["summaries"] == 1
+
+
+if __name__ == "__main__":
+    test_memory_dedups_and_stays_within_budget()
+    test_llm_summary_replaces_digest()
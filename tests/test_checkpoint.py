@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+sys.path.append(".")
+
+
+def reply(action, summary):
+    return AIMessage(content=json.dumps({
+        "current_state": {"prev_action_evaluation": "Success", "important_contents": f"Fact from {summary}",
+                          "task_progress": summary, "future_plans": "", "thought": "", "summary": summary},
+        "action": [action],
+    }))
+
+
+class FakeBrowserContext:
+    """Just enough of a BrowserContext for agent steps, checkpoint capture and restore."""
+
+    def __init__(self):
+        from browser_use.browser.views import BrowserState
+        from browser_use.dom.views import DOMElementNode
+
+        self.state = BrowserState(
+            element_tree=DOMElementNode(is_visible=True, parent=None, tag_name="body", xpath="/body", attributes={},
+                                        children=[]),
+            selector_map={}, url="https://example.com/cart", title="Cart", tabs=[])
+        page = SimpleNamespace(url=self.state.url)
+        self.cookies = []
+        self.navigated = []
+
+        async def storage_state():
+            return {"cookies": [{"name": "session", "value": "abc", "domain": "example.com", "path": "/"}],
+                    "origins": []}
+
+        async def add_cookies(cookies):
+            self.cookies.extend(cookies)
+
+        self.config = SimpleNamespace(wait_between_actions=0)
+        self.session = SimpleNamespace(
+            cached_state=self.state, current_page=page,
+            context=SimpleNamespace(pages=[page], storage_state=storage_state, add_cookies=add_cookies))
+
+    async def get_session(self):
+        return self.session
+
+    async def get_state(self, use_vision=False):
+        return self.state
+
+    async def remove_highlights(self):
+        pass
+
+    async def go_back(self):
+        pass
+
+    async def navigate_to(self, url):
+        self.navigated.append(url)
+
+    async def close(self):
+        pass
+
+
+def make_agent(responses, **kwargs):
+    from src.agent.custom_agent import CustomAgent
+    from src.agent.custom_prompts import CustomAgentMessagePrompt, CustomSystemPrompt
+    from src.controller.custom_controller import CustomController
+
+    return dict(llm=GenericFakeChatModel(messages=iter(responses)), browser_context=FakeBrowserContext(),
+                controller=CustomController(), system_prompt_class=CustomSystemPrompt,
+                agent_prompt_class=CustomAgentMessagePrompt, use_vision=False, checkpoint=True, **kwargs), CustomAgent
+
+
+def test_resume_continues_after_the_last_checkpoint():
+    previous_run_dir = os.environ.get("AGENT_RUN_DIR")
+    os.environ["AGENT_RUN_DIR"] = tempfile.mkdtemp()
+    try:
+        kwargs, CustomAgent = make_agent([reply({"go_back": {}}, "step one"), reply({"go_back": {}}, "step two")])
+        agent = CustomAgent(task="Buy the cheapest charger", **kwargs)
+        # stands in for a run whose process died after its second step
+        asyncio.run(agent.run(max_steps=2))
+        messages = len(agent.message_manager.history.messages)
+
+        kwargs, CustomAgent = make_agent([reply({"done": {"text": "Bought it"}}, "step three")])
+        resumed = CustomAgent.resume(agent.agent_id, **kwargs)
+        assert resumed.task == "Buy the cheapest charger" and resumed.agent_id == agent.agent_id
+        assert len(resumed.message_manager.history.messages) == messages
+        assert len(resumed.history.history) == 2 and resumed.n_steps == agent.n_steps
+        assert resumed._last_actions[0].model_dump(exclude_unset=True) == {"go_back": {}}
+        assert resumed.memory.archive == agent.memory.archive
+        history = asyncio.run(resumed.run(max_steps=3))
+        # one step left of three; cookies and the tab are back before it
+        assert len(history.history) == 3 and history.is_done() and history.final_result()
+        assert resumed.browser_context.cookies[0]["name"] == "session"
+        assert resumed.browser_context.navigated == ["https://example.com/cart"]
+    finally:
+        if previous_run_dir is None:
+            os.environ.pop("AGENT_RUN_DIR", None)
+        else:
+            os.environ["AGENT_RUN_DIR"] = previous_run_dir
+
+
+def test_run_state_round_trips():
+    from src.agent.agent_memory import MemoryStore
+    from src.utils.content_accumulator import ContentAccumulator
+    from src.utils.token_counter import TokenCounter
+
+    path = os.path.join(tempfile.mkdtemp(), "extracted_content.txt")
+    content = ContentAccumulator(path, max_memory_chars=10)
+    content.add("Extracted page one")
+    content.add("Extracted page two")
+    state = json.loads(json.dumps(content.to_dict()))
+    # spilled after the checkpoint, then the process died
+    content.add("Extracted page three")
+    restored = ContentAccumulator(path, max_memory_chars=10)
+    restored.restore(state)
+    assert restored.text() == "Extracted page oneExtracted page two"
+    assert not restored.add("Extracted page one")
+
+    memory = MemoryStore(TokenCounter("generic"), budget_tokens=60, recent=2)
+    for page in range(5):
+        memory.add(f"Offer {page} costs {10 + page} EUR.")
+    copy = MemoryStore(TokenCounter("generic"), budget_tokens=60, recent=2)
+    copy.restore(json.loads(json.dumps(memory.to_dict())))
+    assert copy.render() == memory.render() and copy.full_text() == memory.full_text()
+
+
+if __name__ == "__main__":
+    test_resume_continues_after_the_last_checkpoint()
+    test_run_state_round_trips()
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+
+sys.path.append(".")
+
+
+def test_accumulator_dedups_and_spills_in_order():
+    from src.utils.content_accumulator import ContentAccumulator
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run", "extracted_content.txt")
+        content = ContentAccumulator(path, max_memory_chars=100, read_block_chars=16)
+        assert not content
+        pages = [f"Extracted page content:\n page {i} " + "x" * 40 + "\n" for i in range(6)]
+        for page in pages:
+            assert content.add(page)
+        assert not content.add(pages[2])
+        stats = content.stats()
+        assert stats["memory_chars"] <= 100 and stats["spilled_chars"] > 0
+        assert stats["chunks"] == 6 and stats["duplicates"] == 1
+        assert os.path.getsize(path) == stats["spilled_chars"]
+        assert len(content) == sum(len(page) for page in pages)
+        assert content.text() == "".join(pages)
+
+
+def test_oversized_chunk_stays_in_memory():
+    from src.utils.content_accumulator import ContentAccumulator, run_dir
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "extracted_content.txt")
+        content = ContentAccumulator(path, max_memory_chars=10)
+        content.add("Extracted page content: a long page")
+        assert not os.path.exists(path)
+        content.add("Extracted page content: the next page")
+        assert content.stats()["memory_chars"] == len("Extracted page content: the next page")
+        assert content.text() == "Extracted page content: a long pageExtracted page content: the next page"
+    assert run_dir("abc").endswith(os.path.join("agent_runs", "abc"))
+
+
+def test_prune_keeps_the_most_recently_written_runs():
+    from src.utils.content_accumulator import prune_run_dirs
+
+    with tempfile.TemporaryDirectory() as root:
+        for age, run_id in enumerate(["current", "new", "old", "older"]):
+            os.makedirs(os.path.join(root, run_id))
+            path = os.path.join(root, run_id, "spans.jsonl")
+            open(path, "w").close()
+            os.utime(os.path.join(root, run_id), (1000, 1000))
+            # the run last wrote to one of its files, not to the directory
+            os.utime(path, (2000 - age, 2000 - age))
+        os.utime(os.path.join(root, "current", "spans.jsonl"), (0, 0))
+        assert prune_run_dirs("current", keep=3, root=root) == [os.path.join(root, "older")]
+        assert sorted(os.listdir(root)) == ["current", "new", "old"]
+        assert prune_run_dirs("current", keep=0, root=root) == []
+        prune_run_dirs("current", keep=1, root=root)
+        assert os.listdir(root) == ["current"]
+
+
+if __name__ == "__main__":
+    test_accumulator_dedups_and_spills_in_order()
+    test_oversized_chunk_stays_in_memory()
+    test_prune_keeps_the_most_recently_written_runs()
@@ -0,0 +1,87 @@
+import sys
+
+sys.path.append(".")
+
+
+def page_state(url, buttons, inputs=()):
+    """A BrowserState whose body holds one button per label, then the given input values, numbered in DOM order."""
+    from browser_use.browser.views import BrowserState
+    from browser_use.dom.views import DOMElementNode, DOMTextNode
+
+    body = DOMElementNode(is_visible=True, parent=None, tag_name="body", xpath="/body", attributes={}, children=[])
+    selector_map = {}
+    elements = [("button", b, {}) for b in buttons] + [("input", "", {"value": v}) for v in inputs]
+    for i, (tag, label, attributes) in enumerate(elements):
+        position = sum(1 for other in elements[:i + 1] if other[0] == tag)
+        node = DOMElementNode(is_visible=True, parent=body, tag_name=tag, xpath=f"/body/{tag}[{position}]",
+                              attributes=attributes, children=[], highlight_index=i)
+        if label:
+            node.children.append(DOMTextNode(is_visible=True, parent=node, text=label))
+        body.children.append(node)
+        selector_map[i] = node
+    return BrowserState(element_tree=body, selector_map=selector_map, url=url, title="", tabs=[])
+
+
+def test_element_ids_survive_insertions_and_changes():
+    from src.utils.dom_diff import StableElementIds
+
+    ids = StableElementIds()
+    first = page_state("https://example.com/form", ["Save", "Cancel"], inputs=["a"])
+    ids.assign(first)
+    assert {i: n.tag_name for i, n in first.selector_map.items()} == {0: "button", 1: "button", 2: "input"}
+
+    # a banner button appears first and the input value changes: old elements keep their index
+    second = page_state("https://example.com/form", ["Accept cookies", "Save", "Cancel"], inputs=["ab"])
+    ids.assign(second)
+    labels = {i: n.get_all_text_till_next_clickable_element() or n.attributes.get("value")
+              for i, n in second.selector_map.items()}
+    assert labels == {0: "Save", 1: "Cancel", 2: "ab", 3: "Accept cookies"}
+    assert all(i == n.highlight_index for i, n in second.selector_map.items())
+
+    # a new URL starts over from the page's numbering
+    third = page_state("https://example.com/done", ["Home"])
+    ids.assign(third)
+    assert list(third.selector_map) == [0]
+
+
+def test_message_manager_sends_snapshot_then_diffs():
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.agent.custom_message_manager import CustomMessageManager
+    from src.agent.custom_prompts import CustomAgentMessagePrompt, CustomSystemPrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.utils.dom_diff import StableElementIds
+
+    manager = CustomMessageManager(
+        llm=FakeListChatModel(responses=[]), task="fill the form", action_descriptions="",
+        system_prompt_class=CustomSystemPrompt, agent_prompt_class=CustomAgentMessagePrompt, dom_diff=True,
+    )
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="fill the form", add_infos="", memory="",
+                                    task_progress="", future_plans="")
+    ids = StableElementIds()
+    buttons = [f"Option {i}" for i in range(10)]
+
+    def send(state):
+        ids.assign(state)
+        manager.add_state_message(state, step_info=step_info)
+        text = manager.get_messages()[-1].content
+        manager._remove_state_message_by_index(-1)
+        return text
+
+    assert "see the page snapshot above" in send(page_state("https://example.com/form", buttons, inputs=["a"]))
+    snapshot = manager.get_messages()[-1].content
+    assert snapshot.startswith("Page snapshot of https://example.com/form") and "9[:]<button>Option 9</button>" in snapshot
+
+    diff = send(page_state("https://example.com/form", buttons[:3] + ["Option 3 (selected)"] + buttons[4:], inputs=["a"]))
+    assert "~ 3[:]<button>Option 3 (selected)</button>" in diff and "Option 4" not in diff
+    assert manager.get_messages()[-1].content == snapshot
+
+    # most of the page changed: a fresh snapshot replaces the old one
+    assert "see the page snapshot above" in send(page_state("https://example.com/form", ["Other"] * 10))
+    snapshots = [m for m in manager.get_messages() if str(m.content).startswith("Page snapshot")]
+    assert len(snapshots) == 1 and "Other" in snapshots[0].content
+    assert manager.dom_diff.stats()["diff_sends"] == 1
+
+
+if __name__ == "__main__":
+    test_element_ids_survive_insertions_and_changes()
+    test_message_manager_sends_snapshot_then_diffs()
@@ -0,0 +1,65 @@
+import base64
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+sys.path.append(".")
+
+
+def test_contents_keep_roles_and_images():
+    from google.genai import types
+    from src.llm.gemini_llm import GeminiLLM, to_gemini_contents
+
+    screenshot = base64.b64encode(b"\x89PNG fake").decode()
+    messages = [
+        SystemMessage(content="You are a browser agent."),
+        AIMessage(content='{"action": []}'),
+        AIMessage(content='{"action": [{"scroll_down": {}}]}'),
+        HumanMessage(content=[
+            {"type": "text", "text": "Current URL: https://example.com"},
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{screenshot}"}},
+        ]),
+    ]
+    system_instruction, contents = to_gemini_contents(messages)
+    assert system_instruction == "You are a browser agent."
+    assert [content["role"] for content in contents] == ["model", "user"]
+    assert len(contents[0]["parts"]) == 2
+    assert contents[1]["parts"][1]["inline_data"]["data"] == b"\x89PNG fake"
+
+    llm = GeminiLLM("test-key", "gemini-2.0-flash-exp", temperature=0.2)
+    request = llm._request(messages, stop=None)
+    # the request validates against the SDK types without any network access
+    parameters = types._GenerateContentParameters(**request)
+    assert parameters.config.system_instruction == "You are a browser agent."
+    assert parameters.contents[1].parts[1].inline_data.mime_type == "image/png"
+
+
+def test_usage_metadata_includes_cached_tokens():
+    from google.genai import types
+    from src.llm.gemini_llm import GeminiLLM
+
+    response = types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text="{}")]))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=1200, candidates_token_count=30, total_token_count=1230,
+            cached_content_token_count=1024,
+        ),
+    )
+    message = GeminiLLM(api_key="test-key")._to_result(response).generations[0].message
+    assert message.content == "{}"
+    assert message.usage_metadata["input_token_details"]["cache_read"] == 1024
+
+
+def test_request_timeout_goes_to_the_sdk_client():
+    from src.llm.gemini_llm import GeminiLLM
+
+    llm = GeminiLLM(api_key="test-key", timeout=7.5)
+    assert llm.client is GeminiLLM(api_key="test-key", timeout=7.5).client
+    assert llm.client is not GeminiLLM(api_key="test-key", timeout=30).client
+    assert llm.client._api_client._http_options.timeout == 7500
+
+
+if __name__ == "__main__":
+    test_contents_keep_roles_and_images()
+    test_usage_metadata_includes_cached_tokens()
+    test_request_timeout_goes_to_the_sdk_client()
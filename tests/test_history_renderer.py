@@ -0,0 +1,95 @@
+import base64
+import io
+import os
+import sys
+import tempfile
+
+sys.path.append(".")
+
+
+def frame(color, size=(320, 240)):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def jobs():
+    from src.utils.history_renderer import FrameJob
+
+    return [
+        FrameJob(step_number=0, text="Find the cheapest flight", screenshot=frame("white")),
+        FrameJob(step_number=1, text="Open the search page", screenshot=frame("red")),
+        FrameJob(step_number=2, screenshot=frame("blue")),
+        FrameJob(step_number=3, text="Read the results", screenshot=frame("green", size=(300, 200))),
+    ]
+
+
+def test_renders_gif_and_webp_in_order():
+    from PIL import Image
+    from src.utils.history_renderer import HistoryRenderer, RenderOptions, load_font
+
+    root = tempfile.mkdtemp()
+    renderer = HistoryRenderer(workers=1, ffmpeg="no-such-ffmpeg")
+    options = RenderOptions(duration=500, font_size=12, title_font_size=14, margin=10)
+    gif_path = renderer.render(jobs(), os.path.join(root, "history.gif"), options)
+    with Image.open(gif_path) as gif:
+        assert gif.n_frames == 4
+        gif.seek(2)
+        assert gif.convert("RGB").getpixel((5, 5)) == (0, 0, 255)
+    # fonts are probed and loaded once per process
+    assert load_font.cache_info().hits > 0
+    # without ffmpeg an MP4 request falls back to an animated WebP
+    webp_path = renderer.render(jobs(), os.path.join(root, "history.mp4"), options)
+    assert webp_path.endswith(".webp")
+    with Image.open(webp_path) as webp:
+        assert webp.n_frames == 4
+
+
+def test_process_pool_matches_in_process_frames():
+    from src.utils.history_renderer import HistoryRenderer, RenderOptions
+
+    options = RenderOptions(font_size=12, title_font_size=14, goal_font_size=12, margin=10)
+    serial = list(HistoryRenderer(workers=1).frames(jobs(), options))
+    renderer = HistoryRenderer(workers=2)
+    try:
+        pooled = list(renderer.frames(jobs(), options))
+        pool = renderer.pool()
+        # the workers started for the first render serve the next one
+        assert list(renderer.frames(jobs(), options))[1].tobytes() == pooled[1].tobytes()
+        assert renderer.pool() is pool
+    finally:
+        renderer.close()
+    assert [image.tobytes() for image in pooled] == [image.tobytes() for image in serial]
+    larger_goal = list(HistoryRenderer(workers=1).frames(jobs(), RenderOptions(
+        font_size=12, title_font_size=14, goal_font_size=24, margin=10)))
+    assert larger_goal[1].tobytes() != serial[1].tobytes()
+
+
+def test_default_font_without_sizes_on_older_pillow():
+    from unittest import mock
+
+    from PIL import ImageFont
+    from src.utils import history_renderer
+
+    bitmap = ImageFont.load_default()
+
+    def load_default(*args):
+        if args:
+            raise TypeError("load_default() takes 0 positional arguments")
+        return bitmap
+
+    history_renderer.load_font.cache_clear()
+    try:
+        with mock.patch.object(history_renderer, "_font_name", return_value=None), \
+                mock.patch.object(ImageFont, "load_default", load_default):
+            assert history_renderer.load_font(40) is bitmap
+    finally:
+        history_renderer.load_font.cache_clear()
+
+
+if __name__ == "__main__":
+    test_renders_gif_and_webp_in_order()
+    test_process_pool_matches_in_process_frames()
+    test_default_font_without_sizes_on_older_pillow()
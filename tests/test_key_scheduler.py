@@ -0,0 +1,109 @@
+import asyncio
+import sys
+
+sys.path.append(".")
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.response = type("Response", (object,), {"headers": headers or {}})()
+
+
+def test_least_loaded_key():
+    from src.utils.key_scheduler import KeyScheduler
+
+    scheduler = KeyScheduler(keys=["key-a", "key-b"], rpm=10)
+    key_1, ticket_1 = scheduler.acquire_sync()
+    key_2, ticket_2 = scheduler.acquire_sync()
+    assert {key_1, key_2} == {"key-a", "key-b"}
+    scheduler.release(key_1, ticket_1)
+    scheduler.release(key_2, ticket_2)
+
+
+def test_cooldown_after_rate_limit():
+    from src.utils.key_scheduler import KeyScheduler, parse_retry_after
+
+    scheduler = KeyScheduler(keys=["key-a", "key-b"], rpm=10)
+    key, ticket = scheduler.acquire_sync()
+    error = FakeRateLimitError("429 Too Many Requests", headers={"retry-after": "30"})
+    cooldown = scheduler.report_rate_limited(key, ticket, parse_retry_after(error))
+    assert cooldown == 30
+    for _ in range(3):
+        other_key, other_ticket = scheduler.acquire_sync()
+        assert other_key != key
+        scheduler.release(other_key, other_ticket)
+
+
+def test_parse_retry_after():
+    from src.utils.key_scheduler import is_rate_limit_error, parse_retry_after
+
+    assert parse_retry_after(FakeRateLimitError("quota", headers={"retry-after": "7"})) == 7
+    assert parse_retry_after(Exception("429 RESOURCE_EXHAUSTED retry_delay { seconds: 12 }")) == 12
+    assert parse_retry_after(Exception("Please retry in 3.5s")) == 3.5
+    assert parse_retry_after(Exception("boom")) is None
+    assert parse_retry_after(FakeRateLimitError("quota", headers={"retry-after": "soon-ish"})) is None
+    assert parse_retry_after(FakeRateLimitError("retry in 4s", headers={"retry-after": "Mon, 99 Foo"})) == 4
+    date = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert parse_retry_after(FakeRateLimitError("quota", headers={"retry-after": date})) == 0
+    assert is_rate_limit_error(FakeRateLimitError("slow down"))
+    assert not is_rate_limit_error(ValueError("bad json"))
+
+
+def test_async_acquire_waits_for_bucket():
+    from src.utils.key_scheduler import KeyScheduler
+
+    scheduler = KeyScheduler(keys=["key-a"], rpm=600)  # refills one request every 0.1s
+
+    async def run():
+        tickets = [await scheduler.acquire() for _ in range(601)]
+        for key, ticket in tickets:
+            scheduler.release(key, ticket)
+        return tickets
+
+    assert len(asyncio.run(run())) == 601
+
+
+def test_scheduled_model_takes_a_key_per_call():
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.utils.key_scheduler import KeyScheduler
+    from src.utils.llm_key_scheduling import KeyScheduledChatModel
+
+    class RateLimitedModel(FakeListChatModel):
+        def _call(self, *args, **kwargs):
+            raise FakeRateLimitError("429 Too Many Requests", headers={"retry-after": "60"})
+
+        async def _astream(self, *args, **kwargs):
+            raise FakeRateLimitError("429 Too Many Requests", headers={"retry-after": "60"})
+            yield
+
+    scheduler = KeyScheduler(keys=["key-a", "key-b"], rpm=10)
+    models = {"key-a": FakeListChatModel(responses=["from a"]), "key-b": FakeListChatModel(responses=["from b"])}
+    llm = KeyScheduledChatModel(scheduler=scheduler, model_factory=models.__getitem__)
+    replies = [llm.invoke("hi").content for _ in range(4)] + [asyncio.run(llm.ainvoke("hi")).content]
+    # every call is charged to the key that served it, spreading them across both keys
+    assert sorted(state["requests"] for state in scheduler.stats()) == [2, 3]
+    assert set(replies) == {"from a", "from b"}
+    assert all(state["in_flight"] == 0 for state in scheduler.stats())
+
+    models["key-a"] = RateLimitedModel(responses=["never"])
+    llm = KeyScheduledChatModel(scheduler=KeyScheduler(keys=["key-a", "key-b"], rpm=10), model_factory=models.__getitem__)
+    # both keys are idle, so key-a is tried first
+
+    async def stream():
+        return "".join([chunk.content async for chunk in llm.astream("hi")])
+
+    assert asyncio.run(stream()) == "from b"
+    stats = {state["key"]: state for state in llm.scheduler.stats()}
+    assert stats["...ey-a"]["rate_limited"] == 1 and stats["...ey-a"]["cooldown_remaining"] > 50
+    assert llm.invoke("hi").content == "from b"
+
+
+if __name__ == "__main__":
+    test_least_loaded_key()
+    test_cooldown_after_rate_limit()
+    test_parse_retry_after()
+    test_async_acquire_waits_for_bucket()
+    test_scheduled_model_takes_a_key_per_call()
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+sys.path.append(".")
+
+
+def test_response_cache_hit_and_miss():
+    from src.utils.llm_cache import SQLiteResponseCache, with_response_cache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = SQLiteResponseCache(database_path=os.path.join(tmp_dir, "responses.sqlite"))
+        llm = with_response_cache(FakeListChatModel(responses=["first", "second"]), cache=cache)
+        messages = [SystemMessage(content="Return queries"), HumanMessage(content="DeepSeek-R1")]
+
+        assert llm.invoke(messages).content == "first"
+        assert llm.invoke(messages).content == "first"
+        assert llm.invoke([HumanMessage(content="other task")]).content == "second"
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 2 and stats["entries"] == 2
+
+        # entries survive a new process-level cache instance
+        reopened = SQLiteResponseCache(database_path=os.path.join(tmp_dir, "responses.sqlite"))
+        llm = with_response_cache(FakeListChatModel(responses=["first", "second"]), cache=reopened)
+        assert llm.invoke(messages).content == "first"
+
+
+def test_response_cache_lru_eviction():
+    from src.utils.llm_cache import SQLiteResponseCache, with_response_cache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = SQLiteResponseCache(database_path=os.path.join(tmp_dir, "responses.sqlite"), max_entries=2)
+        llm = with_response_cache(FakeListChatModel(responses=["a", "b", "c", "d"]), cache=cache)
+        llm.invoke("one")
+        llm.invoke("two")
+        llm.invoke("one")  # refresh "one" so "two" is the least recently used entry
+        llm.invoke("three")
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["evictions"] == 1
+        assert llm.invoke("one").content == "a"
+        assert llm.invoke("two").content == "d"
+
+
+if __name__ == "__main__":
+    test_response_cache_hit_and_miss()
+    test_response_cache_lru_eviction()
@@ -0,0 +1,99 @@
+import asyncio
+import sys
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+sys.path.append(".")
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        time.sleep(0.01)
+        return super()._call(*args, **kwargs)
+
+
+class FlakyFakeChatModel(FakeListChatModel):
+    failing: bool = True
+
+    def _call(self, *args, **kwargs):
+        if self.failing:
+            raise ConnectionError("provider unavailable")
+        return super()._call(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        if self.failing:
+            raise ConnectionError("provider unavailable")
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    from src.utils.llm_circuit_breaker import CircuitBreaker, CircuitBreakerChatModel, CircuitOpenError
+
+    primary = FlakyFakeChatModel(responses=["primary"])
+    breaker = CircuitBreaker("fake/model", window=4, min_requests=2, error_rate=0.5, open_seconds=0.1)
+    llm = CircuitBreakerChatModel(primary=primary, breaker=breaker)
+    for _ in range(2):
+        try:
+            asyncio.run(llm.ainvoke("hi"))
+            assert False, "the primary should fail"
+        except ConnectionError:
+            pass
+    assert breaker.snapshot()["state"] == "open"
+    try:
+        asyncio.run(llm.ainvoke("hi"))
+        assert False, "an open circuit should fail fast"
+    except CircuitOpenError as e:
+        assert e.retry_in <= 0.1
+    assert breaker.snapshot()["rejected"] == 1
+
+    # after open_seconds one probe goes through and closes the circuit again
+    time.sleep(0.12)
+    primary.failing = False
+    assert asyncio.run(llm.ainvoke("hi")).content == "primary"
+    assert breaker.snapshot()["state"] == "closed"
+
+
+def test_latency_slo_and_failover():
+    from src.utils.llm_circuit_breaker import CircuitBreaker, CircuitBreakerChatModel
+
+    breaker = CircuitBreaker("slow/model", window=4, min_requests=3, latency_slo=1.0)
+    for latency in (0.5, 2.0, 3.0):
+        breaker.record(True, latency)
+    snapshot = breaker.snapshot()
+    assert snapshot["state"] == "open" and "p95 latency" in snapshot["open_reason"]
+
+    llm = CircuitBreakerChatModel(
+        primary=FlakyFakeChatModel(responses=["primary"]),
+        breaker=CircuitBreaker("flaky/model", min_requests=10),
+        fallback=FakeListChatModel(responses=["fallback"]),
+    )
+
+    async def stream():
+        return "".join([chunk.content async for chunk in llm.astream("hi")])
+
+    assert asyncio.run(llm.ainvoke("hi")).content == "fallback"
+    assert asyncio.run(stream()) == "fallback"
+    assert llm.breaker.snapshot()["error_rate"] == 1.0
+
+
+def test_slow_replies_open_the_circuit_only_with_a_fallback():
+    from src.utils.llm_circuit_breaker import CircuitBreaker, CircuitBreakerChatModel
+
+    def slow_model(fallback=None):
+        breaker = CircuitBreaker("slow/model", min_requests=2, latency_slo=0.001)
+        llm = CircuitBreakerChatModel(primary=SlowFakeChatModel(responses=["primary"]),
+                                      breaker=breaker, fallback=fallback)
+        for _ in range(3):
+            asyncio.run(llm.ainvoke("hi"))
+        return breaker.snapshot()["state"]
+
+    assert slow_model() == "closed"
+    assert slow_model(fallback=FakeListChatModel(responses=["fallback"])) == "open"
+
+
+if __name__ == "__main__":
+    test_breaker_opens_fails_fast_and_recovers()
+    test_latency_slo_and_failover()
+    test_slow_replies_open_the_circuit_only_with_a_fallback()
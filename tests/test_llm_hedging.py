@@ -0,0 +1,81 @@
+import asyncio
+import sys
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+sys.path.append(".")
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    delay: float = 0.0
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return await super().ainvoke(input, config, **kwargs)
+
+    def invoke(self, input, config=None, **kwargs):
+        time.sleep(self.delay)
+        return super().invoke(input, config, **kwargs)
+
+
+def test_fast_primary_is_not_hedged():
+    from src.utils.llm_hedging import HedgedChatModel
+
+    llm = HedgedChatModel(
+        primary=SlowFakeChatModel(responses=["primary"], delay=0.01),
+        backup=SlowFakeChatModel(responses=["backup"]),
+        initial_delay=1.0,
+    )
+    assert asyncio.run(llm.ainvoke("hi")).content == "primary"
+    assert llm.invoke("hi").content == "primary"
+    stats = llm.stats()
+    assert stats["hedged"] == 0 and stats["primary_wins"] == 2
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    from src.utils.llm_hedging import HedgedChatModel
+
+    primary = SlowFakeChatModel(responses=["primary"], delay=5.0)
+    llm = HedgedChatModel(primary=primary, backup=SlowFakeChatModel(responses=["backup"]), initial_delay=0.05)
+
+    async def run():
+        start = time.monotonic()
+        message = await llm.ainvoke("hi")
+        return message, time.monotonic() - start
+
+    message, elapsed = asyncio.run(run())
+    assert message.content == "backup"
+    assert elapsed < 1.0
+    stats = llm.stats()
+    assert stats["hedge_rate"] == 1.0 and stats["backup_win_ratio"] == 1.0
+
+
+def test_failed_primary_falls_back_immediately():
+    from src.utils.llm_hedging import HedgedChatModel
+
+    llm = HedgedChatModel(
+        primary=SlowFakeChatModel(responses=[""]),
+        backup=SlowFakeChatModel(responses=["backup"]),
+        initial_delay=5.0,
+    )
+    start = time.monotonic()
+    assert asyncio.run(llm.ainvoke("hi")).content == "backup"
+    assert time.monotonic() - start < 1.0
+
+
+def test_hedge_delay_follows_latency_percentile():
+    from src.utils.llm_hedging import HedgeStats
+
+    stats = HedgeStats(window=10)
+    assert stats.hedge_delay(0.9, min_samples=3, initial_delay=7.0, min_delay=0.5) == 7.0
+    for latency in [1.0, 2.0, 3.0, 4.0, 10.0]:
+        stats.record("primary", False, latency)
+    assert stats.hedge_delay(0.75, min_samples=3, initial_delay=7.0, min_delay=0.5) == 4.0
+
+
+if __name__ == "__main__":
+    test_fast_primary_is_not_hedged()
+    test_slow_primary_is_hedged_and_cancelled()
+    test_failed_primary_falls_back_immediately()
+    test_hedge_delay_follows_latency_percentile()
@@ -0,0 +1,67 @@
+import asyncio
+import gc
+import sys
+import weakref
+
+sys.path.append(".")
+
+
+def openai_model(model_name="gpt-4o", api_key="key-a", base_url="https://api.openai.com/v1"):
+    from src.utils import utils
+
+    return utils.get_llm_model("openai", model_name=model_name, temperature=0.0, api_key=api_key, base_url=base_url,
+                               hedge_provider="", circuit_breaker=False)
+
+
+def test_models_are_shared_per_provider_model_key_and_url():
+    from src.utils.llm_pool import LLMClientPool, llm_pool
+
+    llm_pool.clear()
+    first = openai_model()
+    assert openai_model() is first
+    assert openai_model(api_key="key-b") is not first
+    assert openai_model(base_url="https://proxy.example.com/v1") is not first
+    assert openai_model(model_name="gpt-4o-mini") is not first
+    # requests to one endpoint share its keep-alive client whatever the key
+    assert openai_model(api_key="key-b").http_client is first.http_client
+    assert "key-a" not in repr(LLMClientPool.make_key("openai", {"api_key": "key-a"}))
+
+
+def test_clear_keeps_clients_of_live_models_open():
+    from src.utils.llm_pool import llm_pool
+
+    llm_pool.clear()
+    model = openai_model()
+    client = model.http_client
+    llm_pool.clear()
+    assert not client.is_closed
+    assert openai_model() is not model and openai_model().http_client is not client
+
+    closed = []
+    client.close = lambda: closed.append(True)
+    released = weakref.ref(client)
+    del model, client
+    llm_pool.clear()
+    gc.collect()
+    assert released() is None and closed
+
+
+def test_clear_closes_idle_clients_and_loops_close_their_async_clients():
+    from src.utils.llm_pool import llm_pool
+
+    llm_pool.clear()
+    idle = llm_pool.get_http_client("https://idle.example.com/v1")
+    llm_pool.clear()
+    assert idle.is_closed
+
+    async def client():
+        return llm_pool.get_async_openai_client("https://api.openai.com/v1", "key-a")
+
+    async_client = asyncio.run(client())
+    assert async_client.is_closed()
+
+
+if __name__ == "__main__":
+    test_models_are_shared_per_provider_model_key_and_url()
+    test_clear_keeps_clients_of_live_models_open()
+    test_clear_closes_idle_clients_and_loops_close_their_async_clients()
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+sys.path.append(".")
+
+
+def state_message(step, url):
+    return HumanMessage(content=[
+        {"type": "text", "text": f"Current step: {step}/10\nCurrent date and time: 2025-0{step}-01 12:0{step}\nURL: {url}"},
+        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,screenshot-{time.time()}"}},
+    ])
+
+
+def test_record_then_replay():
+    from src.utils.llm_replay import ReplayChatModel
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cassette = os.path.join(tmp_dir, "agent.jsonl")
+        recorder = ReplayChatModel(cassette_path=cassette, mode="record",
+                                   recorder=FakeListChatModel(responses=["first", "second"]))
+        system = SystemMessage(content="rules")
+        assert recorder.invoke([system, state_message(1, "a")]).content == "first"
+        assert asyncio.run(recorder.ainvoke([system, state_message(2, "b")])).content == "second"
+
+        # the clock line and screenshot differ, but the requests still match their recordings
+        replay = ReplayChatModel(cassette_path=cassette)
+        assert replay.invoke([system, state_message(2, "b")]).content == "second"
+        assert replay.invoke([system, state_message(1, "a")]).content == "first"
+        assert replay.stats()["used"] == 2
+
+
+def test_replay_falls_back_to_recorded_order_and_latency():
+    from src.utils.llm_replay import ReplayChatModel, ReplayMissError
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cassette = os.path.join(tmp_dir, "agent.jsonl")
+        recorder = ReplayChatModel(cassette_path=cassette, mode="record",
+                                   recorder=FakeListChatModel(responses=["first", "second"]))
+        recorder.invoke("one")
+        recorder.invoke("two")
+
+        replay = ReplayChatModel(cassette_path=cassette, latency=0.05)
+        start = time.monotonic()
+        assert replay.invoke("something else").content == "first"
+        assert time.monotonic() - start >= 0.05
+
+        async def stream():
+            return "".join([chunk.content async for chunk in replay.astream("two")])
+
+        assert asyncio.run(stream()) == "second"
+
+        strict = ReplayChatModel(cassette_path=cassette, strict=True)
+        try:
+            strict.invoke("unknown")
+            assert False, "strict replay should fail on a missing request"
+        except ReplayMissError:
+            pass
+
+
+def test_explicit_zero_latency_overrides_the_environment():
+    from src.utils import utils
+
+    previous = os.environ.get("LLM_REPLAY_LATENCY")
+    os.environ["LLM_REPLAY_LATENCY"] = "5"
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cassette = os.path.join(tmp_dir, "agent.jsonl")
+            open(cassette, "w").close()
+            assert utils.get_llm_model("replay", cassette_path=cassette).latency == 5.0
+            assert utils.get_llm_model("replay", cassette_path=cassette, replay_latency=0).latency == 0.0
+    finally:
+        if previous is None:
+            os.environ.pop("LLM_REPLAY_LATENCY", None)
+        else:
+            os.environ["LLM_REPLAY_LATENCY"] = previous
+
+
+def test_tool_calls_survive_record_and_streamed_replay():
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from src.utils.llm_replay import ReplayChatModel
+
+    call = {"name": "AgentOutput", "args": {"action": [{"go_back": {}}]}, "id": "call_1", "type": "tool_call"}
+    response = AIMessage(content="", tool_calls=[call],
+                         invalid_tool_calls=[{"name": "done", "args": "not json", "id": "call_2", "error": None,
+                                              "type": "invalid_tool_call"}])
+
+    async def stream(model, messages):
+        merged = None
+        async for chunk in model.astream(messages):
+            merged = chunk if merged is None else merged + chunk
+        return merged
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cassette = os.path.join(tmp_dir, "agent.jsonl")
+        recorder = ReplayChatModel(cassette_path=cassette, mode="record",
+                                   recorder=GenericFakeChatModel(messages=iter([response, response])))
+        assert recorder.invoke("plan").tool_calls == [call]
+        recorded = asyncio.run(stream(recorder, "plan again"))
+        assert recorded.tool_calls == [call] and recorded.invalid_tool_calls[0]["args"] == "not json"
+
+        replay = ReplayChatModel(cassette_path=cassette, stream_chunk_size=4)
+        assert replay.invoke("plan").tool_calls == [call]
+        replayed = asyncio.run(stream(replay, "plan again"))
+        assert replayed.tool_calls == [call]
+        assert [c["id"] for c in replayed.invalid_tool_calls] == ["call_2"]
+
+
+if __name__ == "__main__":
+    test_record_then_replay()
+    test_replay_falls_back_to_recorded_order_and_latency()
+    test_explicit_zero_latency_overrides_the_environment()
+    test_tool_calls_survive_record_and_streamed_replay()
@@ -0,0 +1,50 @@
+import sys
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+sys.path.append(".")
+
+
+def make_output(evaluation="Unknown", thought="go on", actions=({"scroll_down": {}},)):
+    from browser_use.controller.service import Controller
+    from src.agent.custom_views import CustomAgentOutput
+
+    agent_output = CustomAgentOutput.type_with_custom_actions(Controller().registry.create_action_model())
+    return agent_output(
+        current_state={"prev_action_evaluation": evaluation, "thought": thought},
+        action=list(actions),
+    )
+
+
+def test_repeated_failures_escalate_and_stick():
+    from src.agent.model_router import ModelRouter
+
+    router = ModelRouter(FakeListChatModel(responses=["s"]), FakeListChatModel(responses=["l"]),
+                         failure_threshold=2, escalation_steps=2)
+    decision = router.select(1)
+    assert decision.tier == "small"
+    assert router.escalation_reason(make_output("Failed - element missing")) is None
+    router.record(decision)
+
+    decision = router.select(2)
+    reason = router.escalation_reason(make_output("Failed - still missing"))
+    assert reason == "2 consecutive failed evaluations"
+    router.escalate(decision, reason)
+    router.record(decision)
+
+    assert [router.select(step).tier for step in (3, 4, 5)] == ["large", "large", "small"]
+    assert router.stats()["escalations"] == 1
+
+
+def test_low_confidence_and_empty_actions():
+    from src.agent.model_router import ModelRouter
+
+    router = ModelRouter(FakeListChatModel(responses=["s"]), FakeListChatModel(responses=["l"]))
+    assert "low confidence" in router.escalation_reason(make_output(thought="I am not sure which button"))
+    assert router.escalation_reason(make_output(actions=())) == "no actions returned"
+    assert router.escalation_reason(make_output("Success - page opened")) is None
+
+
+if __name__ == "__main__":
+    test_repeated_failures_escalate_and_stick()
+    test_low_confidence_and_empty_actions()
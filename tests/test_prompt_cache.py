@@ -0,0 +1,60 @@
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+sys.path.append(".")
+
+
+def test_anthropic_cache_breakpoints():
+    from langchain_anthropic import ChatAnthropic
+    from src.utils.prompt_cache import PromptCacheManager
+
+    llm = ChatAnthropic(model_name="claude-3-5-sonnet-20240620", api_key="test")
+    messages = [SystemMessage(content="rules"), AIMessage(content="step 1"), HumanMessage(content="state")]
+    prepared, kwargs = PromptCacheManager().prepare(llm, messages)
+    assert kwargs == {}
+    payload = llm._get_request_payload(prepared)
+    assert payload["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert payload["messages"][0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert payload["messages"][-1]["content"] == "state"
+    # the caller's messages are left untouched
+    assert messages[0].content == "rules"
+
+
+def test_openai_prompt_cache_key_is_stable():
+    from langchain_openai import ChatOpenAI
+    from src.utils.prompt_cache import PromptCacheManager
+
+    manager = PromptCacheManager()
+    llm = ChatOpenAI(model="gpt-4o", api_key="test")
+    _, first = manager.prepare(llm, [SystemMessage(content="rules"), HumanMessage(content="state 1")])
+    _, second = manager.prepare(llm, [SystemMessage(content="rules"), HumanMessage(content="state 2")])
+    assert first["prompt_cache_key"] == second["prompt_cache_key"]
+    compatible = ChatOpenAI(model="qwen-plus", api_key="test", base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
+    assert manager.prepare(compatible, [SystemMessage(content="rules")])[1] == {}
+
+
+def test_cache_usage_accounting():
+    from src.utils.prompt_cache import PromptCacheManager, cache_usage
+
+    message = AIMessage(content="{}", usage_metadata={
+        "input_tokens": 3000, "output_tokens": 100, "total_tokens": 3100,
+        "input_token_details": {"cache_read": 2048},
+    })
+    assert cache_usage(message)["uncached_input_tokens"] == 952
+    deepseek = AIMessage(content="{}", response_metadata={"token_usage": {
+        "prompt_tokens": 500, "completion_tokens": 20, "prompt_cache_hit_tokens": 384,
+    }})
+    assert cache_usage(deepseek)["cached_input_tokens"] == 384
+    assert cache_usage(AIMessage(content="{}")) is None
+
+    manager = PromptCacheManager()
+    manager.record(message)
+    manager.record(deepseek)
+    assert manager.stats()["cached_input_tokens"] == 2432
+
+
+if __name__ == "__main__":
+    test_anthropic_cache_breakpoints()
+    test_openai_prompt_cache_key_is_stable()
+    test_cache_usage_accounting()
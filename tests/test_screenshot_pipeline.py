@@ -0,0 +1,82 @@
+import base64
+import io
+import sys
+
+sys.path.append(".")
+
+
+def screenshot(width=1280, height=1100, variant=7):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 120), fill="navy")
+    for row in range(200, height, 80):
+        draw.rectangle((100, row, 100 + (row * variant) % 900, row + 30), fill="gray")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def test_pipeline_downscales_encodes_and_dedups():
+    from PIL import Image
+    from src.utils.screenshot_pipeline import ScreenshotPipeline
+
+    pipeline = ScreenshotPipeline(max_edge=640, image_format="webp", quality=60, dedup_distance=0)
+    first = pipeline.process(screenshot())
+    assert first.data_url.startswith("data:image/webp;base64,") and not first.duplicate
+    with Image.open(io.BytesIO(base64.b64decode(first.data_url.split(",", 1)[1]))) as image:
+        assert image.size == (first.width, first.height) == (640, 550)
+    assert pipeline.process(screenshot()).duplicate
+    changed = pipeline.process(screenshot(variant=3))
+    assert not changed.duplicate and changed.distance > 0
+    stats = pipeline.stats()
+    assert stats["duplicates"] == 1 and stats["bytes_out"] < stats["bytes_in"]
+
+    pipeline.reset()
+    assert not pipeline.process(screenshot(variant=3)).duplicate
+
+
+def test_message_manager_sends_each_screenshot_once():
+    from browser_use.browser.views import BrowserState
+    from browser_use.dom.views import DOMElementNode
+    from langchain_anthropic import ChatAnthropic
+    from src.agent.custom_message_manager import CustomMessageManager
+    from src.agent.custom_prompts import CustomAgentMessagePrompt, CustomSystemPrompt
+    from src.agent.custom_views import CustomAgentStepInfo
+    from src.utils.token_counter import get_token_counter
+
+    llm = ChatAnthropic(model="claude-3-5-sonnet-latest", api_key="test")
+    manager = CustomMessageManager(
+        llm=llm, task="read the page", action_descriptions="", system_prompt_class=CustomSystemPrompt,
+        agent_prompt_class=CustomAgentMessagePrompt, vision_pipeline=True,
+    )
+    manager.screenshots.max_edge, manager.screenshots.image_format = 1024, "jpeg"
+    step_info = CustomAgentStepInfo(step_number=1, max_steps=10, task="read the page", add_infos="", memory="",
+                                    task_progress="", future_plans="")
+    body = DOMElementNode(is_visible=True, parent=None, tag_name="body", xpath="/body", attributes={}, children=[])
+
+    def send(image):
+        state = BrowserState(element_tree=body, selector_map={}, url="https://example.com", title="", tabs=[],
+                             screenshot=image)
+        manager.add_state_message(state, step_info=step_info)
+        message = manager.get_messages()[-1]
+        manager._remove_state_message_by_index(-1)
+        return message.content
+
+    assert "The screenshot above shows the current page." in send(screenshot())
+    assert "looks the same" in send(screenshot())
+    images = [m for m in manager.get_messages() if isinstance(m.content, list)]
+    assert len(images) == 1 and images[0].content[1]["image_url"]["url"].startswith("data:image/jpeg")
+
+    send(screenshot(variant=3))
+    assert len([m for m in manager.get_messages() if isinstance(m.content, list)]) == 1
+    stats = manager.screenshots.stats()
+    counter = get_token_counter(llm)
+    assert stats["image_tokens_in"] == 3 * counter.count_image(f"data:image/png;base64,{screenshot()}")
+    assert stats["image_tokens_out"] == 2 * 1202
+
+
+if __name__ == "__main__":
+    test_pipeline_downscales_encodes_and_dedups()
+    test_message_manager_sends_each_screenshot_once()
@@ -0,0 +1,58 @@
+import base64
+import io
+import sys
+import tempfile
+
+sys.path.append(".")
+
+
+def frame(color):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def test_store_shares_duplicate_frames():
+    import os
+
+    from src.utils.screenshot_store import ScreenshotStore, StoredBrowserStateHistory
+
+    store = ScreenshotStore(tempfile.mkdtemp())
+    states = [StoredBrowserStateHistory(url=f"https://example.com/{i}", title="", tabs=[], interacted_element=[None],
+                                        screenshot=frame(color), store=store)
+              for i, color in enumerate(("red", "red", "blue", "red"))]
+    assert store.stats()["frames"] == 2 and store.stats()["duplicates"] == 2
+    assert len(os.listdir(store.root)) == 2
+    assert states[0].screenshot_ref == states[3].screenshot_ref != states[2].screenshot_ref
+    # loaded back on access, identical to what was stored
+    assert states[2].screenshot == frame("blue")
+    assert "screenshot_ref" in states[0].to_dict() and states[0].to_dict()["screenshot"] is None
+
+
+def test_saved_history_keeps_references():
+    import os
+
+    from browser_use.agent.views import ActionResult
+    from src.agent.custom_views import CustomAgentHistory, CustomAgentHistoryList, CustomAgentOutput
+    from src.utils.screenshot_store import ScreenshotStore, StoredBrowserStateHistory
+
+    root = tempfile.mkdtemp()
+    store = ScreenshotStore(os.path.join(root, "screenshots"))
+    state = StoredBrowserStateHistory(url="https://example.com", title="Example", tabs=[], interacted_element=[None],
+                                      screenshot=frame("green"), store=store)
+    history = CustomAgentHistoryList(history=[
+        CustomAgentHistory(model_output=None, result=[ActionResult(extracted_content="ok")], state=state)])
+    path = os.path.join(root, "history.json")
+    history.save_to_file(path)
+    with open(path, encoding="utf-8") as f:
+        assert frame("green") not in f.read()
+    loaded = CustomAgentHistoryList.load_from_file(path, CustomAgentOutput)
+    assert loaded.history[0].state.screenshot == frame("green")
+    assert loaded.history[0].state.url == "https://example.com"
+
+
+if __name__ == "__main__":
+    test_store_shares_duplicate_frames()
+    test_saved_history_keeps_references()
@@ -0,0 +1,94 @@
+import asyncio
+import sys
+from types import SimpleNamespace
+
+sys.path.append(".")
+
+
+class FakePage:
+    def __init__(self):
+        self.url = "https://example.com"
+        self.mutations = 0
+        self.scroll_y = 0
+
+    async def evaluate(self, script):
+        return ["doc-1", self.mutations, 0, self.scroll_y]
+
+
+def fake_context(ttl=5.0):
+    from browser_use.browser.views import BrowserState
+    from src.browser.custom_context import CustomBrowserContext
+
+    class FakePageContext(CustomBrowserContext):
+        captures = 0
+
+        async def get_session(self):
+            return self.session
+
+        async def _wait_for_page_and_frames_load(self, timeout_overwrite=None):
+            pass
+
+        async def _update_state(self, use_vision=False, focus_element=-1):
+            self.captures += 1
+            page = self.session.current_page
+            self.current_state = BrowserState(element_tree=None, selector_map={}, url=page.url, title="",
+                                              tabs=[], screenshot="png" if use_vision else None)
+            return self.current_state
+
+    context = FakePageContext(browser=None)
+    page = FakePage()
+    context.session = SimpleNamespace(current_page=page, context=SimpleNamespace(pages=[page]), cached_state=None)
+    context.state_cache_ttl = ttl
+    return context, page
+
+
+def test_snapshot_is_reused_until_the_page_changes():
+    context, page = fake_context()
+
+    async def run():
+        first = await context.get_state()
+        assert await context.get_state() is first
+        assert context.session.cached_state is first
+        page.mutations += 1
+        second = await context.get_state()
+        assert second is not first
+        page.scroll_y = 400
+        await context.get_state()
+        await context.get_state(use_vision=True)
+        await context.get_state(use_vision=True)
+
+    asyncio.run(run())
+    assert context.captures == 4
+    assert context.state_cache_stats() == {"hits": 2, "misses": 4, "hit_ratio": 0.333}
+
+
+def test_actions_and_ttl_invalidate_snapshot():
+    context, page = fake_context(ttl=0.05)
+
+    async def run():
+        await context.get_state()
+        context.invalidate_state()
+        await context.get_state()
+        await context.go_forward()
+        await context.get_state()
+        await asyncio.sleep(0.06)
+        await context.get_state()
+
+    async def go_forward():
+        page.url = "https://example.com/next"
+
+    context.get_current_page = lambda: asyncio.sleep(0, page)
+    page.go_forward = lambda **kwargs: go_forward()
+    asyncio.run(run())
+    assert context.captures == 4
+    assert context.state_cache_hits == 0
+
+    disabled, _ = fake_context(ttl=0)
+    asyncio.run(disabled.get_state())
+    asyncio.run(disabled.get_state())
+    assert disabled.captures == 2
+
+
+if __name__ == "__main__":
+    test_snapshot_is_reused_until_the_page_changes()
+    test_actions_and_ttl_invalidate_snapshot()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.append(".")
+
+
+def test_spans_are_exported_and_summarized():
+    from src.agent.step_spans import SpanRecorder, StepSpans
+
+    path = os.path.join(tempfile.mkdtemp(), "spans.jsonl")
+    recorder = SpanRecorder(path)
+    for step, llm_seconds in enumerate((1.0, 2.0, 3.0, 10.0), 1):
+        spans = StepSpans(step)
+        with spans.span("llm", model="openai") as span:
+            span["ttft"] = 0.1
+        spans.spans[-1]["seconds"] = llm_seconds
+        spans.add("action", 0.5, action="click_element", ok=True)
+        recorder.record(spans)
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["step"] for line in lines] == [1, 2, 3, 4]
+    assert lines[0]["spans"][0]["name"] == "llm" and lines[0]["spans"][0]["ttft"] == 0.1
+    assert lines[0]["spans"][1] == {"name": "action", "seconds": 0.5, "action": "click_element", "ok": True}
+    summary = recorder.summary()
+    assert summary["llm"] == {"count": 4, "p50": 2.0, "p95": 10.0, "total": 16.0}
+    assert summary["step"]["count"] == 4
+
+
+def test_context_and_controller_time_their_phases():
+    from browser_use.browser.views import BrowserState
+    from src.browser.custom_context import CustomBrowserContext
+    from src.controller.custom_controller import CustomController
+
+    class FakePage:
+        url = "https://example.com"
+
+        async def evaluate(self, script):
+            return ["doc-1", 0, 0, 0]
+
+        async def screenshot(self, **kwargs):
+            time.sleep(0.02)
+            return b"png"
+
+    class FakePageContext(CustomBrowserContext):
+        async def get_session(self):
+            return self.session
+
+        async def get_current_page(self):
+            return self.session.current_page
+
+        async def _wait_for_page_and_frames_load(self, timeout_overwrite=None):
+            pass
+
+        async def _update_state(self, use_vision=False, focus_element=-1):
+            screenshot = await self.take_screenshot() if use_vision else None
+            self.current_state = BrowserState(element_tree=None, selector_map={}, url=FakePage.url, title="",
+                                              tabs=[], screenshot=screenshot)
+            return self.current_state
+
+    context = FakePageContext(browser=None)
+    page = FakePage()
+    context.session = SimpleNamespace(current_page=page, context=SimpleNamespace(pages=[page]), cached_state=None)
+    asyncio.run(context.get_state(use_vision=True))
+    timings = context.last_state_timings
+    assert not timings["cache_hit"] and timings["screenshot"] >= 0.02 and timings["dom"] < timings["screenshot"]
+    asyncio.run(context.get_state(use_vision=True))
+    assert context.last_state_timings == {"cache_hit": True}
+
+    controller = CustomController(look_action=True)
+    ActionModel = controller.registry.create_action_model()
+    asyncio.run(controller.act(ActionModel(look={}), browser_context=None))
+    [(name, start, seconds, error)] = controller.action_timings
+    assert name == "look" and seconds >= 0 and error is None
+
+
+if __name__ == "__main__":
+    test_spans_are_exported_and_summarized()
+    test_context_and_controller_time_their_phases()
@@ -0,0 +1,95 @@
+import json
+import sys
+
+sys.path.append(".")
+
+
+def agent_models():
+    from src.agent.custom_views import CustomAgentOutput
+    from src.controller.custom_controller import CustomController
+
+    ActionModel = CustomController().registry.create_action_model()
+    return ActionModel, CustomAgentOutput.type_with_custom_actions(ActionModel)
+
+
+def test_native_schema_per_provider():
+    from google.ai.generativelanguage_v1beta.types import GenerationConfig
+    from google.genai import types
+    from langchain_anthropic import ChatAnthropic
+    from langchain_ollama import ChatOllama
+    from langchain_openai import ChatOpenAI
+    from src.agent.structured_output import structured_output_kwargs, structured_output_method
+    from src.llm.gemini_llm import GeminiLLM
+    from src.utils.llm import DeepSeekR1ChatOllama
+
+    ActionModel, AgentOutput = agent_models()
+    openai = ChatOpenAI(model="gpt-4o", api_key="test")
+    assert structured_output_method(openai) == "json_schema"
+    schema = structured_output_kwargs(openai, "json_schema", AgentOutput)["response_format"]["json_schema"]["schema"]
+    actions = schema["$defs"].pop("ActionModel")["anyOf"]
+    for definition in schema["$defs"].values():
+        assert definition["additionalProperties"] is False
+        assert definition["required"] == list(definition["properties"])
+    assert "default" not in json.dumps(schema)
+    # one branch per action, so the model writes only the action it picks
+    assert len(actions) == len(ActionModel.model_fields)
+    for branch in actions:
+        assert branch["additionalProperties"] is False and len(branch["required"]) == 1
+        assert "null" not in json.dumps(branch["properties"])
+    payload = openai._get_request_payload([("user", "hi")], **structured_output_kwargs(openai, "json_schema", AgentOutput))
+    assert payload["response_format"]["json_schema"]["strict"]
+
+    compatible = ChatOpenAI(model="deepseek-chat", api_key="test", base_url="https://api.deepseek.com")
+    assert structured_output_method(compatible) is None
+    assert structured_output_method(compatible, "function_calling") == "function_calling"
+    assert structured_output_method(openai, None) is None
+
+    anthropic = ChatAnthropic(model="claude-3-5-sonnet-latest", api_key="test")
+    kwargs = structured_output_kwargs(anthropic, structured_output_method(anthropic), AgentOutput)
+    assert kwargs["tool_choice"] == {"type": "tool", "name": kwargs["tools"][0]["name"]}
+
+    gemini = GeminiLLM(api_key="test")
+    kwargs = structured_output_kwargs(gemini, structured_output_method(gemini), AgentOutput)
+    response_schema = types.Schema(**kwargs["response_schema"])
+    assert response_schema.property_ordering == ["current_state", "action"]
+    assert response_schema.properties["action"].items.properties["go_back"].nullable
+    langchain_gemini = structured_output_kwargs(None, "gemini", AgentOutput)["generation_config"]
+    assert GenerationConfig(**langchain_gemini).response_schema.properties["action"].type_.name == "ARRAY"
+
+    assert structured_output_method(ChatOllama(model="qwen2.5:7b")) == "ollama_format"
+    assert structured_output_method(DeepSeekR1ChatOllama(model="deepseek-r1:14b")) is None
+
+
+def test_response_parsing_and_stats():
+    from langchain_core.messages import AIMessage
+    from src.agent.structured_output import ParseStats, drop_null_actions, response_json
+
+    ActionModel, AgentOutput = agent_models()
+    state = {"prev_action_evaluation": "Success", "important_contents": "", "task_progress": "",
+             "future_plans": "", "thought": "", "summary": "click"}
+    strict_reply = {"current_state": state, "action": [
+        dict(dict.fromkeys(ActionModel.model_fields), click_element={"index": 3, "xpath": None}),
+    ]}
+    parsed_json, repaired = response_json(AIMessage(content=json.dumps(strict_reply)), "json_schema")
+    parsed = AgentOutput(**drop_null_actions(parsed_json))
+    assert not repaired
+    assert parsed.action[0].model_dump(exclude_unset=True) == {"click_element": {"index": 3, "xpath": None}}
+
+    tool_reply = AIMessage(content="", tool_calls=[{"name": "AgentOutput", "args": strict_reply, "id": "call_1"}])
+    assert response_json(tool_reply, "function_calling") == (strict_reply, False)
+    fenced = AIMessage(content="```json\n" + json.dumps(strict_reply)[:-1] + "\n```")
+    assert response_json(fenced, None) == (strict_reply, True)
+
+    stats = ParseStats()
+    stats.record("openai", "json_schema", 0.002, ok=True)
+    stats.record("openai", "json_schema", 0.004, ok=False)
+    stats.record("ollama", None, 0.001, ok=True, repaired=True)
+    summary = stats.stats()
+    assert summary["openai/json_schema"]["failure_rate"] == 0.5
+    assert summary["openai/json_schema"]["avg_parse_ms"] == 3.0
+    assert summary["ollama/repair"]["repaired"] == 1
+
+
+if __name__ == "__main__":
+    test_native_schema_per_provider()
+    test_response_parsing_and_stats()
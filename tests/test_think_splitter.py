@@ -0,0 +1,82 @@
+import asyncio
+import sys
+
+sys.path.append(".")
+
+
+def test_splitter_handles_tags_across_chunks():
+    from src.utils.llm import ThinkTagSplitter
+
+    splitter = ThinkTagSplitter(max_reasoning_chars=10)
+    chunks = ["<th", "ink>Let me ", "look at the page.</th", "ink>\n\n**JSON Response:**\n", '{"action"', ": []}"]
+    reasoning, answer = "", ""
+    for chunk in chunks:
+        reasoning_part, answer_part = splitter.feed(chunk)
+        reasoning += reasoning_part
+        answer += answer_part
+    # the JSON is handed over before the stream ends
+    assert answer == '\n{"action": []}'
+    reasoning_part, answer_part = splitter.finish()
+    assert (reasoning + reasoning_part, answer + answer_part) == ("Let me loo", '\n{"action": []}')
+    assert splitter.reasoning_truncated
+    assert splitter.reasoning_chars == len("Let me look at the page.")
+    assert splitter.token_counts() == {"reasoning_tokens": 4, "answer_tokens": 2}
+    assert splitter.token_counts(output_tokens=40) == {"reasoning_tokens": 4, "answer_tokens": 36}
+
+    untagged = ThinkTagSplitter()
+    assert untagged.feed('{"action": []}') == ("", '{"action": []}')
+    assert untagged.finish() == ("", "")
+    assert untagged.token_counts() == {"reasoning_tokens": 0, "answer_tokens": 1}
+
+
+def test_splitter_without_think_tag_keeps_the_whole_answer():
+    from src.utils.llm import ThinkTagSplitter
+
+    splitter = ThinkTagSplitter(0)
+    parts = [splitter.feed('{"a":'), splitter.feed(" 1}"), splitter.finish()]
+    assert "".join(reasoning for reasoning, _ in parts) == ""
+    assert "".join(answer for _, answer in parts) == '{"a": 1}'
+
+    unclosed = ThinkTagSplitter(3)
+    parts = [unclosed.feed("<think>"), unclosed.feed('{"a":'), unclosed.feed(" 1}")]
+    assert "".join(reasoning for reasoning, _ in parts) == '{"a'
+    assert unclosed.finish() == ("", '{"a": 1}')
+
+
+def test_deepseek_r1_ollama_streams_answer_only():
+    from src.utils.llm import DeepSeekR1ChatOllama
+
+    pieces = ["<think>", "Click", " the button", "</think>", '{"current_state": {}', ', "action": []}']
+
+    class RecordedOllama(DeepSeekR1ChatOllama):
+        def _responses(self):
+            for piece in pieces:
+                yield {"message": {"role": "assistant", "content": piece}, "done": False}
+            yield {"message": {"role": "assistant", "content": ""}, "done": True,
+                   "prompt_eval_count": 100, "eval_count": 12}
+
+        def _create_chat_stream(self, messages, stop=None, **kwargs):
+            yield from self._responses()
+
+        async def _acreate_chat_stream(self, messages, stop=None, **kwargs):
+            for response in self._responses():
+                yield response
+
+    llm = RecordedOllama(model="deepseek-r1:14b", reasoning_max_chars=None)
+
+    async def stream():
+        return [chunk.content async for chunk in llm.astream("hi")]
+
+    assert "".join(asyncio.run(stream())) == '{"current_state": {}, "action": []}'
+    message = asyncio.run(llm.ainvoke("hi"))
+    assert message.content == '{"current_state": {}, "action": []}'
+    assert message.reasoning_content == "Click the button"
+    assert message.usage_metadata["output_token_details"]["reasoning"] == 4
+    assert message.response_metadata["answer_tokens"] == 8
+    assert llm.invoke("hi").content == message.content
+
+
+if __name__ == "__main__":
+    test_splitter_handles_tags_across_chunks()
+    test_splitter_without_think_tag_keeps_the_whole_answer()
+    test_deepseek_r1_ollama_streams_answer_only()
@@ -0,0 +1,104 @@
+import base64
+import io
+import os
+import sys
+import tempfile
+
+from PIL import Image
+
+sys.path.append(".")
+
+
+def make_data_url(width, height, image_format="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 255, 255)).save(buffer, image_format)
+    mime = "png" if image_format == "PNG" else "jpeg"
+    return f"data:image/{mime};base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def test_image_tokens_follow_screenshot_size():
+    from src.utils.token_counter import TokenCounter, image_size
+
+    assert image_size(make_data_url(1280, 800)) == (1280, 800)
+    assert image_size(make_data_url(640, 480, "JPEG")) == (640, 480)
+    openai = TokenCounter("openai-o200k")
+    assert openai.count_image(make_data_url(1280, 800)) == 85 + 170 * 6
+    assert openai.count_image(make_data_url(512, 512)) == 85 + 170
+    assert TokenCounter("anthropic").count_image(make_data_url(1280, 800)) == 1366
+    assert TokenCounter("google").count_image(make_data_url(300, 300)) == 258
+    assert TokenCounter("generic").count_image("https://example.com/a.png", default=800) == 800
+
+
+def test_text_counts_are_memoized_and_offline():
+    from src.utils import token_counter
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tokenizer = Tokenizer(models.WordLevel({"hello": 0, "world": 1, "[UNK]": 2}, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        tokenizer.save(f"{tmp_dir}/qwen.json")
+        original_dir = token_counter.TOKENIZER_DIR
+        token_counter.TOKENIZER_DIR = tmp_dir
+        try:
+            counter = token_counter.TokenCounter("qwen")
+        finally:
+            token_counter.TOKENIZER_DIR = original_dir
+        assert counter.exact
+        assert counter.count_text("hello world again") == 3
+        assert counter.count_text("hello world again") == 3
+        assert counter.stats()["hits"] == 1 and counter.stats()["misses"] == 1
+
+    fallback = token_counter.TokenCounter("generic")
+    assert not fallback.exact
+    assert fallback.count_text("a" * 30) == 10
+    assert fallback.count_text("你好世界") == 4
+
+
+def test_tokenizer_family():
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_openai import ChatOpenAI
+    from src.utils.token_counter import tokenizer_family
+
+    assert tokenizer_family(ChatOpenAI(model="gpt-4o", api_key="test")) == "openai-o200k"
+    assert tokenizer_family(ChatOpenAI(model="deepseek-chat", api_key="test")) == "deepseek"
+    assert tokenizer_family(FakeListChatModel(responses=["x"])) == "generic"
+
+
+def test_openai_counts_fall_back_to_the_model_tokenizer():
+    from langchain_openai import ChatOpenAI
+    from src.utils import token_counter
+
+    class CountingChatOpenAI(ChatOpenAI):
+        def get_num_tokens(self, text):
+            if text == "offline":
+                raise ValueError("could not fetch the encoding")
+            return len(text.split())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_dir = token_counter.TOKENIZER_DIR
+        original_counters = dict(token_counter._counters)
+        original_cache = os.environ.get("TIKTOKEN_CACHE_DIR")
+        # neither a tokenizer file nor tiktoken's cache has the encoding
+        token_counter.TOKENIZER_DIR = os.environ["TIKTOKEN_CACHE_DIR"] = tmp_dir
+        token_counter._counters.clear()
+        try:
+            counter = token_counter.get_token_counter(CountingChatOpenAI(model="gpt-4-turbo", api_key="test"))
+        finally:
+            token_counter.TOKENIZER_DIR = original_dir
+            if original_cache is None:
+                os.environ.pop("TIKTOKEN_CACHE_DIR", None)
+            else:
+                os.environ["TIKTOKEN_CACHE_DIR"] = original_cache
+            token_counter._counters.clear()
+            token_counter._counters.update(original_counters)
+    assert counter.family == "openai-cl100k" and counter.exact
+    assert counter.count_text("one two three four five") == 5
+    # a tokenizer that cannot load falls back to the estimate for the rest of the run
+    assert counter.count_text("offline") == 1 and not counter.exact
+
+
+if __name__ == "__main__":
+    test_image_tokens_follow_screenshot_size()
+    test_text_counts_are_memoized_and_offline()
+    test_tokenizer_family()
+    test_openai_counts_fall_back_to_the_model_tokenizer()
@@ -0,0 +1,78 @@
+import asyncio
+import sys
+
+sys.path.append(".")
+
+
+def page_state(clickable=3, images=0, canvas=False):
+    from browser_use.browser.views import BrowserState
+    from browser_use.dom.views import DOMElementNode
+
+    body = DOMElementNode(is_visible=True, parent=None, tag_name="body", xpath="/body", attributes={}, children=[])
+    selector_map = {}
+    for i in range(clickable):
+        selector_map[i] = DOMElementNode(is_visible=True, parent=body, tag_name="a", xpath=f"/body/a[{i + 1}]",
+                                         attributes={}, children=[], highlight_index=i)
+    tags = ["img"] * images + (["canvas"] if canvas else [])
+    visuals = [DOMElementNode(is_visible=True, parent=body, tag_name=tag, xpath=f"/body/{tag}", attributes={},
+                              children=[]) for tag in tags]
+    body.children = list(selector_map.values()) + visuals
+    return BrowserState(element_tree=body, selector_map=selector_map, url="https://example.com", title="", tabs=[])
+
+
+def test_policy_triggers():
+    from browser_use.agent.views import ActionResult
+    from src.agent.vision_policy import VisionPolicy
+    from src.controller.custom_controller import CustomController
+
+    ActionModel = CustomController(look_action=True).registry.create_action_model()
+    policy = VisionPolicy(every_n_steps=5, few_elements=10)
+    ok = [ActionResult(extracted_content="clicked")]
+    assert policy.reason(page_state(), None, None, step=1) == "periodic"
+    assert policy.reason(page_state(), None, ok, step=2) is None
+    assert policy.reason(page_state(), None, [ActionResult(error="Element not found")], step=2) == "failed_action"
+    assert policy.reason(page_state(), [ActionModel(look={})], ok, step=2) == "look"
+    assert policy.reason(page_state(canvas=True), None, ok, step=2) == "visual_page"
+    assert policy.reason(page_state(clickable=2, images=4), None, ok, step=2) == "visual_page"
+    # an image gallery with plenty of links does not need a screenshot
+    assert policy.reason(page_state(clickable=30, images=40), None, ok, step=2) is None
+    assert policy.reason(page_state(), None, ok, step=6) == "periodic"
+
+
+def test_look_action_and_savings():
+    from src.agent.vision_policy import VisionPolicy
+    from src.controller.custom_controller import CustomController
+
+    assert "look" not in CustomController().registry.registry.actions
+    controller = CustomController(look_action=True)
+    ActionModel = controller.registry.create_action_model()
+    result = asyncio.run(controller.act(ActionModel(look={}), browser_context=None))
+    assert result.extracted_content == "Requested a screenshot of the page" and not result.error
+
+    policy = VisionPolicy(every_n_steps=0)
+    for reason in ("failed_action", None, None, "look", None):
+        policy.record(reason, seconds=0.25 if reason else 0.0, image_tokens=1000 if reason else 0)
+    stats = policy.stats()
+    assert stats["screenshots"] == 2 and stats["reasons"] == {"failed_action": 1, "look": 1}
+    assert stats["capture_seconds"] == 0.5
+    assert stats["image_tokens"] == 2000 and stats["image_tokens_saved"] == 3000
+
+
+def test_on_demand_agent_registers_look_on_the_default_controller():
+    from browser_use.controller.service import Controller
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.agent.custom_agent import CustomAgent
+    from src.controller.custom_controller import register_look_action
+
+    agent = CustomAgent(task="Find the price", llm=FakeListChatModel(responses=["{}"]), vision_mode="on_demand")
+    assert type(agent.controller) is Controller
+    assert "look" in agent.ActionModel.model_fields
+    register_look_action(agent.controller)
+    assert list(agent.controller.registry.registry.actions).count("look") == 1
+    assert "look" not in CustomAgent(task="Find the price", llm=FakeListChatModel(responses=["{}"])).ActionModel.model_fields
+
+
+if __name__ == "__main__":
+    test_policy_triggers()
+    test_look_action_and_savings()
+    test_on_demand_agent_registers_look_on_the_default_controller()
@@ -34,6 +34,7 @@ from src.controller.custom_controller import CustomController
 from gradio.themes import Citrus, Default, Glass, Monochrome, Ocean, Origin, Soft, Base
 from src.utils.default_config_settings import default_config, load_config_from_file, save_config_to_file, save_current_config, update_ui_from_config
 from src.utils.utils import update_model_dropdown, get_latest_files, capture_screenshot
+from src.utils.llm_circuit_breaker import circuit_breakers
 
 
 # Global variables for persistence
@@ -396,7 +397,13 @@ async def run_custom_agent(
             agent_prompt_class=CustomAgentMessagePrompt,
             max_actions_per_step=max_actions_per_step,
             agent_state=_global_agent_state,
-            tool_calling_method=tool_calling_method
+            tool_calling_method=tool_calling_method,
+            small_llm=utils.get_small_llm_model(),
+            prompt_cache=os.getenv("AGENT_PROMPT_CACHE", "false").lower() == "true",
+            dom_diff=os.getenv("AGENT_DOM_DIFF", "false").lower() == "true",
+            vision_pipeline=os.getenv("AGENT_VISION_PIPELINE", "false").lower() == "true",
+            vision_mode=os.getenv("AGENT_VISION_MODE", "always"),
+            checkpoint=os.getenv("AGENT_CHECKPOINT", "false").lower() == "true",
         )
         history = await agent.run(max_steps=max_steps)
 
@@ -756,6 +763,17 @@ def create_ui(config, theme_name="Ocean"):
                             value=config['llm_api_key'],
                             info="Your API key (leave blank to use .env)"
                         )
+                with gr.Group():
+                    circuit_breaker_state = gr.JSON(
+                        label="Circuit Breakers",
+                        value=circuit_breakers.snapshot,
+                    )
+                    refresh_breakers_button = gr.Button("🔄 Refresh Circuit Breakers", variant="secondary")
+                    refresh_breakers_button.click(
+                        fn=circuit_breakers.snapshot,
+                        inputs=[],
+                        outputs=circuit_breaker_state
+                    )
 
             with gr.TabItem("🌐 Browser Settings", id=3):
                 with gr.Group():